@@ -12,21 +12,35 @@ Data Flow:
 6. Server returns optimized stops, geometry, and stats to client.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import json
 import logging
-import requests
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import config
-from route_optimizer import RouteOptimizer
+import metrics
+from metrics import timed
+from osrm_client import get_client
+from table_cache import get_table_cache
+from route_cache import get_route_cache
+from elevation import get_elevation_service
+from geometry import GEOMETRY_FORMATS, format_route_geometry
+from jobs import JobQueueFull, get_job_manager
+from route_optimizer import RouteOptimizer, optimize_route_worker
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=config.LOG_LEVEL,
     format='%(asctime)s [%(levelname)s] %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
 app = Flask(__name__)
+app.config.from_object(config)
 CORS(app)
 
 try:
@@ -38,55 +52,468 @@ except Exception as e:
 
 
 def print_stops(label, stops):
-    """Nicely print a list of stops with coordinates."""
-    logging.info("=" * 60)
-    logging.info(f"{label}")
-    logging.info("=" * 60)
+    """
+    Nicely print a list of stops with coordinates.
+    Per-stop dumps are DEBUG only; nothing is formatted at higher log levels.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    lines = ["=" * 60, f"{label}", "=" * 60]
     for i, s in enumerate(stops):
-        loc = s.get("location", "No Name")
         coords = s.get("coords", {})
         lat = coords.get("lat")
         lng = coords.get("lng")
-        logging.info(f"{i+1}. {loc}  |  lat: {lat}, lng: {lng}")
-    logging.info("=" * 60)
+        lines.append(f"{i+1}. {stop_label(s)}  |  lat: {lat}, lng: {lng}")
+    lines.append("=" * 60)
+    logging.debug("\n".join(lines))
+
+
+def stop_label(stop):
+    """A stop's 'location' as a printable string."""
+    loc = stop.get("location", "No Name")
+    if isinstance(loc, list) and len(loc) == 2:
+        return f"Lat {loc[1]:.6f}, Lng {loc[0]:.6f}"
+    if not isinstance(loc, str):
+        return "Unknown Location"
+    return loc
+
+
+def log_summary(endpoint, **fields):
+    """Logs a request as one key=value line at INFO, e.g. 'optimize_route stops=12 ... ms=84.2'."""
+    logging.info(f"{endpoint} " + " ".join(f"{key}={value}" for key, value in fields.items()))
+
+
+def parse_time_budget(payload):
+    """
+    Reads the optional 'timeBudgetMs' field.
+    Returns the budget (or None) and raises ValueError with a client-facing message if invalid.
+    """
+    time_budget_ms = payload.get("timeBudgetMs")
+    if time_budget_ms is None:
+        return None
+    try:
+        time_budget_ms = int(time_budget_ms)
+    except (ValueError, TypeError):
+        raise ValueError("'timeBudgetMs' must be an integer number of milliseconds.")
+    if time_budget_ms < 0:
+        raise ValueError("'timeBudgetMs' must not be negative.")
+    return time_budget_ms
+
+
+def parse_clock(value, departure_seconds):
+    """
+    Converts a time given as seconds after departure (number) or as a clock
+    time "HH:MM[:SS]" (needs departure_seconds) into seconds after departure.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        if departure_seconds is None:
+            raise ValueError("Clock times need a 'departureTime' in the payload.")
+        parts = value.split(":")
+        if 2 <= len(parts) <= 3 and all(p.isdigit() for p in parts):
+            h, m, sec = (int(p) for p in parts + ["0"] * (3 - len(parts)))
+            return h * 3600 + m * 60 + sec - departure_seconds
+    raise ValueError(f"Invalid time {value!r}; use seconds after departure or \"HH:MM\".")
+
+
+def parse_time_constraints(payload, stops):
+    """
+    Reads per-stop 'timeWindow' ([earliest, latest]) and 'serviceTime' (seconds)
+    fields. Returns (time_windows, service_times), both None when no stop has either.
+    Raises ValueError with a client-facing message if invalid.
+    """
+    if not any("timeWindow" in s or "serviceTime" in s for s in stops):
+        return None, None
+
+    departure = payload.get("departureTime")
+    departure_seconds = parse_clock(departure, 0) if departure is not None else None
+
+    time_windows, service_times = [], []
+    for i, s in enumerate(stops):
+        window = s.get("timeWindow")
+        if window is not None:
+            if not isinstance(window, list) or len(window) != 2:
+                raise ValueError(f"Stop at index {i}: 'timeWindow' must be [earliest, latest].")
+            earliest, latest = (parse_clock(t, departure_seconds) for t in window)
+            if latest < max(earliest, 0):
+                raise ValueError(f"Stop at index {i}: 'timeWindow' closes before it opens or before departure.")
+            window = (max(earliest, 0), latest)
+        time_windows.append(window)
+
+        service = s.get("serviceTime", 0)
+        if not isinstance(service, (int, float)) or isinstance(service, bool) or service < 0:
+            raise ValueError(f"Stop at index {i}: 'serviceTime' must be a non-negative number of seconds.")
+        service_times.append(service)
+    return time_windows, service_times
+
+
+def fetch_table(stops):
+    """
+    Gets the OSRM distance/duration matrix for the stops (only pairs not already
+    cached are requested) with each source named after its stop for logging.
+    """
+    return name_sources(get_table_cache().table(get_client(), stops), stops)
+
+
+def fetch_route(stops):
+    """Gets the OSRM route (polyline6 geometry) through the stops in order, from the geometry cache when possible."""
+    return get_route_cache().route(get_client(), stops)
+
 
+_route_fetcher = None
+_route_fetcher_pid = None
+_route_fetcher_lock = threading.Lock()
 
-def normalize_stops_for_printing(stops):
-    """Ensure every stop has a string 'location' for printing."""
-    normalized = []
-    for s in stops:
-        stop_copy = s.copy()
-        loc = s.get("location")
-        if isinstance(loc, list) and len(loc) == 2:
-            stop_copy["location"] = f"Lat {loc[1]:.6f}, Lng {loc[0]:.6f}"
-        elif not isinstance(loc, str):
-            stop_copy["location"] = "Unknown Location"
-        normalized.append(stop_copy)
-    return normalized
+
+def start_route_fetch(stops):
+    """
+    Starts fetch_route(stops) on this worker's route fetch threads and returns its
+    Future, so the OSRM round trip overlaps whatever the request does next.
+    """
+    global _route_fetcher, _route_fetcher_pid
+    if _route_fetcher is None or _route_fetcher_pid != os.getpid():
+        with _route_fetcher_lock:
+            if _route_fetcher is None or _route_fetcher_pid != os.getpid():
+                _route_fetcher = ThreadPoolExecutor(
+                    max_workers=config.ROUTE_FETCH_WORKERS, thread_name_prefix="route-fetch"
+                )
+                _route_fetcher_pid = os.getpid()
+    return _route_fetcher.submit(fetch_route, stops)
+
+
+def name_sources(table_data, stops):
+    """Names each source of an OSRM Table response after its stop and returns the response."""
+    # Inject original location names into the OSRM response so the optimizer prints them
+    # (Matches logic in calculate_sample_savings.py)
+    if table_data and 'sources' in table_data:
+        for i, source in enumerate(table_data['sources']):
+            # OSRM sources correspond to the input coordinates order
+            if i < len(stops):
+                source['name'] = stops[i].get('location', 'Unknown')
+    return table_data
+
+
+def stop_elevations(stops):
+    """
+    Returns the elevation (m) of each stop: its 'elevation' field if given, else
+    a lookup in the local DEM tiles, else 0. None if neither source knows any stop.
+    """
+    missing = [i for i, s in enumerate(stops) if "elevation" not in s]
+    looked_up = get_elevation_service().elevations(
+        [stops[i]["coords"]["lat"] for i in missing], [stops[i]["coords"]["lng"] for i in missing]
+    )
+    if len(missing) == len(stops) and np.isnan(looked_up).all():
+        return None
+
+    elevations = [s.get("elevation", 0) for s in stops]
+    for i, elevation in zip(missing, looked_up):
+        elevations[i] = 0 if np.isnan(elevation) else float(elevation)
+    return elevations
+
+
+def has_numeric_coords(stop):
+    """True if the stop is a dict whose coords has numeric (or numeric string) lat and lng."""
+    coords = stop.get("coords") if isinstance(stop, dict) else None
+    if not isinstance(coords, dict):
+        return False
+    try:
+        return all(
+            not isinstance(coords[key], bool) and np.isfinite(float(coords[key])) for key in ("lat", "lng")
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
 
 
-def format_table_url(stops):
+def match_previous_tour(stops, previous_tour):
     """
-    Build OSRM table API URL for a list of stops.
-    The Table API returns a square matrix of travel times/distances between all pairs of coordinates.
+    Maps a previously optimized stop list onto indices of the current stops by
+    rounded coordinates. Stops that were removed since are skipped; stops that
+    are new are simply absent and get inserted by the optimizer.
     """
-    coords_list = []
-    for s in stops:
-        c = s.get("coords")
-        if c is None or "lat" not in c or "lng" not in c:
-            raise ValueError("All stops must include coords with lat and lng.")
-        coords_list.append(f"{c['lng']},{c['lat']}")
-    return f"{config.OSRM_HOST}/table/v1/driving/{';'.join(coords_list)}?annotations=distance,duration"
+    cache = get_table_cache()
+    index_by_key = {}
+    for i, s in enumerate(stops):
+        index_by_key.setdefault(cache.key(s), i)
+    route = []
+    for s in previous_tour:
+        i = index_by_key.get(cache.key(s))
+        if i is not None:
+            route.append(i)
+    return route
+
+
+class RequestError(Exception):
+    """A request that can't be served; carries the HTTP status and JSON body to return."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": message, **extra}
 
 
-def format_route_url(stops):
+def parse_route_request(payload):
     """
-    Build OSRM route API URL for ordered stops with GeoJSON overview.
-    The Route API returns the actual path geometry (waypoints) to draw on the map.
+    Validates an /optimize_route payload and returns the solve parameters.
+    Raises RequestError (400) with a client-facing message if invalid.
     """
-    coords_list = [f"{s['coords']['lng']},{s['coords']['lat']}" for s in stops]
-    return f"{config.OSRM_HOST}/route/v1/driving/{';'.join(coords_list)}?overview=full&geometries=geojson&steps=false"
+    if not payload:
+        raise RequestError("No JSON payload provided.")
+    if not isinstance(payload, dict):
+        raise RequestError("Payload must be a JSON object.")
 
+    stops = payload.get("stops")
+    if not isinstance(stops, list) or len(stops) < 2:
+        raise RequestError("Payload must include a 'stops' list with at least 2 stops.")
+
+    maintain_order = bool(payload.get("maintainOrder", False))
+
+    solver = payload.get("solver")
+    if solver is not None and solver not in RouteOptimizer.SOLVER_BACKENDS:
+        raise RequestError(f"'solver' must be one of {list(RouteOptimizer.SOLVER_BACKENDS)}.")
+
+    objective = payload.get("objective", "distance")
+    if objective not in RouteOptimizer.OBJECTIVES:
+        raise RequestError(f"'objective' must be one of {list(RouteOptimizer.OBJECTIVES)}.")
+
+    previous_tour = payload.get("previousTour")
+    if previous_tour is not None:
+        if not isinstance(previous_tour, list) or not all(has_numeric_coords(s) for s in previous_tour):
+            raise RequestError("'previousTour' must be a list of stops with coords.lat/coords.lng.")
+
+    try:
+        time_budget_ms = parse_time_budget(payload)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+    # Validate coords (numeric, so the OSRM URL, cache keys and elevation lookups can't fail on them)
+    for i, s in enumerate(stops):
+        if not has_numeric_coords(s):
+            raise RequestError(f"Stop at index {i} must have numeric coords.lat/coords.lng.")
+
+    try:
+        time_windows, service_times = parse_time_constraints(payload, stops)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+    # Energy objective inputs: stop elevation (m) and the load (kg) carried out of each stop
+    elevations = loads = None
+    if objective == "energy":
+        for field in ("elevation", "demand"):
+            values = [s.get(field, 0) for s in stops]
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                raise RequestError(f"Stop '{field}' must be a number.")
+        elevations = stop_elevations(stops)
+        if any("demand" in s for s in stops):
+            loads = [s.get("demand", 0) for s in stops]
+
+    try:
+        mpg = float(payload.get("currentFuel", 20.0))
+    except (ValueError, TypeError):
+        raise RequestError("'currentFuel' must be a number.")
+
+    geometry = parse_geometry_options(payload)
+
+    return {
+        "stops": stops,
+        "maintain_order": maintain_order,
+        "mpg": mpg,
+        "previous_tour": previous_tour,
+        "geometry": geometry,
+        "optimize_args": {
+            "solver": solver,
+            "time_budget_ms": time_budget_ms,
+            "time_windows": time_windows,
+            "service_times": service_times,
+            "objective": objective,
+            "elevations": elevations,
+            "loads": loads,
+        },
+    }
+
+
+def parse_geometry_options(payload):
+    """
+    Reads geometryFormat / geometryTolerance (meters) / geometryZoom into
+    format_route_geometry's keyword arguments. Raises RequestError (400) if invalid.
+    """
+    geometry_format = payload.get("geometryFormat", "geojson")
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise RequestError(f"'geometryFormat' must be one of {list(GEOMETRY_FORMATS)}.")
+
+    options = {"geometry_format": geometry_format}
+    tolerance = payload.get("geometryTolerance")
+    if tolerance is not None:
+        if not isinstance(tolerance, (int, float)) or isinstance(tolerance, bool) or tolerance < 0:
+            raise RequestError("'geometryTolerance' must be a non-negative number of meters.")
+        options["tolerance_m"] = float(tolerance)
+    zoom = payload.get("geometryZoom")
+    if zoom is not None:
+        if not isinstance(zoom, (int, float)) or isinstance(zoom, bool) or not 0 <= zoom <= 22:
+            raise RequestError("'geometryZoom' must be a map zoom level between 0 and 22.")
+        options["zoom"] = zoom
+    return options
+
+
+def solve_route_request(params, optimize=None, timings=None):
+    """
+    Runs a parsed /optimize_route request: OSRM table, optimizer, OSRM route.
+    The route is requested as soon as the stop order is known (right away with
+    maintainOrder) and fetched while the optimizer and this function finish up.
+    optimize defaults to optimizer.optimize_route; any callable with the same
+    signature (e.g. one running it in another process) can be passed instead.
+    Milliseconds per stage (the server's and the optimizer's) are added to
+    timings, if given, and recorded in the stage metrics.
+    Returns the response body; raises RequestError (422) when no route is feasible.
+    """
+    stops = params["stops"]
+    optimize_args = params["optimize_args"]
+    if optimize is None:
+        optimize = optimizer.optimize_route
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+
+    solve_info = {}
+    route_future = None
+    if params["maintain_order"]:
+        # --- Call OSRM Route API right away: no table or solve needed ---
+        ordered_stops = stops
+        route_future = start_route_fetch(stops)
+
+    # --- PRINT ORIGINAL STOPS ---
+    print_stops("ORIGINAL STOP ORDER", stops)
+
+    if not params["maintain_order"]:
+        # --- Call OSRM Table API (only for pairs not already cached) ---
+        with timed(timings, "osrm_table"):
+            table_data = fetch_table(stops)
+
+        # --- Call RouteOptimizer ---
+        previous_tour = params["previous_tour"]
+        previous_route = match_previous_tour(stops, previous_tour) if previous_tour else None
+
+        def on_route(route_indices):
+            # --- Call OSRM Route API as soon as the tour is known ---
+            nonlocal route_future
+            route_future = start_route_fetch([stops[i] for i in route_indices])
+
+        with timed(timings, "optimize"):
+            reordered = optimize(
+                table_data, params["mpg"], solve_info=solve_info, previous_route=previous_route,
+                on_route=on_route, **optimize_args
+            )
+        timings.update(solve_info.pop("timings", {}))
+        metrics.observe_solve(solve_info, objective=optimize_args["objective"])
+        if reordered is None and optimize_args["time_windows"] is not None:
+            raise RequestError("No route satisfies the stop time windows.", 422, solverInfo=solve_info)
+
+        ordered_stops = order_stops(stops, reordered)
+
+    # --- PRINT OPTIMIZED STOPS ---
+    print_stops("OPTIMIZED STOP ORDER", ordered_stops)
+
+    # --- Wait for the OSRM route (or fetch it now if the optimizer didn't report its tour) ---
+    with timed(timings, "osrm_route"):
+        route_data = route_future.result() if route_future is not None else fetch_route(ordered_stops)
+    with timed(timings, "geometry"):
+        body = build_route_response(ordered_stops, route_data, solve_info, params["geometry"])
+    metrics.observe_stages(timings)
+    log_route_summary(params, body, (time.perf_counter() - start) * 1000)
+    return body
+
+
+def log_route_summary(params, body, elapsed_ms):
+    """The one INFO line logged per /optimize_route request."""
+    solver_info = body.get("solverInfo", {})
+    log_summary(
+        "optimize_route",
+        stops=len(params["stops"]),
+        maintainOrder=params["maintain_order"],
+        objective=params["optimize_args"]["objective"],
+        backend=solver_info.get("backend", "none"),
+        cacheHit=solver_info.get("cacheHit", False),
+        cost=solver_info.get("objective"),
+        distance=round(body["distance"] or 0),
+        duration=round(body["duration"] or 0),
+        ms=round(elapsed_ms, 1),
+    )
+
+
+def order_stops(stops, reordered):
+    """Maps the optimizer output onto the request's stops (falling back to the original order)."""
+    # --- PRINT RAW OPTIMIZER OUTPUT ---
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"=== OPTIMIZER RAW OUTPUT ===\n{reordered}\n============================")
+
+    # --- Map optimizer output ---
+    ordered_stops = []
+    if isinstance(reordered, list):
+        # If elements are dicts with coords, use them directly
+        if len(reordered) > 0 and isinstance(reordered[0], dict) and "coords" in reordered[0]:
+            ordered_stops = reordered
+        # If elements are ints, treat as indices
+        elif all(isinstance(x, int) for x in reordered):
+            ordered_stops = [stops[i] for i in reordered]
+        # If elements are strings representing indices
+        else:
+            try:
+                idxs = [int(x) for x in reordered]
+                ordered_stops = [stops[i] for i in idxs]
+            except Exception:
+                logging.warning("Could not parse optimizer output. Printing original stops as fallback.")
+                ordered_stops = stops
+    else:
+        logging.warning("Optimizer output not a list. Printing original stops as fallback.")
+        ordered_stops = stops
+    return ordered_stops
+
+
+def build_route_response(ordered_stops, route_data, solve_info, geometry=None):
+    """
+    Builds the /optimize_route response body from the ordered stops and the OSRM Route response.
+    geometry holds format_route_geometry's options (default: full-resolution [lat, lng] list).
+    """
+    geometry = geometry or {}
+    route_geometry = format_route_geometry(route_data["routes"][0]["geometry"], **geometry)
+
+    distance = route_data["routes"][0].get("distance")
+    duration = route_data["routes"][0].get("duration")
+
+    response = {
+        "optimizedStops": ordered_stops,
+        "routeGeometry": route_geometry,
+        "distance": distance,
+        "duration": duration
+    }
+    if geometry.get("geometry_format", "geojson") != "geojson":
+        response["geometryFormat"] = geometry["geometry_format"]
+    if "arrivalTimes" in solve_info:
+        response["arrivalTimes"] = solve_info.pop("arrivalTimes")
+    if solve_info:
+        response["solverInfo"] = solve_info
+    return response
+
+
+def wants_timings():
+    """True if the request asked for per-stage timings in the response (DEBUG_TIMINGS_HEADER)."""
+    return bool(request.headers.get(config.DEBUG_TIMINGS_HEADER))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the request's latency and status, then publishes this worker's metrics for /metrics."""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if endpoint != "/metrics" and "request_start" in g:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+        metrics.REQUESTS_TOTAL.inc(endpoint=endpoint, status=response.status_code)
+        metrics.REGISTRY.publish()
+    return response
 
 
 @app.route("/health", methods=["GET"])
@@ -95,6 +522,12 @@ def health_check():
     return jsonify({"status": "ok"}), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus scrape endpoint: request/stage latency histograms, cache and solver metrics of all workers."""
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route("/optimize_route", methods=["POST"])
 def optimize_route():
     """
@@ -107,111 +540,411 @@ def optimize_route():
             ...
         ],
         "maintainOrder": boolean,  # If true, skips optimization
-        "currentFuel": float       # MPG for cost calculation
+        "currentFuel": float,      # MPG for cost calculation
+        "solver": string,          # Optional: "ortools", "local_search" or "portfolio" (default from config)
+        "timeBudgetMs": int,       # Optional: search time budget, capped by SOLVER_TIME_LIMIT
+        "previousTour": [...],     # Optional: last optimizedStops; warm-starts the solver
+        "departureTime": "HH:MM",  # Optional: needed when time windows are clock times
+        "objective": string,       # Optional: "distance" (default) or "energy" (truck work)
+        "geometryFormat": string,  # Optional: "geojson" (default), "polyline" or "polyline6"
+        "geometryTolerance": float, # Optional: simplify routeGeometry to this many meters (Douglas-Peucker)
+        "geometryZoom": float      # Optional: simplify routeGeometry to what is visible at this map zoom
     }
+    With the DEBUG_TIMINGS_HEADER header (X-Debug-Timings: 1) set, the response
+    also has "timings": milliseconds per stage (parse, osrm_table, optimize and
+    the optimizer's matrix_build/model_build/search/extraction/cost_analysis, osrm_route,
+    geometry).
+    Stops may also carry "timeWindow": [earliest, latest] (seconds after departure,
+    or "HH:MM" clock times) and "serviceTime" (seconds spent at the stop), and for
+    the energy objective "elevation" (meters; looked up in ELEVATION_DEM_DIR tiles
+    if omitted) and "demand" (kg loaded at the stop). Demand only sets the truck's
+    load for the energy objective here; capacity is enforced by /optimize_fleet.
 
     Returns:
     {
         "optimizedStops": [...],   # Reordered list of stops
-        "routeGeometry": [[lat, lng], ...], # Polyline points for map
+        "routeGeometry": [[lat, lng], ...], # Polyline points for map (an encoded string for polyline formats)
+        "geometryFormat": string,  # Echoed when not "geojson"
         "distance": float,         # Total distance in meters
-        "duration": float          # Total duration in seconds
+        "duration": float,         # Total duration in seconds
+        "arrivalTimes": [...],     # Seconds after departure at each stop (only with time windows)
+        "solverInfo": {...}        # Strategy, objective and time used (only when optimized)
     }
     """
     if optimizer is None:
         return jsonify({"error": "Optimizer is not initialized. Check server logs."}), 500
 
-    payload = request.get_json()
-    if not payload:
-        return jsonify({"error": "No JSON payload provided."}), 400
+    try:
+        timings = {}
+        with timed(timings, "parse"):
+            params = parse_route_request(request.get_json(silent=True))
+        body = solve_route_request(params, timings=timings)
+        if wants_timings():
+            body["timings"] = timings
+
+        serialize = {}
+        with timed(serialize, "serialize"):
+            response = jsonify(body)
+        metrics.observe_stages(serialize)
+        return response
+
+    except RequestError as e:
+        return jsonify(e.body), e.status
+    except Exception as e:
+        logging.error(f"Exception in /optimize_route: {e}")
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
-    stops = payload.get("stops")
-    if not isinstance(stops, list) or len(stops) < 2:
-        return jsonify({"error": "Payload must include a 'stops' list with at least 2 stops."}), 400
 
-    maintain_order = bool(payload.get("maintainOrder", False))
+def optimize_in_job_process(api_response, mpg, solve_info=None, progress=None, **kwargs):
+    """
+    Drop-in for optimizer.optimize_route that runs the solve in the job manager's
+    process pool, so a long search never holds this worker's GIL. Improving
+    tours are put on the progress queue, if one is given. on_route can't cross
+    into the solver process, so it is called once the result is back.
+    """
+    on_route = kwargs.pop("on_route", None)
+    optimizer_config = {key: app.config[key] for key in dir(config) if key.isupper()}
+    route_indices, worker_info = get_job_manager().run_in_process(
+        optimize_route_worker, optimizer_config, api_response, mpg, kwargs, progress
+    )
+    if solve_info is not None:
+        solve_info.update(worker_info)
+    if on_route is not None and route_indices:
+        on_route(route_indices)
+    return route_indices
+
+
+def run_route_job(params):
+    """Body of a /jobs/optimize job: returns (response body, HTTP status)."""
+    try:
+        return solve_route_request(params, optimize=optimize_in_job_process), 200
+    except RequestError as e:
+        return e.body, e.status
 
-    # Validate coords
-    for i, s in enumerate(stops):
-        c = s.get("coords")
-        if not c or "lat" not in c or "lng" not in c:
-            return jsonify({"error": f"Stop at index {i} is missing coords.lat/coords.lng."}), 400
 
-    try:
-        # --- PRINT ORIGINAL STOPS ---
-        print_stops("ORIGINAL STOP ORDER", normalize_stops_for_printing(stops))
+def server_sent_event(event, data):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-        if maintain_order:
-            ordered_stops = stops
+def stream_route_events(params):
+    """
+    Starts solving a parsed /optimize_route request and returns a generator of
+    Server-Sent Events: a "solution" event per improving tour while the solver
+    runs, then one "result" event with the full /optimize_route response (or an
+    "error" event). The solve holds one of this worker's job slots until it
+    finishes, even if the client goes away; raises JobQueueFull if none is free.
+    """
+    manager = get_job_manager()
+    manager.reserve()
+    try:
+        progress = manager.progress_queue()
+    except Exception:
+        manager.release()
+        raise
+    outcome = {}
+
+    def optimize(api_response, mpg, solve_info=None, **kwargs):
+        return optimize_in_job_process(api_response, mpg, solve_info=solve_info, progress=progress, **kwargs)
+
+    def run():
+        try:
+            outcome["body"], outcome["status"] = solve_route_request(params, optimize=optimize), 200
+        except RequestError as e:
+            outcome["body"], outcome["status"] = e.body, e.status
+        except Exception as e:
+            logging.error(f"Exception in /optimize_route/stream: {e}")
+            outcome["body"], outcome["status"] = {"error": "Internal server error", "details": str(e)}, 500
+        finally:
+            # The solve is over: free the slot before the client sees the final event
+            manager.release()
+            progress.put(None)
+
+    def events():
+        while True:
+            update = progress.get()
+            if update is None:
+                break
+            yield server_sent_event("solution", update)
+
+        if outcome["status"] < 400:
+            yield server_sent_event("result", outcome["body"])
         else:
-            # --- Call OSRM Table API ---
-            table_url = format_table_url(stops)
-            table_resp = requests.get(table_url, timeout=10)
-            table_data = table_resp.json()
-
-            # Inject original location names into the OSRM response so the optimizer prints them
-            # (Matches logic in calculate_sample_savings.py)
-            if table_data and 'sources' in table_data:
-                for i, source in enumerate(table_data['sources']):
-                    # OSRM sources correspond to the input coordinates order
-                    if i < len(stops):
-                        source['name'] = stops[i].get('location', 'Unknown')
-
-            # --- Call RouteOptimizer ---
-            mpg_val = float(payload.get("currentFuel", 20.0))
-            reordered = optimizer.optimize_route(table_data, mpg_val)
-
-            # --- PRINT RAW OPTIMIZER OUTPUT ---
-            logging.info("=== OPTIMIZER RAW OUTPUT ===")
-            logging.info(reordered)
-            logging.info("============================")
-
-            # --- Map optimizer output ---
-            ordered_stops = []
-            if isinstance(reordered, list):
-                # If elements are dicts with coords, use them directly
-                if len(reordered) > 0 and isinstance(reordered[0], dict) and "coords" in reordered[0]:
-                    ordered_stops = reordered
-                # If elements are ints, treat as indices
-                elif all(isinstance(x, int) for x in reordered):
-                    ordered_stops = [stops[i] for i in reordered]
-                # If elements are strings representing indices
-                else:
-                    try:
-                        idxs = [int(x) for x in reordered]
-                        ordered_stops = [stops[i] for i in idxs]
-                    except Exception:
-                        logging.warning("Could not parse optimizer output. Printing original stops as fallback.")
-                        ordered_stops = stops
-            else:
-                logging.warning("Optimizer output not a list. Printing original stops as fallback.")
-                ordered_stops = stops
+            yield server_sent_event("error", dict(outcome["body"], statusCode=outcome["status"]))
+
+    # OSRM calls and waiting on the solver process happen off the response thread
+    try:
+        threading.Thread(target=run, daemon=True).start()
+    except Exception:
+        manager.release()
+        raise
+    return events()
+
+
+@app.route("/optimize_route/stream", methods=["POST"])
+def optimize_route_stream():
+    """
+    Same payload as /optimize_route, answered as a text/event-stream:
 
+        event: solution
+        data: {"order": [0, 3, 1, 2, 0], "objective": 12345, "elapsedMs": 87.2}
+        (one per improving tour; "order" indexes the request's stops)
 
+        event: result
+        data: {...}   # The /optimize_route response, including routeGeometry
 
-        # --- PRINT OPTIMIZED STOPS ---
-        print_stops("OPTIMIZED STOP ORDER", normalize_stops_for_printing(ordered_stops))
+    or a final "error" event ({"error": ..., "statusCode": ...}). Invalid payloads
+    are rejected with a normal 400 JSON response before the stream starts, and
+    a 503 is returned if this worker's job queue (shared with /jobs/optimize) is full.
+    Routes solved exactly or served from the cache only get the result event.
+    """
+    if optimizer is None:
+        return jsonify({"error": "Optimizer is not initialized. Check server logs."}), 500
 
-        # --- Call OSRM Route API ---
-        route_url = format_route_url(ordered_stops)
-        route_resp = requests.get(route_url, timeout=10)
-        route_data = route_resp.json()
+    try:
+        params = parse_route_request(request.get_json(silent=True))
+        events = stream_route_events(params)
+    except RequestError as e:
+        return jsonify(e.body), e.status
+    except JobQueueFull as e:
+        logging.warning(f"Rejected stream: {e}")
+        return jsonify({"error": "Too many jobs in progress, retry later."}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logging.error(f"Exception in /optimize_route/stream: {e}")
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
-        geometry_coords = route_data["routes"][0]["geometry"]["coordinates"]
-        route_geometry_latlng = [[coord[1], coord[0]] for coord in geometry_coords]
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        distance = route_data["routes"][0].get("distance")
-        duration = route_data["routes"][0].get("duration")
 
-        return jsonify({
-            "optimizedStops": ordered_stops,
-            "routeGeometry": route_geometry_latlng,
-            "distance": distance,
-            "duration": duration
-        })
+@app.route("/jobs/optimize", methods=["POST"])
+def submit_optimize_job():
+    """
+    Queues an /optimize_route request (same payload) to run in the background.
+    Returns 202 {"jobId": ..., "status": "queued", "statusUrl": "/jobs/<jobId>"},
+    400 if the payload is invalid, or 503 if this worker's job queue is full.
+    """
+    if optimizer is None:
+        return jsonify({"error": "Optimizer is not initialized. Check server logs."}), 500
 
+    try:
+        params = parse_route_request(request.get_json(silent=True))
+        job_id = get_job_manager().submit(run_route_job, params)
+    except RequestError as e:
+        return jsonify(e.body), e.status
+    except JobQueueFull as e:
+        logging.warning(f"Rejected job: {e}")
+        return jsonify({"error": "Too many jobs in progress, retry later."}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logging.error(f"Exception in /optimize_route: {e}")
+        logging.error(f"Exception in /jobs/optimize: {e}")
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+    return jsonify({"jobId": job_id, "status": "queued", "statusUrl": f"/jobs/{job_id}"}), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Returns a job's record:
+    {
+        "jobId": str,
+        "status": "queued" | "running" | "done" | "failed",
+        "submittedAt", "startedAt", "finishedAt": float,  # Unix times, as they happen
+        "statusCode": int,         # When finished: the status /optimize_route would have returned
+        "result": {...}            # When finished: the /optimize_route response (or error) body
+    }
+    404 if the id is unknown or its result has expired (JOB_RESULT_TTL).
+    """
+    record = get_job_manager().get(job_id)
+    if record is None:
+        return jsonify({"error": "Unknown or expired job id."}), 404
+    return jsonify(record)
+
+
+@app.route("/optimize_fleet", methods=["POST"])
+def optimize_fleet():
+    """
+    Fleet-wide planning: assigns a shared stop list to several vehicles and
+    orders each vehicle's stops, in one solve over one OSRM matrix.
+
+    Expected JSON Payload:
+    {
+        "stops": [
+            {"location": "Address 1", "coords": {"lat": ..., "lng": ...}, "demand": kg},  # demand optional
+            # Stops may also carry "timeWindow" and "serviceTime", as in /optimize_route
+            ...
+        ],
+        "vehicles": int or [       # Vehicle count (all start/end at stop 0), or one entry per vehicle; at most one per stop
+            {"id": "BUS-001", "start": int, "end": int, "capacity": kg},  # start/end are indices into stops (default 0)
+            ...
+        ],
+        "unloadStop": int,         # Optional: stop index where vehicles can unload (and must, before ending)
+        "departureTime": "HH:MM",  # Optional: needed when time windows are clock times
+        "timeBudgetMs": int,       # Optional: search time budget, capped by SOLVER_TIME_LIMIT
+        "balanceCoefficient": int  # Optional: weight of the longest route vs. total distance
+    }
+
+    Returns:
+    {
+        "routes": [
+            {
+                "vehicle": "BUS-001",
+                "stops": [...],    # Ordered stops from start depot to end depot
+                "routeGeometry": [[lat, lng], ...],
+                "distance": float,
+                "duration": float,
+                "load": float,     # kg collected, when stops have a demand
+                "arrivalTimes": [...]  # Seconds after departure at each stop, when stops have time windows
+            },
+            ...
+        ],
+        "totalDistance": float,    # Meters, summed over all vehicles
+        "totalDuration": float,    # Seconds, summed over all vehicles
+        "solverInfo": {...}
+    }
+    """
+    if optimizer is None:
+        return jsonify({"error": "Optimizer is not initialized. Check server logs."}), 500
+
+    payload = request.get_json(silent=True)
+    if not payload:
+        return jsonify({"error": "No JSON payload provided."}), 400
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Payload must be a JSON object."}), 400
+
+    stops = payload.get("stops")
+    if not isinstance(stops, list) or len(stops) < 2:
+        return jsonify({"error": "Payload must include a 'stops' list with at least 2 stops."}), 400
+
+    for i, s in enumerate(stops):
+        if not has_numeric_coords(s):
+            return jsonify({"error": f"Stop at index {i} must have numeric coords.lat/coords.lng."}), 400
+
+    # A fleet larger than the stop list can't all be used; checked before the list is built
+    vehicles = payload.get("vehicles")
+    vehicle_count = len(vehicles) if isinstance(vehicles, list) else vehicles
+    if not isinstance(vehicle_count, int) or isinstance(vehicle_count, bool) or not 1 <= vehicle_count <= len(stops):
+        return jsonify({"error": f"'vehicles' must be a count or a list of vehicle objects, from 1 to {len(stops)} (the number of stops)."}), 400
+    if not isinstance(vehicles, list):
+        vehicles = [{} for _ in range(vehicles)]
+    if not all(isinstance(v, dict) for v in vehicles):
+        return jsonify({"error": "'vehicles' must be a count or a list of vehicle objects."}), 400
+
+    depots = []
+    for v, vehicle in enumerate(vehicles):
+        start, end = vehicle.get("start", 0), vehicle.get("end", vehicle.get("start", 0))
+        for idx in (start, end):
+            if not isinstance(idx, int) or isinstance(idx, bool) or not 0 <= idx < len(stops):
+                return jsonify({"error": f"Vehicle {v} start/end must be stop indices in [0, {len(stops) - 1}]."}), 400
+        depots.append((start, end))
+
+    try:
+        time_budget_ms = parse_time_budget(payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    balance_coefficient = payload.get("balanceCoefficient")
+    if balance_coefficient is not None:
+        if not isinstance(balance_coefficient, int) or isinstance(balance_coefficient, bool) or balance_coefficient < 0:
+            return jsonify({"error": "'balanceCoefficient' must be a non-negative integer."}), 400
+
+    # --- Capacity: enabled when any stop carries a demand ---
+    demands = capacities = unload_stop = None
+    if any("demand" in s for s in stops):
+        demands = [s.get("demand", 0) for s in stops]
+        if not all(isinstance(d, (int, float)) and not isinstance(d, bool) and d >= 0 for d in demands):
+            return jsonify({"error": "Stop 'demand' must be a non-negative number of kg."}), 400
+        capacities = [vehicle.get("capacity", config.VEHICLE_CAPACITY_KG) for vehicle in vehicles]
+        if not all(isinstance(c, (int, float)) and not isinstance(c, bool) and c > 0 for c in capacities):
+            return jsonify({"error": "Vehicle 'capacity' must be a positive number of kg."}), 400
+        unload_stop = payload.get("unloadStop")
+        if unload_stop is not None and (
+            not isinstance(unload_stop, int) or isinstance(unload_stop, bool) or not 0 <= unload_stop < len(stops)
+        ):
+            return jsonify({"error": f"'unloadStop' must be a stop index in [0, {len(stops) - 1}]."}), 400
+        # The solver ignores demand at depots (and at the unload stop), so the totals do too
+        loading_stops = [i for i in range(len(stops)) if i != unload_stop and all(i not in d for d in depots)]
+        if unload_stop is None and sum(demands[i] for i in loading_stops) > sum(capacities):
+            return jsonify({"error": "Total demand exceeds fleet capacity and no 'unloadStop' was given."}), 422
+
+    try:
+        time_windows, service_times = parse_time_constraints(payload, stops)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        print_stops("FLEET STOPS", stops)
+        timings = {}
+        with timed(timings, "osrm_table"):
+            table_data = fetch_table(stops)
+
+        solve_info = {}
+        routes = optimizer.optimize_fleet(
+            table_data, depots, time_budget_ms=time_budget_ms, solve_info=solve_info,
+            balance_coefficient=balance_coefficient,
+            demands=demands, capacities=capacities, unload_stop=unload_stop,
+            time_windows=time_windows, service_times=service_times,
+        )
+        timings.update(solve_info.pop("timings", {}))
+        metrics.observe_solve(solve_info, objective="fleet")
+        if routes is None:
+            return jsonify({"error": "No feasible fleet plan found.", "solverInfo": solve_info}), 422
+
+        arrival_times = solve_info.pop("arrivalTimes", None)
+        vehicle_routes = []
+        total_distance = 0.0
+        total_duration = 0.0
+        for v, route in enumerate(routes):
+            route_stops = [stops[i] for i in route]
+            vehicle_route = {
+                "vehicle": vehicles[v].get("id", v),
+                "stops": route_stops,
+                "routeGeometry": [],
+                "distance": 0.0,
+                "duration": 0.0,
+            }
+            if demands is not None:
+                vehicle_route["load"] = sum(demands[i] for i in set(route).intersection(loading_stops))
+            if arrival_times is not None:
+                vehicle_route["arrivalTimes"] = arrival_times[v]
+            # Unused vehicles that start and end at the same depot have nothing to draw
+            if len(route) > 2 or route[0] != route[-1]:
+                with timed(timings, "osrm_route"):
+                    route_data = fetch_route(route_stops)
+                vehicle_route["routeGeometry"] = format_route_geometry(route_data["routes"][0]["geometry"])
+                vehicle_route["distance"] = route_data["routes"][0].get("distance")
+                vehicle_route["duration"] = route_data["routes"][0].get("duration")
+            total_distance += vehicle_route["distance"] or 0.0
+            total_duration += vehicle_route["duration"] or 0.0
+            vehicle_routes.append(vehicle_route)
+
+        metrics.observe_stages(timings)
+        log_summary(
+            "optimize_fleet",
+            stops=len(stops),
+            vehicles=len(vehicle_routes),
+            backend=solve_info.get("backend"),
+            cost=solve_info.get("objective"),
+            distance=round(total_distance),
+            duration=round(total_duration),
+            ms=round((time.perf_counter() - g.request_start) * 1000, 1),
+        )
+        body = {
+            "routes": vehicle_routes,
+            "totalDistance": total_distance,
+            "totalDuration": total_duration,
+            "solverInfo": solve_info,
+        }
+        if wants_timings():
+            body["timings"] = timings
+        return jsonify(body)
+
+    except Exception as e:
+        logging.error(f"Exception in /optimize_fleet: {e}")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 
@@ -0,0 +1,175 @@
+"""
+ASGI Web Server
+Async variant of app.py for high-concurrency deployments, run with e.g.
+    uvicorn asgi_app:app --workers 4
+
+Serves the same /optimize_route contract, but each worker is a single event
+loop: OSRM Table/Route calls are awaited on a pooled async client (the blocks
+of a cache miss are fetched concurrently) and the OR-Tools solve runs in the
+job manager's process pool, so one worker keeps many requests in flight
+instead of blocking a thread per request. Other blocking work (request parsing,
+which may read DEM tiles, and table cache lookups) runs in threads. Solves take
+one of the worker's JOB_QUEUE_SIZE job slots, and get a 503 when none is free.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import config
+import metrics
+from app import (RequestError, build_route_response, log_route_summary, match_previous_tour, name_sources,
+                 order_stops, parse_route_request, print_stops)
+from jobs import JobQueueFull, get_job_manager
+from metrics import timed
+from osrm_async import AsyncOSRMClient
+from route_optimizer import optimize_route_worker
+from route_cache import get_route_cache
+from table_cache import get_table_cache
+
+# Passed to the solver processes, which build their own RouteOptimizer from it
+OPTIMIZER_CONFIG = {key: getattr(config, key) for key in dir(config) if key.isupper()}
+
+
+async def solve_route_request(client, params, timings):
+    """
+    Async counterpart of app.solve_route_request: OSRM table, optimizer (in a
+    solver process), OSRM route, with milliseconds per stage added to timings.
+    Returns the response body; raises RequestError (422) when no route is feasible,
+    or JobQueueFull if the worker's job slots are all taken.
+    """
+    stops = params["stops"]
+    optimize_args = params["optimize_args"]
+    start = time.perf_counter()
+
+    # --- PRINT ORIGINAL STOPS ---
+    print_stops("ORIGINAL STOP ORDER", stops)
+
+    solve_info = {}
+    if params["maintain_order"]:
+        ordered_stops = stops
+        # The route is already known: fetch it while the rest of the request is handled
+        route_task = asyncio.ensure_future(get_route_cache().route_async(client, ordered_stops))
+    else:
+        # The slot is taken before the OSRM fetch (no point fetching a table that can't be solved)
+        # and held until the solver process is done with it, even if the client goes away
+        manager = get_job_manager()
+        manager.reserve()
+        try:
+            # --- Call OSRM Table API (only for pairs not already cached) ---
+            with timed(timings, "osrm_table"):
+                table_data = name_sources(await get_table_cache().table_async(client, stops), stops)
+
+            # --- Call RouteOptimizer in the solver process pool ---
+            previous_tour = params["previous_tour"]
+            previous_route = match_previous_tour(stops, previous_tour) if previous_tour else None
+            kwargs = dict(optimize_args, previous_route=previous_route)
+            solve = manager.submit_to_process(
+                optimize_route_worker, OPTIMIZER_CONFIG, table_data, params["mpg"], kwargs
+            )
+        except BaseException:
+            manager.release()
+            raise
+        solve.add_done_callback(lambda _: manager.release())
+        with timed(timings, "optimize"):
+            reordered, worker_info = await asyncio.wrap_future(solve)
+        if reordered is None and optimize_args["time_windows"] is not None:
+            raise RequestError("No route satisfies the stop time windows.", 422, solverInfo=worker_info)
+
+        ordered_stops = order_stops(stops, reordered)
+        # Start the OSRM route fetch before finishing up the solver's results
+        route_task = asyncio.ensure_future(get_route_cache().route_async(client, ordered_stops))
+        solve_info.update(worker_info)
+        timings.update(solve_info.pop("timings", {}))
+        metrics.observe_solve(solve_info, objective=optimize_args["objective"])
+
+    # --- PRINT OPTIMIZED STOPS ---
+    print_stops("OPTIMIZED STOP ORDER", ordered_stops)
+
+    # --- Wait for the OSRM Route API ---
+    with timed(timings, "osrm_route"):
+        route_data = await route_task
+    with timed(timings, "geometry"):
+        body = build_route_response(ordered_stops, route_data, solve_info, params["geometry"])
+    metrics.observe_stages(timings)
+    log_route_summary(params, body, (time.perf_counter() - start) * 1000)
+    return body
+
+
+async def health_check(request):
+    """Lightweight endpoint to wake up the server."""
+    return JSONResponse({"status": "ok"})
+
+
+async def get_metrics(request):
+    """Prometheus scrape endpoint (see app.get_metrics)."""
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def optimize_route(request):
+    """Main optimization endpoint; same payload and response as app.optimize_route."""
+    start = time.perf_counter()
+    response = await handle_optimize_route(request)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/optimize_route")
+    metrics.REQUESTS_TOTAL.inc(endpoint="/optimize_route", status=response.status_code)
+    metrics.REGISTRY.publish()
+    return response
+
+
+async def handle_optimize_route(request):
+    """Runs an /optimize_route request and returns its JSONResponse, errors included."""
+    try:
+        timings = {}
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise RequestError("Request body must be valid JSON.")
+        with timed(timings, "parse"):
+            # Parsing can read DEM tiles for the energy objective
+            params = await asyncio.to_thread(parse_route_request, payload)
+        body = await solve_route_request(request.app.state.osrm, params, timings)
+        if request.headers.get(config.DEBUG_TIMINGS_HEADER):
+            body["timings"] = timings
+
+        serialize = {}
+        with timed(serialize, "serialize"):
+            response = JSONResponse(body)
+        metrics.observe_stages(serialize)
+        return response
+
+    except RequestError as e:
+        return JSONResponse(e.body, status_code=e.status)
+    except JobQueueFull as e:
+        logging.warning(f"Rejected /optimize_route: {e}")
+        return JSONResponse({"error": "Too many jobs in progress, retry later."}, status_code=503,
+                            headers={"Retry-After": "5"})
+    except Exception as e:
+        logging.error(f"Exception in /optimize_route: {e}")
+        return JSONResponse({"error": "Internal server error", "details": str(e)}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The client's connection pool belongs to this worker's event loop
+    app.state.osrm = AsyncOSRMClient()
+    try:
+        yield
+    finally:
+        await app.state.osrm.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health_check, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+        Route("/optimize_route", optimize_route, methods=["POST"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
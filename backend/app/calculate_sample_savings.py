@@ -1,5 +1,5 @@
-import requests
 import logging
+from osrm_client import OSRMClient
 from route_optimizer import RouteOptimizer
 import config
 
@@ -84,14 +84,9 @@ def get_osrm_matrix(stops, osrm_host):
     """
     Fetches the distance matrix from the OSRM server.
     """
-    coords_list = [f"{s['coords']['lng']},{s['coords']['lat']}" for s in stops]
-    osrm_url = f"{osrm_host}/table/v1/driving/{';'.join(coords_list)}?annotations=distance,duration"
-    
     print(f"Fetching distance matrix from: {osrm_host}...")
     try:
-        response = requests.get(osrm_url, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return OSRMClient(host=osrm_host).table(stops)
     except Exception as e:
         print(f"Error fetching from OSRM: {e}")
         return None
@@ -115,7 +110,7 @@ def main():
     stops = get_sample_stops()
     
     # 1. Get Distance Matrix
-    osrm_host = "http://100.30.34.94:5000"
+    osrm_host = config.OSRM_HOST
     table_data = get_osrm_matrix(stops, osrm_host)
     
     if not table_data:
@@ -8,4 +8,101 @@ import os
 # === SERVER SETTINGS ===
 FLASK_HOST = '0.0.0.0'
 FLASK_PORT = int(os.environ.get('PORT', 8000))
-OSRM_HOST = os.environ.get('OSRM_HOST', "http://127.0.0.1:5000")
\ No newline at end of file
+OSRM_HOST = os.environ.get('OSRM_HOST', "http://127.0.0.1:5000")
+# Root log level: INFO logs one summary line per request; DEBUG adds per-stop and per-route dumps
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# === OSRM CLIENT ===
+# Connections kept open per worker process to the OSRM host
+OSRM_POOL_SIZE = int(os.environ.get('OSRM_POOL_SIZE', 10))
+# (connect, read) timeouts in seconds for every OSRM call
+OSRM_CONNECT_TIMEOUT = float(os.environ.get('OSRM_CONNECT_TIMEOUT', 3.05))
+OSRM_READ_TIMEOUT = float(os.environ.get('OSRM_READ_TIMEOUT', 10))
+# Retries on connection errors and 502/503/504, with exponential backoff
+OSRM_RETRIES = int(os.environ.get('OSRM_RETRIES', 2))
+OSRM_BACKOFF_FACTOR = float(os.environ.get('OSRM_BACKOFF_FACTOR', 0.1))
+# Max concurrent OSRM connections per ASGI worker (asgi_app.py)
+OSRM_ASYNC_MAX_CONNECTIONS = int(os.environ.get('OSRM_ASYNC_MAX_CONNECTIONS', 100))
+# Threads per worker that fetch route geometry while the rest of the response is prepared
+ROUTE_FETCH_WORKERS = int(os.environ.get('ROUTE_FETCH_WORKERS', 4))
+# Max sources (and destinations) per OSRM Table request, as osrm-routed's --max-table-size;
+# bigger matrices are fetched in blocks, which also keeps each URL short
+OSRM_TABLE_MAX_SIZE = int(os.environ.get('OSRM_TABLE_MAX_SIZE', 100))
+# Table blocks fetched concurrently per request when a matrix is split into blocks
+OSRM_TABLE_CONCURRENCY = int(os.environ.get('OSRM_TABLE_CONCURRENCY', 4))
+
+# === OSRM TABLE CACHE ===
+# Max cached (origin, destination) pairs per worker; 0 disables the cache
+TABLE_CACHE_SIZE = int(os.environ.get('TABLE_CACHE_SIZE', 100000))
+# Seconds before a cached pair is re-fetched from OSRM
+TABLE_CACHE_TTL = float(os.environ.get('TABLE_CACHE_TTL', 24 * 3600))
+# Decimal places coordinates are rounded to for cache keys (5 ~= 1 m)
+TABLE_CACHE_PRECISION = int(os.environ.get('TABLE_CACHE_PRECISION', 5))
+# Optional JSON file the cache is loaded from at startup and saved to at exit
+TABLE_CACHE_PATH = os.environ.get('TABLE_CACHE_PATH')
+
+# === OSRM ROUTE GEOMETRY CACHE ===
+# Max cached route legs (stop -> next stop geometry, distance, duration) per worker; 0 disables the cache
+ROUTE_CACHE_LEGS = int(os.environ.get('ROUTE_CACHE_LEGS', 20000))
+# Max cached whole routes (ordered stop sequences) per worker
+ROUTE_CACHE_ROUTES = int(os.environ.get('ROUTE_CACHE_ROUTES', 1000))
+# Seconds before a cached leg or route is re-fetched from OSRM
+ROUTE_CACHE_TTL = float(os.environ.get('ROUTE_CACHE_TTL', 24 * 3600))
+
+# === SOLVER ===
+# Hard cap (seconds) on any solve; per-request timeBudgetMs is clamped to this
+SOLVER_TIME_LIMIT = float(os.environ.get('SOLVER_TIME_LIMIT', 10))
+# Budget (ms) used when a request sends no timeBudgetMs; 0 skips Guided Local Search
+SOLVER_DEFAULT_TIME_BUDGET_MS = int(os.environ.get('SOLVER_DEFAULT_TIME_BUDGET_MS', 0))
+# Guided Local Search stops once this fraction of the budget passes without improvement
+SOLVER_STALL_FRACTION = float(os.environ.get('SOLVER_STALL_FRACTION', 0.25))
+# Routes with at most this many stops are solved exactly (Held-Karp) instead of with OR-Tools
+EXACT_SOLVER_MAX_STOPS = int(os.environ.get('EXACT_SOLVER_MAX_STOPS', 12))
+# Solver for larger routes: "ortools" (RoutingModel), "local_search" (NumPy 2-opt/Or-opt) or "portfolio"
+SOLVER_BACKEND = os.environ.get('SOLVER_BACKEND', 'ortools')
+# "portfolio" solver: comma-separated FIRST_SOLUTION_STRATEGY:METAHEURISTIC pairs raced in worker processes
+SOLVER_PORTFOLIO = os.environ.get(
+    'SOLVER_PORTFOLIO',
+    'PATH_CHEAPEST_ARC:GUIDED_LOCAL_SEARCH,SAVINGS:GUIDED_LOCAL_SEARCH,'
+    'CHRISTOFIDES:SIMULATED_ANNEALING,PARALLEL_CHEAPEST_INSERTION:TABU_SEARCH'
+)
+# Worker processes for the portfolio (defaults to one per configuration, up to the CPU count)
+SOLVER_PORTFOLIO_WORKERS = int(os.environ.get('SOLVER_PORTFOLIO_WORKERS', min(4, os.cpu_count() or 1)))
+# Candidate-list size per stop for the local search backend
+LOCAL_SEARCH_NEIGHBORS = int(os.environ.get('LOCAL_SEARCH_NEIGHBORS', 10))
+# Latest arrival (seconds after departure) any time-windowed route may plan for
+TIME_HORIZON_SECONDS = int(os.environ.get('TIME_HORIZON_SECONDS', 24 * 3600))
+# Solved tours kept per worker, keyed by a canonical hash of the stops (0 disables)
+SOLUTION_CACHE_SIZE = int(os.environ.get('SOLUTION_CACHE_SIZE', 256))
+# /optimize_fleet: weight of the longest vehicle route against total fleet distance (0 = total only)
+FLEET_SPAN_COST_COEFFICIENT = int(os.environ.get('FLEET_SPAN_COST_COEFFICIENT', 1))
+
+# === JOBS (POST /jobs/optimize) ===
+# Jobs each web worker runs at once (threads for OSRM I/O, plus as many solver processes)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs a web worker accepts (queued + running) before answering 503
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+# Seconds a finished job's result stays available
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+# Directory shared by all workers for job records (default: <tmp>/route_jobs)
+JOB_STORE_DIR = os.environ.get('JOB_STORE_DIR', '')
+
+# === METRICS (GET /metrics) ===
+# Directory shared by all workers for their metrics snapshots (default: <tmp>/route_metrics)
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# Min seconds between a worker's snapshot writes; requests in between are written once, at the end of it
+METRICS_PUBLISH_INTERVAL = float(os.environ.get('METRICS_PUBLISH_INTERVAL', 1.0))
+# Request header that, when set, adds per-stage "timings" (ms) to the /optimize_route response
+DEBUG_TIMINGS_HEADER = os.environ.get('DEBUG_TIMINGS_HEADER', 'X-Debug-Timings')
+
+# === LOAD MODEL (TST BOCES recycling truck, see archive/data_calculations.py) ===
+# Mass of the empty truck (kg); stop demands are added on top of this
+TRUCK_EMPTY_MASS_KG = float(os.environ.get('TRUCK_EMPTY_MASS_KG', 18325.1317))
+# Rolling resistance coefficient for the "energy" objective (0 = archive model: kinetic + potential work only)
+ENERGY_ROLLING_RESISTANCE = float(os.environ.get('ENERGY_ROLLING_RESISTANCE', 0.007))
+# Directory of 1-degree DEM tiles (SRTM .hgt or .npy) for offline stop elevations; empty disables lookups
+ELEVATION_DEM_DIR = os.environ.get('ELEVATION_DEM_DIR', '')
+# DEM tiles kept memory-mapped per worker (least recently used are closed first)
+ELEVATION_TILE_CACHE_SIZE = int(os.environ.get('ELEVATION_TILE_CACHE_SIZE', 16))
+# Default payload (kg) a vehicle can collect before it must unload, when a request gives no capacity
+VEHICLE_CAPACITY_KG = int(os.environ.get('VEHICLE_CAPACITY_KG', 9000))
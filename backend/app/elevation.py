@@ -0,0 +1,139 @@
+"""
+Offline elevation lookup from a directory of DEM tiles.
+
+Tiles cover one degree of latitude/longitude and are named after their
+south-west corner, SRTM style (e.g. N42W077 covers 42..43 N, 77..76 W):
+
+* N42W077.hgt - raw SRTM: big-endian int16, square (1201x1201 or 3601x3601),
+  rows running north to south, -32768 marking voids.
+* N42W077.npy - the same grid as a NumPy array, e.g. converted from a GeoTIFF.
+
+Tiles are opened as memory maps, so only the pages around the sampled points
+are read from disk, and the most recently used ones stay open (LRU). A batch
+of coordinates is sampled with one vectorized bilinear interpolation per tile.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+# SRTM marks missing samples with this value
+VOID_VALUE = -32768
+
+
+def tile_name(lat_floor, lng_floor):
+    """Returns the SRTM tile name for the tile whose south-west corner is (lat_floor, lng_floor)."""
+    ns = "N" if lat_floor >= 0 else "S"
+    ew = "E" if lng_floor >= 0 else "W"
+    return f"{ns}{abs(int(lat_floor)):02d}{ew}{abs(int(lng_floor)):03d}"
+
+
+class DEMTileStore:
+
+    def __init__(self, directory=None, max_tiles=None):
+        """
+        Creates a tile store reading from directory.
+        Arguments left as None fall back to ELEVATION_DEM_DIR / ELEVATION_TILE_CACHE_SIZE in config.py.
+        """
+        self.directory = directory if directory is not None else config.ELEVATION_DEM_DIR
+        self.max_tiles = max_tiles if max_tiles is not None else config.ELEVATION_TILE_CACHE_SIZE
+
+        # (lat_floor, lng_floor) -> memory-mapped 2D array, or None if no tile exists
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _open(self, lat_floor, lng_floor):
+        """Memory-maps the tile file, or returns None if there is none."""
+        name = tile_name(lat_floor, lng_floor)
+        hgt_path = os.path.join(self.directory, name + ".hgt")
+        npy_path = os.path.join(self.directory, name + ".npy")
+        try:
+            if os.path.exists(hgt_path):
+                grid = np.memmap(hgt_path, dtype=">i2", mode="r")
+                side = int(round(np.sqrt(grid.size)))
+                if side * side != grid.size:
+                    raise ValueError(f"{grid.size} samples is not a square grid")
+                return grid.reshape(side, side)
+            if os.path.exists(npy_path):
+                return np.load(npy_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not open DEM tile {name}: {e}")
+        return None
+
+    def tile(self, lat_floor, lng_floor):
+        """Returns the tile grid covering the given 1-degree cell (None if missing)."""
+        key = (int(lat_floor), int(lng_floor))
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        grid = self._open(*key)
+        with self._lock:
+            self._tiles[key] = grid
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return grid
+
+    def elevations(self, lats, lngs):
+        """
+        Returns the elevation (meters) at each coordinate, bilinearly interpolated.
+        NaN where no tile covers the point or the surrounding samples are voids.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        result = np.full(lats.shape, np.nan)
+        if not self.directory:
+            return result
+
+        cells = np.stack((np.floor(lats), np.floor(lngs)), axis=-1).astype(int)
+        for lat_floor, lng_floor in np.unique(cells.reshape(-1, 2), axis=0):
+            grid = self.tile(lat_floor, lng_floor)
+            if grid is None:
+                continue
+            in_cell = (cells[..., 0] == lat_floor) & (cells[..., 1] == lng_floor)
+            result[in_cell] = self._sample(grid, lats[in_cell] - lat_floor, lngs[in_cell] - lng_floor)
+        return result
+
+    def _sample(self, grid, lat_offsets, lng_offsets):
+        """Bilinear interpolation at offsets (0..1) from the tile's south-west corner."""
+        rows, cols = grid.shape
+        # Row 0 is the northern edge
+        r = (1.0 - lat_offsets) * (rows - 1)
+        c = lng_offsets * (cols - 1)
+        r0 = np.clip(np.floor(r).astype(int), 0, rows - 2)
+        c0 = np.clip(np.floor(c).astype(int), 0, cols - 2)
+        fr = (r - r0)[:, None]
+        fc = (c - c0)[:, None]
+
+        # The four surrounding samples of each point, in one fancy-indexed read
+        corners = np.asarray(grid[r0[:, None] + [0, 0, 1, 1], c0[:, None] + [0, 1, 0, 1]], dtype=float)
+        corners[corners == VOID_VALUE] = np.nan
+        top = corners[:, [0]] * (1 - fc) + corners[:, [1]] * fc
+        bottom = corners[:, [2]] * (1 - fc) + corners[:, [3]] * fc
+        return (top * (1 - fr) + bottom * fr)[:, 0]
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_elevation_service():
+    """
+    Returns the DEMTileStore shared by every request in this worker process
+    (a new one after a fork, so a forked worker never inherits the parent's
+    state, or a lock some other thread was holding at the time).
+    """
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store is None or _store_pid != pid:
+        with _store_lock:
+            if _store is None or _store_pid != pid:
+                _store = DEMTileStore()
+                _store_pid = pid
+    return _store
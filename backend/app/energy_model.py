@@ -0,0 +1,76 @@
+"""
+Energy (work) cost model for the recycling truck, ported from
+archive/data_calculations.py (compute_work_theoretical_matrix).
+
+For a segment A -> B driven by a truck of mass m (empty truck plus the load
+collected at A), at average speed v = distance / duration, climbing
+dh = elevation(B) - elevation(A):
+
+    W = 0.5 * m * v^2 + m * g * dh      (if that is negative: 0.5 * m * v^2)
+
+The archive computed this per CSV row with dict lookups; here the whole
+matrix is built in one NumPy pass. An optional rolling-resistance term
+(Crr * m * g * distance) makes longer segments cost more; with Crr = 0 the
+result matches the archive model exactly.
+"""
+import numpy as np
+
+import config
+
+# Gravitational acceleration [m/s^2]
+G = 9.81
+# Energy content of diesel [J/liter] (archive: diesel_to_J)
+DIESEL_J_PER_LITER = 38290000
+
+
+def work_matrix(distances_m, durations_s, elevations_m=None, loads_kg=None, empty_mass_kg=None,
+                rolling_resistance=None):
+    """
+    Returns the n x n float matrix of work [J] to drive each segment.
+
+    distances_m / durations_s: OSRM Table matrices (NaN where unreachable).
+    elevations_m: elevation of each stop (default: all 0, i.e. flat).
+    loads_kg: load carried out of each stop (default: none), added to empty_mass_kg.
+    empty_mass_kg defaults to TRUCK_EMPTY_MASS_KG and rolling_resistance to ENERGY_ROLLING_RESISTANCE.
+    """
+    distances = np.asarray(distances_m, dtype=float)
+    durations = np.asarray(durations_s, dtype=float)
+    n = len(distances)
+    if empty_mass_kg is None:
+        empty_mass_kg = config.TRUCK_EMPTY_MASS_KG
+    if rolling_resistance is None:
+        rolling_resistance = config.ENERGY_ROLLING_RESISTANCE
+
+    elevations = np.zeros(n) if elevations_m is None else np.asarray(elevations_m, dtype=float)
+    loads = np.zeros(n) if loads_kg is None else np.asarray(loads_kg, dtype=float)
+
+    # Mass leaving each origin stop, broadcast along its row
+    mass = (loads + empty_mass_kg)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(durations > 0, distances / durations, 0.0)
+    delta_h = elevations[None, :] - elevations[:, None]
+
+    kinetic = 0.5 * mass * speed ** 2
+    work = kinetic + mass * G * delta_h
+    # Downhill segments never recover energy: fall back to the kinetic term
+    work = np.where(work < 0, kinetic, work)
+    if rolling_resistance:
+        work = work + rolling_resistance * mass * G * distances
+
+    # Keep unreachable pairs unreachable
+    work[np.isnan(distances) | np.isnan(durations)] = np.nan
+    np.fill_diagonal(work, 0.0)
+    return work
+
+
+def route_work(work, route_indices):
+    """Sums the work [J] along a route of stop indices."""
+    route = np.asarray(route_indices, dtype=np.intp)
+    if len(route) < 2:
+        return 0.0
+    return float(np.asarray(work)[route[:-1], route[1:]].sum())
+
+
+def joules_to_liters(joules):
+    """Converts work [J] to the equivalent volume of diesel [liters]."""
+    return joules / DIESEL_J_PER_LITER
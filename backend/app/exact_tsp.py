@@ -0,0 +1,78 @@
+"""
+Exact TSP solver for small routes (Held-Karp bitmask dynamic programming).
+Most requests have only a handful of stops, where building an OR-Tools
+RoutingModel costs more than simply solving the problem exactly.
+
+Each DP layer (all subsets of the same size) is computed with NumPy in one
+pass per end node, so the Python loop runs O(n^2) times rather than O(2^n * n^2).
+Memory and time grow as 2^n * n, so keep n at or below MAX_EXACT_STOPS.
+"""
+import numpy as np
+
+# Hard ceiling on stop count: 2^17 * 17 cells is ~18 MB of float64 per table.
+MAX_EXACT_STOPS = 18
+
+
+def solve_held_karp(cost_matrix, depot=0):
+    """
+    Returns (route_indices, cost) for the optimal closed tour starting and
+    ending at the depot, e.g. ([0, 3, 1, 2, 0], 1234.0).
+    """
+    cost = np.asarray(cost_matrix, dtype=float)
+    n = len(cost)
+    if n > MAX_EXACT_STOPS:
+        raise ValueError(f"Held-Karp is limited to {MAX_EXACT_STOPS} stops, got {n}.")
+    if n <= 2:
+        if n == 0:
+            return [], 0.0
+        route = [depot] + [i for i in range(n) if i != depot] + [depot]
+        return route, float(cost[route[:-1], route[1:]].sum())
+
+    # Reorder so the depot is node 0; the DP runs over the m = n-1 other nodes.
+    order = np.array([depot] + [i for i in range(n) if i != depot])
+    cost = cost[np.ix_(order, order)]
+    m = n - 1
+    from_depot = cost[0, 1:]
+    to_depot = cost[1:, 0]
+    between = cost[1:, 1:]
+
+    num_masks = 1 << m
+    masks = np.arange(num_masks)
+    popcount = np.zeros(num_masks, dtype=np.int64)
+    for b in range(m):
+        popcount += (masks >> b) & 1
+
+    # dp[mask, j]: cheapest path from the depot visiting exactly `mask`, ending at j.
+    # Cells where j is not in mask stay inf, which also masks them out of the min below.
+    dp = np.full((num_masks, m), np.inf)
+    parent = np.full((num_masks, m), -1, dtype=np.int8)
+    singles = 1 << np.arange(m)
+    dp[singles, np.arange(m)] = from_depot
+
+    for size in range(2, m + 1):
+        layer = masks[popcount == size]
+        for j in range(m):
+            sel = layer[(layer >> j) & 1 == 1]
+            candidates = dp[sel ^ (1 << j)] + between[:, j]
+            best = np.argmin(candidates, axis=1)
+            dp[sel, j] = candidates[np.arange(len(sel)), best]
+            parent[sel, j] = best
+
+    full = num_masks - 1
+    totals = dp[full] + to_depot
+    last = int(np.argmin(totals))
+    best_cost = float(totals[last])
+
+    # Walk the parent pointers back from the last node before the depot.
+    path = []
+    mask = full
+    node = last
+    while node != -1:
+        path.append(node)
+        prev = int(parent[mask, node])
+        mask ^= 1 << node
+        node = prev
+    path.reverse()
+
+    route = [depot] + [int(order[j + 1]) for j in path] + [depot]
+    return route, best_cost
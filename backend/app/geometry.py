@@ -0,0 +1,208 @@
+"""
+Route geometry encoding and simplification for the routeGeometry response field.
+
+OSRM is asked for its route geometry as a precision-6 encoded polyline
+(the same coordinates as GeoJSON, in a fraction of the bytes), which is then
+returned as requested by the client:
+
+* "geojson"   - full-resolution [[lat, lng], ...] list (the default)
+* "polyline"  - Google encoded polyline, 5 decimal places
+* "polyline6" - encoded polyline, 6 decimal places (OSRM's own precision)
+
+Any format can first be simplified with Douglas-Peucker, either to a tolerance
+in meters or to what is visible at a web-map zoom level. Encoding, decoding
+and the point-to-segment distances are all vectorized with NumPy.
+
+Encoded routes can also be split into legs at their waypoints and legs joined
+back into one polyline, which the route cache (route_cache.py) uses to stitch
+routes from cached legs.
+"""
+import numpy as np
+
+# Decimal places of each encoded format
+POLYLINE_PRECISIONS = {"polyline": 5, "polyline6": 6}
+GEOMETRY_FORMATS = ("geojson",) + tuple(POLYLINE_PRECISIONS)
+# Precision OSRM is asked to encode route geometry with
+OSRM_GEOMETRY_FORMAT = "polyline6"
+# Mean Earth radius [m]
+EARTH_RADIUS_M = 6371008.8
+# Web-mercator ground resolution at zoom 0 on the equator [m/pixel]
+METERS_PER_PIXEL_ZOOM_0 = 156543.03392
+# Deviation (pixels on screen) allowed when simplifying for a zoom level
+ZOOM_TOLERANCE_PIXELS = 0.5
+# Chunks of 5 bits needed for the largest delta a polyline can hold
+_MAX_CHUNKS = 7
+
+
+def encode_polyline(latlngs, precision=5):
+    """Encodes [[lat, lng], ...] as a Google encoded polyline string."""
+    points = np.rint(np.asarray(latlngs, dtype=float).reshape(-1, 2) * 10 ** precision).astype(np.int64)
+    if not len(points):
+        return ""
+    return _encode_deltas(np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)))
+
+
+def _encode_deltas(deltas):
+    """Encodes integer [[dlat, dlng], ...] steps as polyline characters."""
+    deltas = np.asarray(deltas, dtype=np.int64).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Split each value into 5-bit chunks, low bits first; all but the last carry 0x20
+    chunks = (values[:, None] >> (5 * np.arange(_MAX_CHUNKS))) & 0x1F
+    num_chunks = 1 + (values[:, None] >= 32 ** np.arange(1, _MAX_CHUNKS)).sum(axis=1)
+    k = np.arange(_MAX_CHUNKS)[None, :]
+    chunks = chunks | np.where(k < num_chunks[:, None] - 1, 0x20, 0)
+    return (chunks[k < num_chunks[:, None]] + 63).astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(encoded, precision=5):
+    """Decodes a Google encoded polyline into an (n, 2) array of [lat, lng]."""
+    chars = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if not len(chars):
+        return np.zeros((0, 2))
+    last = chars < 0x20
+    # Index of the value each chunk belongs to, and the chunk's position within it
+    value_index = np.concatenate(([0], np.cumsum(last)[:-1]))
+    first_chunk = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    position = np.arange(len(chars)) - first_chunk[value_index]
+    # Chunks of one value never overlap, so summing them (exact in float64 up to 2^53) is OR-ing them
+    values = np.bincount(value_index, weights=(chars & 0x1F) << (5 * position)).astype(np.int64)
+
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def split_polyline(encoded, waypoints, precision=6):
+    """
+    Splits a route's encoded polyline into one encoded polyline per leg, cut at
+    the vertices matching the route's waypoints ([[lat, lng], ...] in visiting
+    order, e.g. OSRM's snapped waypoint locations). Returns None if the
+    geometry can't be matched to the waypoints.
+    """
+    scale = 10 ** precision
+    points = np.rint(decode_polyline(encoded, precision) * scale).astype(np.int64)
+    targets = np.rint(np.asarray(waypoints, dtype=float).reshape(-1, 2) * scale).astype(np.int64)
+    if len(points) < 2 or len(targets) < 2:
+        return None
+
+    cuts = [0]
+    for target in targets[1:-1]:
+        rest = points[cuts[-1]:]
+        exact = np.flatnonzero((rest == target).all(axis=1))
+        # OSRM puts every snapped waypoint on the geometry; fall back to the nearest vertex just in case
+        offset = exact[0] if len(exact) else int(np.argmin(((rest - target) ** 2).sum(axis=1)))
+        cuts.append(cuts[-1] + int(offset))
+    cuts.append(len(points) - 1)
+    return [
+        _encode_deltas(np.diff(points[a:b + 1], axis=0, prepend=np.zeros((1, 2), dtype=np.int64)))
+        for a, b in zip(cuts, cuts[1:])
+    ]
+
+
+def join_polylines(legs):
+    """
+    Concatenates encoded polylines end to end into one, without decoding them:
+    each leg after the first only has its starting point re-encoded relative to
+    where the previous leg ended (and dropped if it is the same point).
+    """
+    parts = []
+    last = None
+    for leg in legs:
+        if not leg:
+            continue
+        first, tail = _first_point(leg)
+        if last is None:
+            parts.append(leg)
+        elif (first == last).all():
+            parts.append(tail)
+        else:
+            parts.append(_encode_deltas(first - last) + tail)
+        last = first + _sum_deltas(tail)
+    return "".join(parts)
+
+
+def _first_point(encoded):
+    """Returns (the first point as integers, the rest of the string), which is relative to that point."""
+    chars = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    second_value_end = int(np.flatnonzero(chars < 0x20)[1]) + 1
+    head = encoded[:second_value_end]
+    return np.rint(decode_polyline(head, 0)[0]).astype(np.int64), encoded[second_value_end:]
+
+
+def _sum_deltas(encoded):
+    """Sum of the (integer) steps in an encoded polyline fragment."""
+    if not encoded:
+        return np.zeros(2, dtype=np.int64)
+    return np.rint(decode_polyline(encoded, 0)[-1]).astype(np.int64)
+
+
+def zoom_tolerance_m(zoom, latitude):
+    """Meters covered by ZOOM_TOLERANCE_PIXELS at a web-map zoom level and latitude."""
+    return METERS_PER_PIXEL_ZOOM_0 * np.cos(np.radians(latitude)) / 2 ** zoom * ZOOM_TOLERANCE_PIXELS
+
+
+def simplify(latlngs, tolerance_m):
+    """
+    Douglas-Peucker simplification of [[lat, lng], ...]: drops every vertex within
+    tolerance_m meters of the simplified line. The first and last points are kept.
+    """
+    points = np.asarray(latlngs, dtype=float).reshape(-1, 2)
+    n = len(points)
+    if n < 3 or tolerance_m <= 0:
+        return points
+
+    # Local equirectangular projection, in meters; plenty accurate at route scale
+    lat0 = np.radians(points[:, 0].mean())
+    xy = np.column_stack((np.radians(points[:, 1]) * np.cos(lat0), np.radians(points[:, 0]))) * EARTH_RADIUS_M
+
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = xy[start]
+        ab = xy[end] - a
+        ap = xy[start + 1:end] - a
+        length_sq = ab @ ab
+        # Distance to the segment (to its start point when it has no length, e.g. a round trip)
+        t = np.clip(ap @ ab / length_sq, 0.0, 1.0) if length_sq > 0 else np.zeros(len(ap))
+        distances = np.hypot(*(ap - t[:, None] * ab).T)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def route_latlngs(osrm_geometry, precision=6):
+    """Returns an OSRM route geometry (encoded polyline or GeoJSON LineString) as an (n, 2) [lat, lng] array."""
+    if isinstance(osrm_geometry, str):
+        return decode_polyline(osrm_geometry, precision)
+    return np.asarray(osrm_geometry["coordinates"], dtype=float).reshape(-1, 2)[:, ::-1]
+
+
+def format_route_geometry(osrm_geometry, geometry_format="geojson", tolerance_m=None, zoom=None, precision=6):
+    """
+    Converts an OSRM route geometry (a polyline encoded with the given precision,
+    or GeoJSON) to the requested routeGeometry format, simplified first if a
+    tolerance (meters) or zoom level is given.
+    """
+    simplified = tolerance_m is not None or zoom is not None
+    output_precision = POLYLINE_PRECISIONS.get(geometry_format)
+    if isinstance(osrm_geometry, str) and output_precision == precision and not simplified:
+        # Already in the requested encoding
+        return osrm_geometry
+
+    latlngs = route_latlngs(osrm_geometry, precision)
+    if simplified and len(latlngs):
+        if tolerance_m is None:
+            tolerance_m = zoom_tolerance_m(zoom, latlngs[:, 0].mean())
+        latlngs = simplify(latlngs, tolerance_m)
+
+    if output_precision is not None:
+        return encode_polyline(latlngs, output_precision)
+    return latlngs.tolist()
@@ -0,0 +1,179 @@
+"""
+Background jobs for long-running solves.
+
+A job is accepted by one web worker and run on that worker's small thread
+pool, which does the OSRM I/O and hands the CPU-bound solve to a process pool
+(OR-Tools holds the GIL while it searches, so a solver thread would stall the
+worker's HTTP handling). Job records are JSON files in a shared directory, so
+any gunicorn worker can answer GET /jobs/<id>, and they expire after a TTL.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+
+
+class JobQueueFull(Exception):
+    """Raised when a worker already has its maximum number of jobs queued or running."""
+
+
+class JobManager:
+
+    def __init__(self, directory=None, workers=None, max_queued=None, ttl_seconds=None):
+        """
+        Creates a job runner.
+        Arguments left as None fall back to the matching JOB_* setting in config.py.
+        """
+        self.directory = directory or config.JOB_STORE_DIR or os.path.join(tempfile.gettempdir(), "route_jobs")
+        self.workers = workers if workers is not None else config.JOB_WORKERS
+        self.max_queued = max_queued if max_queued is not None else config.JOB_QUEUE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.JOB_RESULT_TTL
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._processes = None
+        self._queues = None
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(*args), which must return (body, http_status), and returns the job id.
+        Raises JobQueueFull if this worker already has max_queued jobs in flight.
+        """
+        self.reserve()
+        job_id = uuid.uuid4().hex
+        try:
+            self._write(job_id, {"jobId": job_id, "status": "queued", "submittedAt": time.time()})
+            self._threads.submit(self._run, job_id, fn, args)
+        except Exception:
+            self.release()
+            raise
+        self.sweep()
+        return job_id
+
+    def reserve(self):
+        """
+        Takes one of this worker's max_queued job slots; pair with release().
+        Raises JobQueueFull if they are all taken.
+        """
+        with self._lock:
+            if self._active >= self.max_queued:
+                raise JobQueueFull(f"{self._active} jobs already queued or running")
+            self._active += 1
+
+    def release(self):
+        """Gives back a slot taken by reserve()."""
+        with self._lock:
+            self._active -= 1
+
+    def _run(self, job_id, fn, args):
+        record = self.get(job_id) or {"jobId": job_id, "submittedAt": time.time()}
+        try:
+            record.update(status="running", startedAt=time.time())
+            self._write(job_id, record)
+            body, status = fn(*args)
+            record.update(status="done" if status < 400 else "failed", statusCode=status, result=body)
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            record.update(status="failed", statusCode=500, result={"error": "Internal server error", "details": str(e)})
+        finally:
+            try:
+                record["finishedAt"] = time.time()
+                self._write(job_id, record)
+            except OSError as e:
+                logging.error(f"Could not save job {job_id}: {e}")
+            finally:
+                self.release()
+
+    def run_in_process(self, fn, *args):
+        """Runs fn(*args) in this worker's solver process pool and returns its result."""
+        return self.submit_to_process(fn, *args).result()
+
+    def submit_to_process(self, fn, *args):
+        """Starts fn(*args) in this worker's solver process pool and returns its Future."""
+        with self._lock:
+            if self._processes is None:
+                # Spawned, not forked, so solver processes never inherit the web worker's threads or sockets
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            processes = self._processes
+        return processes.submit(fn, *args)
+
+    def progress_queue(self):
+        """Returns a new queue that solver processes can put progress updates on."""
+        with self._lock:
+            if self._queues is None:
+                self._queues = multiprocessing.get_context("spawn").Manager()
+            queues = self._queues
+        return queues.Queue()
+
+    def get(self, job_id):
+        """Returns the job record, or None if the id is unknown or the job has expired."""
+        if not job_id.isalnum():
+            return None
+        path = self._path(job_id)
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("finishedAt") and record["finishedAt"] + self.ttl_seconds < time.time():
+            self._remove(path)
+            return None
+        return record
+
+    def sweep(self):
+        """Deletes job files older than the TTL (finished or not, e.g. left by a crashed worker)."""
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith((".json", ".tmp")) and os.path.getmtime(path) < cutoff:
+                    self._remove(path)
+            except OSError:
+                pass
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job_id, record):
+        """Writes the job record atomically (write to a temp file, then rename)."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self._path(job_id))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Returns this process's JobManager (a new one after a fork, since pools don't survive it)."""
+    global _manager, _manager_pid
+    if _manager is None or _manager_pid != os.getpid():
+        with _manager_lock:
+            if _manager is None or _manager_pid != os.getpid():
+                _manager = JobManager()
+                _manager_pid = os.getpid()
+    return _manager
@@ -0,0 +1,181 @@
+"""
+Lightweight TSP local search in pure NumPy.
+Builds a nearest-neighbor tour, then improves it with 2-opt and Or-opt moves
+restricted to each stop's K nearest neighbors. Unlike the OR-Tools path this
+never builds a RoutingIndexManager/RoutingModel, so it is cheap in both
+latency and memory on small workers.
+
+The cost matrix may be asymmetric (OSRM road distances are), so a 2-opt move
+also accounts for the cost change of travelling the reversed segment backwards.
+"""
+import time
+
+import numpy as np
+
+# Improvements smaller than this (in cost units) are treated as no improvement
+EPSILON = 1e-9
+
+
+def nearest_neighbor_tour(cost, depot=0):
+    """Greedy construction: from the depot, always drive to the closest unvisited stop."""
+    n = len(cost)
+    visited = np.zeros(n, dtype=bool)
+    visited[depot] = True
+    tour = [depot]
+    current = depot
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, cost[current])
+        current = int(np.argmin(row))
+        visited[current] = True
+        tour.append(current)
+    return tour
+
+
+def cheapest_insertion(cost, partial_tour, depot=0):
+    """
+    Completes a partial tour (stop indices in visiting order, depot optional) into a
+    closed tour over every stop, inserting each missing stop where it adds the least cost.
+    Duplicate or out-of-range indices in the partial tour are dropped.
+    """
+    n = len(cost)
+    tour = [depot]
+    seen = {depot}
+    for i in partial_tour:
+        i = int(i)
+        if 0 <= i < n and i not in seen:
+            tour.append(i)
+            seen.add(i)
+    tour.append(depot)
+
+    for node in (i for i in range(n) if i not in seen):
+        t = np.asarray(tour)
+        added = cost[t[:-1], node] + cost[node, t[1:]] - cost[t[:-1], t[1:]]
+        position = int(np.argmin(added)) + 1
+        tour.insert(position, node)
+    return tour
+
+
+def neighbor_mask(cost, k):
+    """Boolean n x n mask: mask[a, b] is True if b is one of a's k nearest stops (either direction)."""
+    n = len(cost)
+    k = min(k, n - 1)
+    symmetric = cost + cost.T
+    np.fill_diagonal(symmetric, np.inf)
+    nearest = np.argsort(symmetric, axis=1)[:, :k]
+    mask = np.zeros((n, n), dtype=bool)
+    mask[np.arange(n)[:, None], nearest] = True
+    return mask, nearest
+
+
+def _best_two_opt(cost, tour, near):
+    """
+    Returns (delta, i, j) for the best 2-opt move reversing tour[i+1 : j+1],
+    where tour is closed (tour[-1] == tour[0]).
+    """
+    t = np.asarray(tour)
+    n = len(t) - 1
+    a, b = t[:-1], t[1:]
+
+    # Prefix sums of the forward and backward arc costs along the tour
+    forward = np.concatenate(([0.0], np.cumsum(cost[a, b])))
+    backward = np.concatenate(([0.0], np.cumsum(cost[b, a])))
+
+    i = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    delta = (
+        cost[a[:, None], a[None, :]] + cost[b[:, None], b[None, :]]
+        - cost[a, b][:, None] - cost[a, b][None, :]
+        + (backward[j] - backward[np.minimum(i + 1, n)])
+        - (forward[j] - forward[np.minimum(i + 1, n)])
+    )
+    valid = (j > i + 1) & (near[a[:, None], a[None, :]] | near[b[:, None], b[None, :]])
+    delta = np.where(valid, delta, np.inf)
+
+    flat = int(np.argmin(delta))
+    bi, bj = divmod(flat, n)
+    return float(delta[bi, bj]), bi, bj
+
+
+def _best_or_opt(cost, tour, nearest, max_segment):
+    """
+    Returns (delta, start, length, after) for the best move of a segment of up to
+    max_segment stops to just after stop `after` (a neighbor-list candidate).
+    """
+    t = np.asarray(tour)
+    n = len(t) - 1
+    position = np.empty(n, dtype=np.intp)
+    position[t[:-1]] = np.arange(n)
+    best = (np.inf, 0, 0, 0)
+
+    for length in range(1, min(max_segment, n - 2) + 1):
+        # Segments start after the depot and must not wrap past the end of the tour
+        starts = np.arange(1, n - length + 1)
+        pred = t[starts - 1]
+        first = t[starts]
+        last = t[starts + length - 1]
+        succ = t[starts + length]
+        removal_gain = cost[pred, first] + cost[last, succ] - cost[pred, succ]
+
+        # Insert after a neighbor of the first stop, or before a neighbor of the last stop
+        after_pos = np.concatenate((position[nearest[first]], (position[nearest[last]] - 1) % n), axis=1)
+        after = t[after_pos]
+        after_succ = t[after_pos + 1]
+        insertion = cost[after, first[:, None]] + cost[last[:, None], after_succ] - cost[after, after_succ]
+
+        # Inserting inside the segment, or right back where it was, is not a move
+        s = starts[:, None]
+        valid = (after_pos < s - 1) | (after_pos > s + length - 1)
+        delta = np.where(valid, insertion - removal_gain[:, None], np.inf)
+
+        row, col = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if delta[row, col] < best[0]:
+            best = (float(delta[row, col]), int(starts[row]), length, int(after[row, col]))
+    return best
+
+
+def solve_local_search(cost_matrix, depot=0, neighbors=10, max_segment=3, time_limit_seconds=None,
+                       initial_tour=None):
+    """
+    Returns (route_indices, cost) for a closed tour starting and ending at the depot.
+
+    neighbors: size of each stop's candidate list for 2-opt/Or-opt moves.
+    max_segment: longest run of stops Or-opt will relocate.
+    time_limit_seconds: optional wall-clock cap; the best tour so far is returned.
+    initial_tour: optional (partial) tour to start from instead of nearest neighbor;
+    missing stops are added by cheapest insertion.
+    """
+    cost = np.asarray(cost_matrix, dtype=float)
+    n = len(cost)
+    if n <= 3:
+        route = [depot] + [i for i in range(n) if i != depot] + [depot] if n else []
+        return route, float(cost[route[:-1], route[1:]].sum()) if n else 0.0
+
+    deadline = time.monotonic() + time_limit_seconds if time_limit_seconds else None
+    near, nearest = neighbor_mask(cost, neighbors)
+    if initial_tour is not None:
+        tour = cheapest_insertion(cost, initial_tour, depot)
+    else:
+        tour = nearest_neighbor_tour(cost, depot) + [depot]
+
+    improved = True
+    while improved:
+        improved = False
+        if deadline and time.monotonic() > deadline:
+            break
+
+        delta, i, j = _best_two_opt(cost, tour, near)
+        if delta < -EPSILON:
+            tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+            improved = True
+            continue
+
+        delta, start, length, after = _best_or_opt(cost, tour, nearest, max_segment)
+        if delta < -EPSILON:
+            segment = tour[start:start + length]
+            rest = tour[:start] + tour[start + length:]
+            insert_at = rest.index(after) + 1
+            tour = rest[:insert_at] + segment + rest[insert_at:]
+            improved = True
+
+    tour = [int(x) for x in tour]
+    return tour, float(cost[tour[:-1], tour[1:]].sum())
@@ -0,0 +1,294 @@
+"""
+Latency and solver metrics, served in the Prometheus text format on GET /metrics.
+
+Counters and histograms live in memory in each worker process. Workers publish
+a JSON snapshot of their values to METRICS_DIR after requests (at most once per
+METRICS_PUBLISH_INTERVAL), and /metrics adds up the snapshots of all live
+workers (its own read live), so whichever gunicorn worker answers the scrape
+reports the whole server. Snapshots of processes that are gone, e.g. recycled
+workers or an earlier run of the server, are deleted at the next scrape; their
+counts leave the totals, which Prometheus handles as a counter reset.
+
+Stage timings are collected per request in a plain dict of milliseconds
+(see timed()), which can cross into a solver process inside solve_info and be
+returned to the client as the debug "timings" object.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+# Seconds; covers a cached table lookup up to a full-budget solve
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Solver objective (meters, or kJ for the energy objective)
+OBJECTIVE_BUCKETS = (1e3, 3e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+# Solutions the OR-Tools search went through
+SOLUTION_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+@contextmanager
+def timed(timings, stage):
+    """Adds the wall-clock milliseconds spent in the with-block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000, 1)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        # label values -> count
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def render(self, values):
+        lines = []
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        bucket = next((k for k, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def merge(self, total, value):
+        counts, value_sum = value
+        if total is None or len(total[0]) != len(counts):
+            return [list(counts), value_sum]
+        return [[a + b for a, b in zip(total[0], counts)], total[1] + value_sum]
+
+    def render(self, values):
+        lines = []
+        bounds = [_format_value(float(b)) for b in self.buckets] + ["+Inf"]
+        for key, (counts, value_sum) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(float(value_sum))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self, directory=None, publish_interval=None):
+        """
+        Creates an empty registry publishing to directory.
+        Arguments left as None fall back to METRICS_DIR (or a temp dir) and
+        METRICS_PUBLISH_INTERVAL in config.py.
+        """
+        self.directory = directory or config.METRICS_DIR or os.path.join(tempfile.gettempdir(), "route_metrics")
+        self.publish_interval = (
+            publish_interval if publish_interval is not None else config.METRICS_PUBLISH_INTERVAL
+        )
+        self._metrics = {}
+        self._publish_lock = threading.Lock()
+        self._last_publish = float("-inf")
+        # pid whose deferred write is scheduled (a timer thread doesn't survive a fork)
+        self._pending_pid = None
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """This process's values: {metric name: [[label values, value], ...]}."""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def publish(self):
+        """
+        Writes this process's snapshot for the other workers' /metrics, at most once
+        per publish_interval: a call within it schedules one write for when it ends.
+        """
+        with self._publish_lock:
+            wait = self._last_publish + self.publish_interval - time.monotonic()
+            if wait > 0:
+                if self._pending_pid != os.getpid():
+                    self._pending_pid = os.getpid()
+                    timer = threading.Timer(wait, self._publish_pending)
+                    timer.daemon = True
+                    timer.start()
+                return
+            self._last_publish = time.monotonic()
+        self._write_snapshot()
+
+    def _publish_pending(self):
+        with self._publish_lock:
+            self._pending_pid = None
+            self._last_publish = time.monotonic()
+        self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Writes this process's snapshot to <pid>.json (atomic rename)."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError as e:
+            logging.warning(f"Could not publish metrics to {self.directory}: {e}")
+
+    def render(self):
+        """Returns every worker's metrics, summed, in the Prometheus text exposition format."""
+        snapshots = [self.snapshot()]
+        own_file = f"{os.getpid()}.json"
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".json") or name == own_file:
+                continue
+            pid = name[:-len(".json")]
+            if not pid.isdigit() or not _process_exists(int(pid)):
+                # Left by a worker that exited (or an earlier server run)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        lines = []
+        for name, metric in self._metrics.items():
+            totals = {}
+            for snapshot in snapshots:
+                for key, value in snapshot.get(name, []):
+                    key = tuple(key)
+                    totals[key] = metric.merge(totals.get(key), value)
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(totals))
+        return "\n".join(lines) + "\n"
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Someone else's process
+        return True
+    return True
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "route_request_seconds", "Time to handle an HTTP request.", ["endpoint"]
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "route_requests_total", "HTTP requests handled, by endpoint and status code.", ["endpoint", "status"]
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "route_stage_seconds", "Time spent in each stage of a routing request.", ["stage"]
+)
+SOLVER_OBJECTIVE = REGISTRY.histogram(
+    "route_solver_objective", "Solver objective of the returned plan (meters, or kJ of work).", ["objective"],
+    buckets=OBJECTIVE_BUCKETS,
+)
+SOLVER_SOLUTIONS = REGISTRY.histogram(
+    "route_solver_solutions", "Solutions the OR-Tools search went through per solve.", ["backend"],
+    buckets=SOLUTION_COUNT_BUCKETS,
+)
+SOLUTION_CACHE_REQUESTS = REGISTRY.counter(
+    "route_solution_cache_requests_total", "Solution cache lookups, by result (hit/miss).", ["result"]
+)
+ROUTE_CACHE_REQUESTS = REGISTRY.counter(
+    "route_geometry_cache_requests_total",
+    "OSRM route lookups in the geometry cache, by result (hit, stitched from cached legs, or miss).", ["result"]
+)
+TABLE_CACHE_PAIRS = REGISTRY.counter(
+    "route_table_cache_pairs_total", "OSRM table pairs looked up in the table cache, by result (hit/miss).",
+    ["result"]
+)
+
+
+def observe_stages(timings):
+    """Records a dict of stage -> milliseconds (as filled by timed()) in the stage histogram."""
+    for stage, ms in timings.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage)
+
+
+def observe_solve(solve_info, objective="distance"):
+    """Records the solver outcome reported in solve_info: objective, solution count and cache result."""
+    if "cacheHit" in solve_info:
+        SOLUTION_CACHE_REQUESTS.inc(result="hit" if solve_info["cacheHit"] else "miss")
+    if solve_info.get("objective") is not None:
+        SOLVER_OBJECTIVE.observe(solve_info["objective"], objective=objective)
+    if solve_info.get("solutions") is not None and not solve_info.get("cacheHit"):
+        SOLVER_SOLUTIONS.observe(solve_info["solutions"], backend=solve_info.get("backend", "ortools"))
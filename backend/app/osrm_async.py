@@ -0,0 +1,73 @@
+"""
+Async OSRM HTTP client for the ASGI server (asgi_app.py).
+Same API as osrm_client.OSRMClient, but every call is a coroutine on a pooled
+httpx.AsyncClient, so one process can keep many OSRM requests in flight while
+it waits on the network.
+"""
+import asyncio
+
+import httpx
+
+import config
+from osrm_client import OSRMError, format_route_url, format_table_url
+
+# Gateway errors worth retrying, as in OSRMClient
+RETRY_STATUSES = (502, 503, 504)
+
+
+class AsyncOSRMClient:
+
+    def __init__(self, host=None, max_connections=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff_factor=None):
+        """
+        Creates a pooled async client against a single OSRM host.
+        Any argument left as None falls back to the matching OSRM_* setting in config.py.
+        Must be created inside the event loop it will be used from.
+        """
+        self.host = host or config.OSRM_HOST
+        self.max_connections = max_connections if max_connections is not None else config.OSRM_ASYNC_MAX_CONNECTIONS
+        self.retries = retries if retries is not None else config.OSRM_RETRIES
+        self.backoff_factor = backoff_factor if backoff_factor is not None else config.OSRM_BACKOFF_FACTOR
+        connect_timeout = connect_timeout if connect_timeout is not None else config.OSRM_CONNECT_TIMEOUT
+        read_timeout = read_timeout if read_timeout is not None else config.OSRM_READ_TIMEOUT
+
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            # Retries failed connection attempts; gateway errors are retried below
+            transport=httpx.AsyncHTTPTransport(retries=self.retries),
+        )
+
+    async def get_json(self, url):
+        """
+        GETs an OSRM URL and returns the decoded JSON body, retrying gateway errors
+        with exponential backoff. Raises OSRMError if OSRM reports anything other than code "Ok".
+        """
+        for attempt in range(self.retries + 1):
+            resp = await self.client.get(url)
+            if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+        try:
+            data = resp.json()
+        except ValueError:
+            raise OSRMError(f"OSRM returned non-JSON response (HTTP {resp.status_code})")
+
+        if data.get("code") != "Ok":
+            raise OSRMError(f"OSRM error {data.get('code')}: {data.get('message', 'no message')}")
+        return data
+
+    async def table(self, stops, sources=None, destinations=None):
+        """
+        Fetches the distance/duration matrix for the given stops.
+        Pass sources/destinations to fetch only a block of rows/columns.
+        """
+        return await self.get_json(format_table_url(stops, self.host, sources, destinations))
+
+    async def route(self, stops, geometries="geojson"):
+        """Fetches the route (with full geometry, GeoJSON by default) through the stops in the given order."""
+        return await self.get_json(format_route_url(stops, self.host, geometries))
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,146 @@
+"""
+OSRM HTTP client.
+Wraps the OSRM Table and Route APIs behind a pooled, keep-alive requests.Session
+so repeated calls reuse TCP (and TLS) connections instead of paying a fresh
+handshake on every request.
+
+One client is kept per worker process (see get_client). Gunicorn forks its
+workers, and a Session must never be shared across a fork, so the cached client
+is rebuilt whenever the process id changes.
+"""
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+
+class OSRMError(Exception):
+    """Raised when OSRM answers with a non-"Ok" code or an unusable response."""
+
+
+def format_coords(stops):
+    """
+    Build the 'lng,lat;lng,lat;...' coordinate path segment OSRM expects.
+    Every stop must include coords with lat and lng.
+    """
+    coords_list = []
+    for s in stops:
+        c = s.get("coords")
+        if c is None or "lat" not in c or "lng" not in c:
+            raise ValueError("All stops must include coords with lat and lng.")
+        coords_list.append(f"{c['lng']},{c['lat']}")
+    return ";".join(coords_list)
+
+
+def format_table_url(stops, host=None, sources=None, destinations=None):
+    """
+    Build OSRM table API URL for a list of stops.
+    The Table API returns a square matrix of travel times/distances between all pairs of coordinates.
+    Optional sources/destinations (indices into stops) restrict the matrix to those rows/columns.
+    """
+    host = host or config.OSRM_HOST
+    url = f"{host}/table/v1/driving/{format_coords(stops)}?annotations=distance,duration"
+    if sources is not None:
+        url += "&sources=" + ";".join(str(i) for i in sources)
+    if destinations is not None:
+        url += "&destinations=" + ";".join(str(i) for i in destinations)
+    return url
+
+
+def format_route_url(stops, host=None, geometries="geojson"):
+    """
+    Build OSRM route API URL for ordered stops with a full-resolution overview.
+    The Route API returns the actual path geometry (waypoints) to draw on the map,
+    as GeoJSON or as an encoded "polyline"/"polyline6" string.
+    """
+    host = host or config.OSRM_HOST
+    return f"{host}/route/v1/driving/{format_coords(stops)}?overview=full&geometries={geometries}&steps=false"
+
+
+class OSRMClient:
+
+    def __init__(self, host=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff_factor=None):
+        """
+        Creates a pooled session against a single OSRM host.
+        Any argument left as None falls back to the matching OSRM_* setting in config.py.
+        """
+        self.host = host or config.OSRM_HOST
+        self.pool_size = pool_size if pool_size is not None else config.OSRM_POOL_SIZE
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else config.OSRM_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else config.OSRM_READ_TIMEOUT,
+        )
+        retries = retries if retries is not None else config.OSRM_RETRIES
+        backoff_factor = backoff_factor if backoff_factor is not None else config.OSRM_BACKOFF_FACTOR
+
+        # OSRM is read-only, so every call is a GET and safe to retry on
+        # connection errors and transient gateway failures.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_json(self, url):
+        """
+        GETs an OSRM URL on the pooled session and returns the decoded JSON body.
+        Raises OSRMError if OSRM reports anything other than code "Ok".
+        """
+        resp = self.session.get(url, timeout=self.timeout)
+        try:
+            data = resp.json()
+        except ValueError:
+            raise OSRMError(f"OSRM returned non-JSON response (HTTP {resp.status_code})")
+
+        if data.get("code") != "Ok":
+            raise OSRMError(f"OSRM error {data.get('code')}: {data.get('message', 'no message')}")
+        return data
+
+    def table(self, stops, sources=None, destinations=None):
+        """
+        Fetches the distance/duration matrix for the given stops.
+        Pass sources/destinations to fetch only a block of rows/columns.
+        """
+        return self.get_json(format_table_url(stops, self.host, sources, destinations))
+
+    def route(self, stops, geometries="geojson"):
+        """Fetches the route (with full geometry, GeoJSON by default) through the stops in the given order."""
+        return self.get_json(format_route_url(stops, self.host, geometries))
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the OSRMClient shared by every request in this worker process.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OSRMClient()
+                _client_pid = pid
+                logging.info(f"Created pooled OSRM client for {_client.host} (pool size {_client.pool_size}, pid {pid})")
+    return _client
@@ -0,0 +1,170 @@
+"""
+Route geometry cache in front of the OSRM Route API.
+
+Routes are requested as precision-6 encoded polylines (see geometry.py) and
+cached two ways, under coordinates rounded like the table cache's keys:
+
+* whole routes, keyed by the ordered stop sequence, so re-requesting the same
+  tour (e.g. today's order is yesterday's) is a dictionary lookup;
+* each leg (stop -> next stop), cut out of the route at OSRM's waypoints, so a
+  new sequence made only of known legs is stitched together locally.
+
+Any other sequence costs one OSRM round trip, whose legs are then cached.
+Stitched legs were each routed as part of some earlier tour, so at a waypoint
+the route may differ slightly from what OSRM would return for the new tour
+(e.g. around u-turns); distances and durations are the sum of the legs.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from geometry import OSRM_GEOMETRY_FORMAT, POLYLINE_PRECISIONS, join_polylines, split_polyline
+from metrics import ROUTE_CACHE_REQUESTS
+
+
+class RouteGeometryCache:
+
+    def __init__(self, max_legs=None, max_routes=None, ttl_seconds=None, precision=None):
+        """
+        Creates LRU + TTL caches of route legs and whole routes.
+        Arguments left as None fall back to ROUTE_CACHE_LEGS / ROUTE_CACHE_ROUTES /
+        ROUTE_CACHE_TTL / TABLE_CACHE_PRECISION in config.py.
+        """
+        self.max_legs = max_legs if max_legs is not None else config.ROUTE_CACHE_LEGS
+        self.max_routes = max_routes if max_routes is not None else config.ROUTE_CACHE_ROUTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.ROUTE_CACHE_TTL
+        self.precision = precision if precision is not None else config.TABLE_CACHE_PRECISION
+
+        # (origin_key, destination_key) -> (geometry, distance, duration, expires_at)
+        self._legs = OrderedDict()
+        # (stop_key, ...) -> (geometry, distance, duration, leg totals, expires_at)
+        self._routes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, stop):
+        """Returns the (lat, lng) cache key for a stop, rounded to the configured precision."""
+        c = stop["coords"]
+        return (round(float(c["lat"]), self.precision), round(float(c["lng"]), self.precision))
+
+    def route(self, client, stops):
+        """
+        Returns an OSRM-style Route response (polyline6 geometry) through the stops
+        in order, from the cache when possible, else through the given OSRMClient.
+        """
+        cached, keys = self.lookup(stops)
+        if cached is not None:
+            return cached
+        data = client.route(stops, geometries=OSRM_GEOMETRY_FORMAT)
+        self.store(keys, data)
+        return data
+
+    async def route_async(self, client, stops):
+        """Same as route(), for an AsyncOSRMClient."""
+        cached, keys = self.lookup(stops)
+        if cached is not None:
+            return cached
+        data = await client.route(stops, geometries=OSRM_GEOMETRY_FORMAT)
+        self.store(keys, data)
+        return data
+
+    def lookup(self, stops):
+        """Returns (cached or stitched response or None, the stops' cache keys)."""
+        keys = tuple(self.key(s) for s in stops)
+        if self.max_legs <= 0:
+            return None, keys
+
+        now = time.time()
+        with self._lock:
+            entry = self._get(self._routes, keys, now)
+            if entry is not None:
+                ROUTE_CACHE_REQUESTS.inc(result="hit")
+                return self._response(*entry[:4]), keys
+            legs = [self._get(self._legs, pair, now) for pair in zip(keys, keys[1:])]
+
+        if any(leg is None for leg in legs):
+            ROUTE_CACHE_REQUESTS.inc(result="miss")
+            return None, keys
+
+        ROUTE_CACHE_REQUESTS.inc(result="stitched")
+        geometry = join_polylines([leg[0] for leg in legs])
+        leg_totals = [(leg[1], leg[2]) for leg in legs]
+        entry = (geometry, sum(d or 0.0 for d, _ in leg_totals), sum(t or 0.0 for _, t in leg_totals), leg_totals)
+        with self._lock:
+            self._put(self._routes, keys, entry, now, self.max_routes)
+        return self._response(*entry), keys
+
+    def store(self, keys, data):
+        """Caches an OSRM Route response (polyline6 geometry) for the stop keys, and each of its legs."""
+        if self.max_legs <= 0:
+            return
+        route = data["routes"][0]
+        geometry = route["geometry"]
+        leg_totals = [(leg.get("distance"), leg.get("duration")) for leg in route.get("legs", [])]
+        waypoints = [[w["location"][1], w["location"][0]] for w in data.get("waypoints", [])]
+
+        leg_geometries = None
+        if len(leg_totals) == len(keys) - 1 and len(waypoints) == len(keys):
+            leg_geometries = split_polyline(geometry, waypoints, POLYLINE_PRECISIONS[OSRM_GEOMETRY_FORMAT])
+
+        now = time.time()
+        with self._lock:
+            self._put(
+                self._routes, keys,
+                (geometry, route.get("distance"), route.get("duration"), leg_totals), now, self.max_routes,
+            )
+            if leg_geometries is not None:
+                for pair, leg_geometry, (distance, duration) in zip(zip(keys, keys[1:]), leg_geometries, leg_totals):
+                    self._put(self._legs, pair, (leg_geometry, distance, duration), now, self.max_legs)
+
+    def _response(self, geometry, distance, duration, leg_totals):
+        return {
+            "code": "Ok",
+            "routes": [{
+                "geometry": geometry,
+                "distance": distance,
+                "duration": duration,
+                "legs": [{"distance": d, "duration": t} for d, t in leg_totals],
+            }],
+        }
+
+    def _get(self, entries, key, now):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[-1] < now:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def _put(self, entries, key, value, now, max_entries):
+        entries[key] = value + (now + self.ttl_seconds,)
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._legs)
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """
+    Returns the RouteGeometryCache shared by every request in this worker process
+    (a new one after a fork, so a forked worker never inherits the parent's
+    state, or a lock some other thread was holding at the time).
+    """
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = RouteGeometryCache()
+                _cache_pid = pid
+    return _cache
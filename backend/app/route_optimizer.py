@@ -5,13 +5,40 @@ Main route optimization class.
 """
 import numpy as np
 import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
 from ortools.constraint_solver import routing_enums_pb2, pywrapcp
+from energy_model import joules_to_liters, route_work, work_matrix
+from exact_tsp import MAX_EXACT_STOPS, solve_held_karp
+from local_search import cheapest_insertion, solve_local_search
+from metrics import timed
+from solution_cache import SolutionCache, canonical_order, matrix_key
 
 # --- Constants for conversion ---
 METERS_PER_KM = 1000.0
 MILES_PER_KM = 0.621371
+JOULES_PER_KJ = 1000.0
+# Loads are solved in whole grams, so fractional kg demands and capacities compare exactly
+GRAMS_PER_KG = 1000
+
+# Extra seconds the portfolio waits past the time budget (or, without one, past
+# SOLVER_TIME_LIMIT) for workers to report back, and the additional allowance on
+# the first solve while worker processes start up
+PORTFOLIO_GRACE_SECONDS = 1.0
+PORTFOLIO_STARTUP_SECONDS = 15.0
+
+# Solver cost for an arc OSRM reports as unreachable (null). Large enough that any
+# reachable tour is cheaper, small enough that a full tour of them fits in int64.
+UNREACHABLE_COST = 10**9
 
 class RouteOptimizer:
+
+    # Solvers that can be chosen for routes too large for the exact solver
+    SOLVER_BACKENDS = ("ortools", "local_search", "portfolio")
+    # What the solver minimizes: road distance (meters) or truck work (energy_model, in kJ)
+    OBJECTIVES = ("distance", "energy")
     
     def __init__(self, config):
         """
@@ -21,11 +48,53 @@ class RouteOptimizer:
         logging.info("Initializing RouteOptimizer (API-Only, Distance/MPG)...")
         self.config = config
         
-        # Make the solver time limit configurable, default to 10 seconds
-        self.solver_time_limit_seconds = int(config.get("SOLVER_TIME_LIMIT", 10))
-        logging.info(f"--- Optimizer is ready (Search Strategy: GUIDED_LOCAL_SEARCH, Time Limit: {self.solver_time_limit_seconds}s) ---")
+        # Make the solver time limit configurable, default to 10 seconds.
+        # This caps any per-request time budget.
+        self.solver_time_limit_seconds = float(config.get("SOLVER_TIME_LIMIT", 10))
+
+        # Budget used when a request does not ask for one. 0 skips the metaheuristic
+        # and returns the first local optimum, which is the fastest option.
+        self.default_time_budget_ms = int(config.get("SOLVER_DEFAULT_TIME_BUDGET_MS", 0))
+
+        # Guided Local Search stops early once it has gone this fraction of its
+        # budget without improving the best tour.
+        self.stall_fraction = float(config.get("SOLVER_STALL_FRACTION", 0.25))
+
+        # Routes with at most this many stops are solved exactly (Held-Karp) instead of with OR-Tools
+        self.exact_solver_max_stops = min(int(config.get("EXACT_SOLVER_MAX_STOPS", 12)), MAX_EXACT_STOPS)
+
+        # Default backend for larger routes ("ortools" or "local_search"); requests may override it
+        self.solver_backend = config.get("SOLVER_BACKEND", "ortools")
+        if self.solver_backend not in self.SOLVER_BACKENDS:
+            raise ValueError(f"Unknown SOLVER_BACKEND '{self.solver_backend}', expected one of {self.SOLVER_BACKENDS}")
+        self.local_search_neighbors = int(config.get("LOCAL_SEARCH_NEIGHBORS", 10))
 
-    def optimize_route(self, api_response, mpg):
+        # "portfolio" races these "FIRST_SOLUTION_STRATEGY:METAHEURISTIC" pairs in worker processes
+        portfolio = config.get(
+            "SOLVER_PORTFOLIO",
+            "PATH_CHEAPEST_ARC:GUIDED_LOCAL_SEARCH,SAVINGS:GUIDED_LOCAL_SEARCH,"
+            "CHRISTOFIDES:SIMULATED_ANNEALING,PARALLEL_CHEAPEST_INSERTION:TABU_SEARCH",
+        )
+        self.portfolio = [tuple(member.strip().split(":")) for member in portfolio.split(",") if member.strip()]
+        for strategy, metaheuristic in self.portfolio:
+            getattr(routing_enums_pb2.FirstSolutionStrategy, strategy)
+            getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+        self.portfolio_workers = int(config.get("SOLVER_PORTFOLIO_WORKERS", min(len(self.portfolio), os.cpu_count() or 1)))
+        self._pool = None
+        self._pool_pid = None
+
+        # Fleet solves: weight of the longest route against total distance (0 = total distance only)
+        self.fleet_span_cost_coefficient = int(config.get("FLEET_SPAN_COST_COEFFICIENT", 1))
+        self.vehicle_capacity_kg = int(config.get("VEHICLE_CAPACITY_KG", 9000))
+        self.time_horizon_seconds = int(config.get("TIME_HORIZON_SECONDS", 24 * 3600))
+
+        # Solved tours keyed by a canonical (input-order independent) hash of the problem
+        self.solution_cache = SolutionCache(int(config.get("SOLUTION_CACHE_SIZE", 256)))
+        logging.info(f"--- Optimizer is ready (Backend: {self.solver_backend}, Max Time Limit: {self.solver_time_limit_seconds}s) ---")
+
+    def optimize_route(self, api_response, mpg, solver=None, time_budget_ms=None, solve_info=None,
+                       previous_route=None, time_windows=None, service_times=None, objective="distance",
+                       elevations=None, loads=None, on_solution=None, on_route=None):
         """
         High-level function to find the optimal route.
         
@@ -35,12 +104,39 @@ class RouteOptimizer:
         3. Solve TSP using OR-Tools RoutingModel.
         4. Calculate savings (distance/fuel) compared to original order.
         5. Return list of indices representing the optimized order.
+
+        solver optionally overrides the configured backend ("ortools", "local_search" or "portfolio").
+        time_budget_ms is the wall-clock budget for the search, capped at SOLVER_TIME_LIMIT.
+        If a solve_info dict is passed, it is filled with the strategy used, the
+        objective and the time actually spent.
+        previous_route (indices into the current stops, in the previously optimized
+        order) warm-starts the search: stops that are new are added by cheapest
+        insertion and the solver improves that tour instead of starting from scratch.
+        time_windows (one (earliest, latest) pair or None per stop, in seconds after
+        departure) and service_times (seconds spent at each stop) make the solve
+        time-constrained: travel times come from the OSRM duration matrix and the
+        OR-Tools backend is always used. The window on the depot is the latest return.
+        Arrival times are then reported in solve_info["arrivalTimes"].
+        objective "energy" minimizes the truck's work (see energy_model) instead of
+        distance, using the stop elevations (meters) and the load carried out of
+        each stop (kg) when given; the route's work is reported in solve_info["energyKJ"].
+        on_solution(route_indices, objective, elapsed_ms) is called for every
+        improving tour the OR-Tools search finds, before the final result.
+        Milliseconds spent per stage (matrix_build, model_build, search, extraction,
+        cost_analysis) are reported in solve_info["timings"].
+        on_route(route_indices) is called as soon as the final tour is known, before
+        the cost analysis, so the caller can start fetching its geometry.
         """
+        if solve_info is None:
+            solve_info = {}
+        timings = solve_info.setdefault("timings", {})
+        matrix_start = time.perf_counter()
         try:
             # 1. Extract all data from the API response
             stops_list = api_response['sources']
             location_names = [loc['name'] for loc in stops_list]
-            distance_matrix_meters = api_response['distances'] 
+            locations = [loc.get('location') for loc in stops_list]
+            distance_matrix_meters = self._parse_matrix(api_response['distances'])
             index_to_location_name = location_names
 
         except KeyError as e:
@@ -50,136 +146,756 @@ class RouteOptimizer:
             logging.error(f"Error: Invalid 'mpg' value. Must be a number.")
             return None
         
-        if len(index_to_location_name) <= 2:
-            logging.info("Route has 2 or fewer stops. No optimization needed.")
+        if len(index_to_location_name) <= 2 and time_windows is None and service_times is None:
+            logging.debug("Route has 2 or fewer stops. No optimization needed.")
             # Return indices for a simple round trip: 0 -> 1 -> 0
             return self._get_original_route_indices(len(index_to_location_name))
 
-        # 2. Format the matrix for the OR-Tools solver (using METERS as cost)
-        tsp_data = self._format_tsp_for_distance(distance_matrix_meters)
+        # 2. Format the matrix for the OR-Tools solver (using METERS, or kJ of work, as cost)
+        work_joules = None
+        if objective == "energy":
+            try:
+                durations = self._parse_matrix(api_response['durations'])
+            except KeyError as e:
+                logging.error(f"Error: API response missing required key: {e}")
+                return None
+            work_joules = work_matrix(distance_matrix_meters, durations, elevations, loads)
+            tsp_data = self._format_tsp_for_energy(work_joules)
+        else:
+            tsp_data = self._format_tsp_for_distance(distance_matrix_meters)
+        if time_windows is not None or service_times is not None:
+            try:
+                self._add_time_data(tsp_data, api_response, time_windows, service_times)
+            except KeyError as e:
+                logging.error(f"Error: API response missing required key: {e}")
+                return None
+        if previous_route is not None:
+            tsp_data["initial_route"] = cheapest_insertion(
+                tsp_data["cost_matrix"], previous_route, tsp_data["depot"]
+            )
         
         # 3. Solve the TSP (based on METERS)
-        opt_route_indices = self._solve_tsp(tsp_data, index_to_location_name)
+        budget_ms = self._resolve_time_budget_ms(time_budget_ms)
+        perm = canonical_order(tsp_data["cost_matrix"], locations, tsp_data["depot"])
+        backend = solver or self.solver_backend
+        # Each backend caches its own tours, so solverInfo always describes the backend asked for
+        cache_extra = f"backend={backend};"
+        if "time_windows" in tsp_data:
+            # Same stops with different windows are a different problem
+            cache_extra += repr([(tsp_data["time_windows"][i], tsp_data["service_times"][i]) for i in perm])
+        cache_key = matrix_key(tsp_data["cost_matrix"], perm, cache_extra)
+        timings["matrix_build"] = round((time.perf_counter() - matrix_start) * 1000, 1)
+        cached = self.solution_cache.get(cache_key, perm, budget_ms)
+
+        if cached:
+            opt_route_indices, cached_info = cached
+            solve_info.update(cached_info)
+            solve_info.update(cacheHit=True, timeBudgetMs=budget_ms, timeUsedMs=0.0)
+            logging.debug("Solution cache hit; skipping the solver.")
+            self._log_route(opt_route_indices, index_to_location_name)
+        else:
+            opt_route_indices = self._solve(
+                tsp_data, index_to_location_name, backend, budget_ms, solve_info,
+                on_solution=on_solution,
+            )
+            solve_info["cacheHit"] = False
+            if opt_route_indices:
+                # Timings describe this run only, not the cached solution
+                cached_info = {k: v for k, v in solve_info.items() if k != "timings"}
+                self.solution_cache.put(
+                    cache_key, perm, opt_route_indices, solve_info.get("objective", 0), budget_ms, cached_info
+                )
         
         if not opt_route_indices:
             logging.warning("Solver failed to find a solution.")
             return None
+        if on_route is not None:
+            on_route(opt_route_indices)
 
         # 4. Calculate and print all cost comparisons
-        logging.info("\n--- Cost Analysis (Distance & Fuel) ---")
-        self._calculate_and_print_costs(opt_route_indices, index_to_location_name, distance_matrix_meters, mpg)
+        with timed(timings, "cost_analysis"):
+            logging.debug("\n--- Cost Analysis (Distance & Fuel) ---")
+            self._calculate_and_print_costs(opt_route_indices, index_to_location_name, distance_matrix_meters, mpg)
+            if work_joules is not None:
+                solve_info["energyKJ"] = round(self._calculate_and_print_energy(opt_route_indices, work_joules), 1)
         
         # 5. Return the optimized route indices
         return opt_route_indices
 
+    def optimize_fleet(self, api_response, vehicles, time_budget_ms=None, solve_info=None,
+                       balance_coefficient=None, demands=None, capacities=None, unload_stop=None,
+                       time_windows=None, service_times=None):
+        """
+        Plans routes for several vehicles sharing one stop list in a single solve.
+
+        vehicles is a list of (start_index, end_index) pairs, one per vehicle, indexing
+        into the stops of the OSRM response. Every stop that is not a start/end depot
+        is visited by exactly one vehicle. balance_coefficient (default
+        FLEET_SPAN_COST_COEFFICIENT) weights the longest route against total distance;
+        0 minimizes total fleet distance only.
+
+        Capacity (optional): demands gives the load in kg collected at each stop and
+        capacities the payload of each vehicle (default VEHICLE_CAPACITY_KG). If
+        unload_stop is given, vehicles may empty their load there mid-route (as often
+        as needed) and must arrive empty at their end depot, so the route includes
+        the final trip to unload. Demand at start/end depots (and at the unload stop)
+        is ignored.
+
+        Time (optional): time_windows and service_times work as in optimize_route,
+        with every vehicle departing at time 0; arrival times per vehicle are put
+        in solve_info["arrivalTimes"].
+
+        Returns a list with one route (list of stop indices from start to end) per
+        vehicle, or None if no solution was found.
+        """
+        try:
+            index_to_location_name = [loc['name'] for loc in api_response['sources']]
+            distance_matrix_meters = self._parse_matrix(api_response['distances'])
+        except KeyError as e:
+            logging.error(f"Error: API response missing required key: {e}")
+            return None
+
+        if solve_info is None:
+            solve_info = {}
+        if balance_coefficient is None:
+            balance_coefficient = self.fleet_span_cost_coefficient
+
+        data = self._format_tsp_for_distance(distance_matrix_meters)
+        data.update(
+            num_vehicles=len(vehicles),
+            starts=[int(start) for start, _ in vehicles],
+            ends=[int(end) for _, end in vehicles],
+            balance_coefficient=int(balance_coefficient),
+        )
+        if demands is not None:
+            if capacities is None:
+                capacities = [self.vehicle_capacity_kg] * len(vehicles)
+            data.update(
+                demands=[int(round(d * GRAMS_PER_KG)) for d in demands],
+                capacities=[int(round(c * GRAMS_PER_KG)) for c in capacities],
+                unload_stop=unload_stop,
+            )
+        if time_windows is not None or service_times is not None:
+            try:
+                self._add_time_data(data, api_response, time_windows, service_times)
+            except KeyError as e:
+                logging.error(f"Error: API response missing required key: {e}")
+                return None
+
+        budget_ms = self._resolve_time_budget_ms(time_budget_ms)
+        start = time.perf_counter()
+        routes = self._solve_vrp(data, index_to_location_name, budget_ms, solve_info)
+        solve_info.update(timeBudgetMs=budget_ms, timeUsedMs=round((time.perf_counter() - start) * 1000, 1))
+
+        if not routes:
+            logging.warning("Fleet solver failed to find a solution.")
+            return None
+
+        logging.debug("\n--- Fleet Distance Analysis ---")
+        for v, route in enumerate(routes):
+            load = f", {sum(data['demands'][i] for i in route) / GRAMS_PER_KG:g} kg collected" if demands is not None else ""
+            logging.debug(f"Vehicle {v}: {len(route) - 2} stops, {self._get_route_cost_km(route, distance_matrix_meters):.2f} km{load}")
+        total_km = sum(self._get_route_cost_km(route, distance_matrix_meters) for route in routes)
+        logging.debug(f"Total Fleet Distance: {total_km:.2f} km")
+        return routes
+
+    def _parse_matrix(self, matrix):
+        """
+        Converts an OSRM matrix (nested lists, possibly containing null for
+        unreachable pairs) into a float NumPy array with NaN for those cells.
+        """
+        return np.array(matrix, dtype=float)
+
     def _format_tsp_for_distance(self, distance_matrix_meters):
         """
         Converts the distance matrix (in meters) into an integer
         cost matrix for the OR-Tools solver.
         """
-        num_locations = len(distance_matrix_meters)
-        cost_matrix = np.zeros((num_locations, num_locations), dtype=int)
-
-        for i in range(num_locations):
-            for j in range(num_locations):
-                if i == j:
-                    continue
-                # Use the raw meter value, rounded to the nearest integer
-                cost = distance_matrix_meters[i][j]
-                cost_matrix[i, j] = int(round(cost))
-                    
+        distances = np.asarray(distance_matrix_meters, dtype=float)
+        # Use the raw meter value, rounded to the nearest integer
+        cost_matrix = np.rint(np.nan_to_num(distances, nan=UNREACHABLE_COST)).astype(np.int64)
+        np.fill_diagonal(cost_matrix, 0)
+
         return {
-            "cost_matrix": cost_matrix.tolist(),
+            "cost_matrix": cost_matrix,
             "num_vehicles": 1,
             "depot": 0  # Assumes the depot is always the first stop in the list
         }
 
-    def _solve_tsp(self, data, index_to_location_name):
+    def _format_tsp_for_energy(self, work_joules):
+        """
+        Converts the work matrix (in joules) into an integer cost matrix in kJ,
+        which keeps tour totals far below UNREACHABLE_COST.
+        """
+        work_kj = np.asarray(work_joules, dtype=float) / JOULES_PER_KJ
+        cost_matrix = np.rint(np.nan_to_num(work_kj, nan=UNREACHABLE_COST)).astype(np.int64)
+        np.fill_diagonal(cost_matrix, 0)
+
+        return {
+            "cost_matrix": cost_matrix,
+            "num_vehicles": 1,
+            "depot": 0
+        }
+
+    def _add_time_data(self, data, api_response, time_windows, service_times):
+        """
+        Adds the integer duration matrix (seconds), the time windows and the
+        service times to the solver data. Raises KeyError if the OSRM response has no durations.
+        """
+        n = len(data["cost_matrix"])
+        durations = self._parse_matrix(api_response["durations"])
+        durations = np.rint(np.nan_to_num(durations, nan=UNREACHABLE_COST)).astype(np.int64)
+        np.fill_diagonal(durations, 0)
+        data.update(
+            durations=durations,
+            time_windows=[tuple(w) if w is not None else None for w in (time_windows or [None] * n)],
+            service_times=[int(round(t)) for t in (service_times or [0] * n)],
+        )
+
+    def _resolve_time_budget_ms(self, time_budget_ms):
+        """ Applies the server default and the SOLVER_TIME_LIMIT cap to a requested budget. """
+        if time_budget_ms is None:
+            time_budget_ms = self.default_time_budget_ms
+        cap_ms = int(self.solver_time_limit_seconds * 1000)
+        return max(0, min(int(time_budget_ms), cap_ms))
+
+    def _solve(self, data, index_to_location_name, solver, time_budget_ms, solve_info, on_solution=None):
+        """
+        Picks a solver for the instance: small routes are solved exactly,
+        everything else goes to the requested backend.
+        Only the single-process OR-Tools search reports intermediate tours to on_solution.
+        """
+        start = time.perf_counter()
+        solve_info["timeBudgetMs"] = time_budget_ms
+        solve_info["warmStart"] = data.get("initial_route") is not None
+
+        if "time_windows" in data:
+            # Only the RoutingModel can enforce time windows
+            route_indices = self._solve_time_windows(data, index_to_location_name, time_budget_ms, solve_info)
+        elif len(data["cost_matrix"]) <= self.exact_solver_max_stops:
+            route_indices = self._solve_exact(data, index_to_location_name, solve_info)
+        elif solver == "local_search":
+            route_indices = self._solve_local_search(data, index_to_location_name, time_budget_ms, solve_info)
+        elif solver == "portfolio":
+            route_indices = self._solve_portfolio(data, index_to_location_name, time_budget_ms, solve_info)
+        else:
+            route_indices = self._solve_tsp(
+                data, index_to_location_name, time_budget_ms, solve_info, on_solution=on_solution
+            )
+
+        solve_info["timeUsedMs"] = round((time.perf_counter() - start) * 1000, 1)
+        logging.debug(
+            f"Solved with {solve_info.get('backend')} ({solve_info.get('strategy')}, "
+            f"{solve_info.get('metaheuristic')}) in {solve_info['timeUsedMs']} ms "
+            f"of a {time_budget_ms} ms budget"
+        )
+        return route_indices
+
+    def _solve_time_windows(self, data, index_to_location_name, time_budget_ms, solve_info):
+        """
+        Solves a single-vehicle route with time windows as a one-vehicle VRP.
+        Returns the route indices (empty if no route meets the windows).
+        """
+        data = dict(data, num_vehicles=1, starts=[data["depot"]], ends=[data["depot"]], balance_coefficient=0)
+        solve_info["warmStart"] = False
+        routes = self._solve_vrp(data, index_to_location_name, time_budget_ms, solve_info)
+        if not routes:
+            return []
+        solve_info["arrivalTimes"] = solve_info["arrivalTimes"][0]
+        return routes[0]
+
+    def _solve_exact(self, data, index_to_location_name, solve_info):
+        """
+        Solves the TSP to proven optimality with Held-Karp dynamic programming.
+        Only used for small routes, where it is much faster than building a RoutingModel.
+        """
+        logging.debug(f"\nSolving TSP exactly with Held-Karp ({len(data['cost_matrix'])} stops)...")
+        with timed(solve_info.setdefault("timings", {}), "search"):
+            route_indices, obj_meters = solve_held_karp(data["cost_matrix"], data["depot"])
+        solve_info.update(backend="exact", strategy="HELD_KARP", metaheuristic="NONE", objective=obj_meters)
+
+        logging.debug("\n--- Distance Optimization Results ---")
+        logging.debug(f"Solver objective value (Total Distance): {obj_meters / METERS_PER_KM:.2f} km")
+        self._log_route(route_indices, index_to_location_name)
+        return route_indices
+
+    def _solve_local_search(self, data, index_to_location_name, time_budget_ms, solve_info):
+        """
+        Solves the TSP with the NumPy 2-opt/Or-opt local search.
+        No RoutingModel is built, which keeps latency and memory low for mid-sized routes.
+        """
+        logging.debug(f"\nSolving TSP with 2-opt/Or-opt local search ({len(data['cost_matrix'])} stops)...")
+        with timed(solve_info.setdefault("timings", {}), "search"):
+            route_indices, obj_meters = solve_local_search(
+                data["cost_matrix"], data["depot"],
+                neighbors=self.local_search_neighbors,
+                time_limit_seconds=(time_budget_ms or self.solver_time_limit_seconds * 1000) / 1000,
+                initial_tour=data.get("initial_route"),
+            )
+        solve_info.update(
+            backend="local_search",
+            strategy="WARM_START" if data.get("initial_route") else "NEAREST_NEIGHBOR",
+            metaheuristic="TWO_OPT_OR_OPT",
+            objective=obj_meters,
+        )
+
+        logging.debug("\n--- Distance Optimization Results ---")
+        logging.debug(f"Solver objective value (Total Distance): {obj_meters / METERS_PER_KM:.2f} km")
+        self._log_route(route_indices, index_to_location_name)
+        return route_indices
+
+    def _solve_portfolio(self, data, index_to_location_name, time_budget_ms, solve_info):
+        """
+        Races every configured strategy/metaheuristic pair in the process pool under
+        the same time budget and keeps the lowest-cost tour. Members that have not
+        reported back shortly after the budget (or, without one, after the
+        SOLVER_TIME_LIMIT cap that bounds their greedy descent) are ignored: those
+        not started yet are cancelled (or skip themselves once they see the deadline
+        has passed), and running ones finish their bounded search on their own.
+        If none reported, a single OR-Tools solve is run instead.
+        A warm-start tour goes to the first member only, so the others still race
+        their own first-solution strategies.
+        """
+        logging.debug(f"\nSolving TSP with a portfolio of {len(self.portfolio)} configurations...")
+        search_start = time.perf_counter()
+        try:
+            cold_start = self._pool is None or self._pool_pid != os.getpid()
+            pool = self._get_process_pool()
+            timeout = (time_budget_ms or self.solver_time_limit_seconds * 1000) / 1000 + PORTFOLIO_GRACE_SECONDS
+            if cold_start:
+                timeout += PORTFOLIO_STARTUP_SECONDS
+            deadline = time.time() + timeout
+            cold_data = {key: value for key, value in data.items() if key != "initial_route"}
+            futures = {
+                pool.submit(
+                    _solve_portfolio_member, self._worker_config(), data if k == 0 else cold_data,
+                    time_budget_ms, strategy, metaheuristic, deadline,
+                ): (strategy, metaheuristic)
+                for k, (strategy, metaheuristic) in enumerate(self.portfolio)
+            }
+            done, not_done = wait(futures, timeout=timeout)
+            timings = solve_info.setdefault("timings", {})
+            timings["search"] = round((time.perf_counter() - search_start) * 1000, 1)
+        except Exception as e:
+            logging.warning(f"Portfolio solve failed ({e}); falling back to a single OR-Tools solve.")
+            return self._solve_tsp(data, index_to_location_name, time_budget_ms, solve_info)
+
+        # Only this request's own futures are touched: the pool also serves other requests' portfolios
+        still_running = [future for future in not_done if not future.cancel()]
+        if still_running:
+            logging.warning(f"{len(still_running)} portfolio member(s) overran the time budget; ignoring their results.")
+
+        candidates = []
+        best_route, best_info = [], None
+        for future in done:
+            strategy, metaheuristic = futures[future]
+            try:
+                route_indices, member_info = future.result()
+            except Exception as e:
+                logging.warning(f"Portfolio member {strategy}/{metaheuristic} failed: {e}")
+                continue
+            candidates.append({k: member_info.get(k) for k in ("strategy", "metaheuristic", "objective")})
+            if route_indices and (best_info is None or member_info["objective"] < best_info["objective"]):
+                best_route, best_info = route_indices, member_info
+
+        if best_info is None:
+            logging.warning("No portfolio member returned a solution; falling back to a single OR-Tools solve.")
+            return self._solve_tsp(data, index_to_location_name, time_budget_ms, solve_info)
+
+        # The winner's own stage timings ran inside the portfolio's search
+        best_info.pop("timings", None)
+        solve_info.update(best_info)
+        solve_info.update(backend="portfolio", candidates=candidates)
+        logging.debug(f"Portfolio winner: {best_info['strategy']}/{best_info['metaheuristic']}")
+        logging.debug("\n--- Distance Optimization Results ---")
+        logging.debug(f"Solver objective value (Total Distance): {best_info['objective'] / METERS_PER_KM:.2f} km")
+        self._log_route(best_route, index_to_location_name)
+        return best_route
+
+    def _worker_config(self):
+        """ The subset of settings a portfolio worker needs to rebuild an equivalent optimizer. """
+        return {
+            "SOLVER_TIME_LIMIT": self.solver_time_limit_seconds,
+            "SOLVER_STALL_FRACTION": self.stall_fraction,
+        }
+
+    def _get_process_pool(self):
+        """
+        Returns this process's portfolio worker pool, creating it on first use.
+        Workers are spawned rather than forked so they never inherit a gunicorn
+        worker's threads or sockets.
+        """
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.portfolio_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _solve_tsp(self, data, index_to_location_name, time_budget_ms, solve_info,
+                   first_solution_strategy="PATH_CHEAPEST_ARC", metaheuristic="GUIDED_LOCAL_SEARCH",
+                   on_solution=None):
         """
         Runs the Google OR-Tools TSP solver.
         Returns the optimized route indices.
         
         This uses a RoutingModel which is a specialized solver for vehicle routing problems.
         It attempts to minimize the total cost (distance) of visiting all nodes and returning to start.
+
+        With a time budget, the metaheuristic (Guided Local Search by default) keeps
+        improving the tour until the budget runs out or it stalls; without one,
+        the first local optimum is returned. Each improving tour is passed to
+        on_solution(route_indices, objective, elapsed_ms) as it is found.
         """
+        timings = solve_info.setdefault("timings", {})
+        model_start = time.perf_counter()
         manager = pywrapcp.RoutingIndexManager(
             len(data["cost_matrix"]), data["num_vehicles"], data["depot"]
         )
         routing = pywrapcp.RoutingModel(manager)
 
-        def distance_callback(from_index, to_index):
-            """Returns the distance (cost) between two nodes."""
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data["cost_matrix"][from_node][to_node]
-
-        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+        transit_callback_index = self._register_cost_matrix(manager, routing, data["cost_matrix"])
         routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        
-        # Set a good first solution strategy to give the local search a good starting point
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        search_parameters, metaheuristic, stall_monitor = self._make_search_parameters(
+            routing, first_solution_strategy, metaheuristic, time_budget_ms
         )
+        if on_solution is not None:
+            routing.AddAtSolutionCallback(_SolutionReporter(routing, manager, on_solution))
         
-        # --- Set the Guided Local Search strategy ---
-        # This is a more advanced metaheuristic that allows the solver
-        # to escape local minima and find a better global solution.
-        # search_parameters.local_search_metaheuristic = (
-        #     routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-        # )
-        
-        # --- Set the time limit ---
-        # This strategy *requires* a time limit to know when to stop.
-        # We use the value set in the __init__ method.
-        # search_parameters.time_limit.seconds = self.solver_time_limit_seconds
-        
-        # Uncomment this to see the solver's log
-        # search_parameters.log_search = True
-        
-        logging.info(f"\nSolving TSP with GUIDED_LOCAL_SEARCH (Time limit: {self.solver_time_limit_seconds}s)...")
-        solution = routing.SolveWithParameters(search_parameters)
+        logging.debug(f"\nSolving TSP with {metaheuristic} (Time budget: {time_budget_ms} ms)...")
+        initial_route = data.get("initial_route")
+        if initial_route:
+            # Warm start: improve the given tour instead of building a first solution
+            routing.CloseModelWithParameters(search_parameters)
+            initial_assignment = routing.ReadAssignmentFromRoutes([initial_route[1:-1]], True)
+            timings["model_build"] = round((time.perf_counter() - model_start) * 1000, 1)
+            with timed(timings, "search"):
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+            first_solution_strategy = "WARM_START"
+        else:
+            # The model is closed (and its constraints built) when the search starts
+            timings["model_build"] = round((time.perf_counter() - model_start) * 1000, 1)
+            with timed(timings, "search"):
+                solution = routing.SolveWithParameters(search_parameters)
+
+        solve_info.update(
+            backend="ortools", strategy=first_solution_strategy, metaheuristic=metaheuristic,
+            stoppedEarly=bool(stall_monitor and stall_monitor.stopped),
+            solutions=routing.solver().Solutions(),
+        )
 
         if solution:
-            logging.info("\n--- Distance Optimization Results ---")
+            logging.debug("\n--- Distance Optimization Results ---")
             obj_meters = solution.ObjectiveValue()
             obj_km = obj_meters / METERS_PER_KM
-            logging.info(f"Solver objective value (Total Distance): {obj_km:.2f} km")
-            
-            return self._get_route_from_solution(manager, routing, solution, index_to_location_name)
+            logging.debug(f"Solver objective value (Total Distance): {obj_km:.2f} km")
+            solve_info["objective"] = obj_meters
+
+            with timed(timings, "extraction"):
+                return self._get_route_from_solution(manager, routing, solution, index_to_location_name)
         else:
             logging.warning("No solution found!")
             return []
 
+    def _solve_vrp(self, data, index_to_location_name, time_budget_ms, solve_info,
+                   first_solution_strategy=None, metaheuristic="GUIDED_LOCAL_SEARCH"):
+        """
+        Runs the OR-Tools solver for several vehicles with their own start/end depots.
+        Returns one list of route indices per vehicle.
+        """
+        if first_solution_strategy is None:
+            first_solution_strategy = "PATH_CHEAPEST_ARC"
+            if "demands" in data or "time_windows" in data:
+                # Greedy path extension can't plan ahead for unload trips, capacity
+                # or time windows and often finds no first solution; insertion can
+                first_solution_strategy = "PARALLEL_CHEAPEST_INSERTION"
+        timings = solve_info.setdefault("timings", {})
+        model_start = time.perf_counter()
+        num_stops = len(data["cost_matrix"])
+        node_to_stop = list(range(num_stops))
+        unload_copies = []
+        if "demands" in data and data["unload_stop"] is not None:
+            # One optional node per possible unload trip, each a copy of the unload stop
+            node_to_stop, unload_copies = self._add_unload_copies(data)
+        cost_matrix = self._expand_matrix(data["cost_matrix"], node_to_stop, num_stops)
+
+        manager = pywrapcp.RoutingIndexManager(
+            len(cost_matrix), data["num_vehicles"], data["starts"], data["ends"]
+        )
+        routing = pywrapcp.RoutingModel(manager)
+
+        transit_callback_index = self._register_cost_matrix(manager, routing, cost_matrix)
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+        if data["balance_coefficient"] > 0:
+            # Track each vehicle's distance so the longest route can be penalized
+            routing.AddDimension(transit_callback_index, 0, np.iinfo(np.int64).max // 4, True, "Distance")
+            routing.GetDimensionOrDie("Distance").SetGlobalSpanCostCoefficient(data["balance_coefficient"])
+
+        if "demands" in data:
+            self._add_capacity_dimension(data, manager, routing, len(cost_matrix), unload_copies)
+
+        time_dimension = None
+        if "time_windows" in data:
+            time_dimension = self._add_time_dimension(data, manager, routing, node_to_stop)
+
+        search_parameters, metaheuristic, stall_monitor = self._make_search_parameters(
+            routing, first_solution_strategy, metaheuristic, time_budget_ms
+        )
+
+        logging.debug(
+            f"\nSolving VRP for {data['num_vehicles']} vehicles with {metaheuristic} "
+            f"(Time budget: {time_budget_ms} ms)..."
+        )
+        timings["model_build"] = round((time.perf_counter() - model_start) * 1000, 1)
+        with timed(timings, "search"):
+            solution = routing.SolveWithParameters(search_parameters)
+
+        solve_info.update(
+            backend="ortools", strategy=first_solution_strategy, metaheuristic=metaheuristic,
+            stoppedEarly=bool(stall_monitor and stall_monitor.stopped),
+            solutions=routing.solver().Solutions(),
+        )
+        if not solution:
+            logging.warning("No solution found!")
+            return []
+
+        extraction_start = time.perf_counter()
+        solve_info["objective"] = solution.ObjectiveValue()
+        routes = []
+        arrival_times = []
+        for vehicle in range(data["num_vehicles"]):
+            index = routing.Start(vehicle)
+            visits = []
+            while True:
+                # Earliest arrival (seconds after departure) that keeps the rest of the route feasible
+                arrival = solution.Min(time_dimension.CumulVar(index)) if time_dimension else None
+                visits.append((node_to_stop[manager.IndexToNode(index)], arrival))
+                if routing.IsEnd(index):
+                    break
+                index = solution.Value(routing.NextVar(index))
+            # Back-to-back visits to the unload stop (free moves between its copies) are one visit
+            visits = [
+                visit for k, visit in enumerate(visits)
+                if k == 0 or visit[0] != visits[k - 1][0] or visit[0] != data.get("unload_stop")
+            ]
+            route_indices = [stop for stop, _ in visits]
+            self._log_route(route_indices, index_to_location_name)
+            routes.append(route_indices)
+            arrival_times.append([arrival for _, arrival in visits])
+        if time_dimension:
+            solve_info["arrivalTimes"] = arrival_times
+        timings["extraction"] = round((time.perf_counter() - extraction_start) * 1000, 1)
+        return routes
+
+    def _add_unload_copies(self, data):
+        """
+        Adds solver nodes copying the unload stop, enough for every vehicle to
+        unload once plus one extra trip per full load of total demand.
+        Returns (node_to_stop, unload_nodes): the stop index behind each solver node
+        (copies come after the original stops), and the nodes where a vehicle can
+        unload; the unload stop itself is one unless it is some vehicle's start or end.
+        """
+        unload = data["unload_stop"]
+        total_demand = sum(data["demands"])
+        smallest = max(1, min(data["capacities"]))
+        num_copies = data["num_vehicles"] + -(-total_demand // smallest)
+
+        n = len(data["cost_matrix"])
+        node_to_stop = list(range(n)) + [unload] * num_copies
+        unload_nodes = list(range(n, n + num_copies))
+        if unload not in data["starts"] and unload not in data["ends"]:
+            unload_nodes.append(unload)
+        return node_to_stop, unload_nodes
+
+    def _expand_matrix(self, matrix, node_to_stop, num_stops):
+        """
+        Returns the stop matrix indexed by solver node. Moving between copies of
+        the same stop (nodes past num_stops and the stop they copy) costs nothing.
+        """
+        if len(node_to_stop) == num_stops:
+            return matrix
+        matrix = matrix[np.ix_(node_to_stop, node_to_stop)]
+        for copied in set(node_to_stop[num_stops:]):
+            same = np.array([i for i, stop in enumerate(node_to_stop) if stop == copied])
+            matrix[np.ix_(same, same)] = 0
+        return matrix
+
+    def _add_time_dimension(self, data, manager, routing, node_to_stop):
+        """
+        Adds a "Time" dimension: travel time from the OSRM duration matrix plus the
+        service time at the stop being left. Each vehicle leaves at time 0 and may
+        wait before a stop whose window has not opened yet. A window on a vehicle's
+        end depot is the latest time it must be back.
+        Returns the dimension.
+        """
+        num_stops = len(data["cost_matrix"])
+        service = np.asarray(data["service_times"], dtype=np.int64)[node_to_stop]
+        durations = self._expand_matrix(data["durations"], node_to_stop, num_stops)
+        # Registered natively like the cost matrix, so the search never calls back into Python for it
+        time_callback_index = self._register_cost_matrix(manager, routing, durations + service[:, None])
+        horizon = self.time_horizon_seconds
+        routing.AddDimension(time_callback_index, horizon, horizon, True, "Time")
+        time_dimension = routing.GetDimensionOrDie("Time")
+
+        depots = set(data["starts"]) | set(data["ends"])
+        for node, stop in enumerate(node_to_stop):
+            window = data["time_windows"][stop]
+            if window is None or node in depots:
+                continue
+            time_dimension.CumulVar(manager.NodeToIndex(node)).SetRange(int(window[0]), int(window[1]))
+        for vehicle in range(data["num_vehicles"]):
+            window = data["time_windows"][data["ends"][vehicle]]
+            if window is not None:
+                time_dimension.CumulVar(routing.End(vehicle)).SetMax(int(window[1]))
+            # Report the earliest feasible times rather than arbitrary ones within the slack
+            routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(routing.End(vehicle)))
+        return time_dimension
+
+    def _add_capacity_dimension(self, data, manager, routing, num_nodes, unload_nodes):
+        """
+        Adds a "Load" dimension: the load grows by each stop's demand and may not
+        exceed the vehicle's capacity. Unload nodes are optional visits that drop
+        any amount of load (the dimension's slack absorbs how much), and when an
+        unload stop exists every vehicle must reach its end depot empty.
+        """
+        max_capacity = max(data["capacities"])
+        demands = np.zeros(num_nodes, dtype=np.int64)
+        demands[:len(data["demands"])] = data["demands"]
+        demands[unload_nodes] = -max_capacity
+        for depot in data["starts"] + data["ends"]:
+            demands[depot] = 0
+        demand_callback_index = self._register_demands(manager, routing, demands)
+        routing.AddDimensionWithVehicleCapacity(
+            demand_callback_index,
+            max_capacity if unload_nodes else 0,  # slack: how much of a drop-off is "unused"
+            data["capacities"],
+            True,  # start each vehicle empty
+            "Load",
+        )
+        if not unload_nodes:
+            return
+
+        load_dimension = routing.GetDimensionOrDie("Load")
+        unload_set = set(unload_nodes)
+        for node in range(num_nodes):
+            if node in data["starts"] or node in data["ends"]:
+                continue
+            index = manager.NodeToIndex(node)
+            if node in unload_set:
+                routing.AddDisjunction([index], 0)
+            else:
+                load_dimension.SlackVar(index).SetValue(0)
+
+        for vehicle in range(data["num_vehicles"]):
+            load_dimension.SlackVar(routing.Start(vehicle)).SetValue(0)
+            # The end depot is the unload stop itself: arriving there unloads the truck
+            if data["ends"][vehicle] != data["unload_stop"]:
+                load_dimension.CumulVar(routing.End(vehicle)).SetMax(0)
+
+    def _make_search_parameters(self, routing, first_solution_strategy, metaheuristic, time_budget_ms):
+        """
+        Builds the OR-Tools search parameters shared by the TSP and fleet solvers.
+        Returns (search_parameters, metaheuristic_used, stall_monitor_or_None).
+        """
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        
+        # Set a good first solution strategy to give the local search a good starting point
+        search_parameters.first_solution_strategy = getattr(
+            routing_enums_pb2.FirstSolutionStrategy, first_solution_strategy
+        )
+        stall_monitor = None
+
+        if time_budget_ms <= 0:
+            metaheuristic = "GREEDY_DESCENT"
+            # Greedy descent stops by itself, but finding a first solution under side
+            # constraints can take arbitrarily long; never exceed the hard cap
+            search_parameters.time_limit.FromMilliseconds(int(self.solver_time_limit_seconds * 1000))
+        else:
+            # --- Set the metaheuristic (Guided Local Search by default) ---
+            # This allows the solver to escape local minima and find a
+            # better global solution.
+            search_parameters.local_search_metaheuristic = getattr(
+                routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic
+            )
+
+            # --- Set the time limit ---
+            # This strategy *requires* a time limit to know when to stop.
+            search_parameters.time_limit.FromMilliseconds(time_budget_ms)
+            stall_monitor = _StallMonitor(routing, time_budget_ms * self.stall_fraction / 1000)
+            routing.AddAtSolutionCallback(stall_monitor)
+        
+        # Uncomment this to see the solver's log
+        # search_parameters.log_search = True
+        return search_parameters, metaheuristic, stall_monitor
+
+    def _register_cost_matrix(self, manager, routing, cost_matrix):
+        """
+        Registers an integer (node x node) cost matrix as a transit evaluator.
+
+        RegisterTransitMatrix hands the matrix to OR-Tools' C++ side, so arc costs
+        are looked up natively during local search instead of calling back into
+        Python millions of times. Older OR-Tools releases without it fall back to
+        the Python callback.
+        """
+        if hasattr(routing, "RegisterTransitMatrix"):
+            # The SWIG binding takes nested Python lists, not an ndarray
+            return routing.RegisterTransitMatrix(cost_matrix.tolist())
+
+        def distance_callback(from_index, to_index):
+            """Returns the distance (cost) between two nodes."""
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            return int(cost_matrix[from_node, to_node])
+
+        return routing.RegisterTransitCallback(distance_callback)
+
+    def _register_demands(self, manager, routing, demands):
+        """
+        Registers an integer per-node demand vector as a unary transit evaluator,
+        natively (RegisterUnaryTransitVector) like _register_cost_matrix when this
+        OR-Tools release has it, else through a Python callback.
+        """
+        demands = demands.tolist()
+        if hasattr(routing, "RegisterUnaryTransitVector"):
+            return routing.RegisterUnaryTransitVector(demands)
+
+        def demand_callback(from_index):
+            return demands[manager.IndexToNode(from_index)]
+
+        return routing.RegisterUnaryTransitCallback(demand_callback)
+
     def _get_route_from_solution(self, manager, routing, solution, index_to_location_name):
         """ Extracts the route indices from the solver. """
         index = routing.Start(0)
-        plan_output = "Optimized Route (by distance):\n"
         route_indices = []
         
         while not routing.IsEnd(index):
-            node_index = manager.IndexToNode(index)
-            route_indices.append(node_index)
-            plan_output += f" {index_to_location_name[node_index]} ->"
+            route_indices.append(manager.IndexToNode(index))
             index = solution.Value(routing.NextVar(index))
             
-        node_index = manager.IndexToNode(index) # Add final depot
-        route_indices.append(node_index)
-        plan_output += f" {index_to_location_name[node_index]}\n"
+        route_indices.append(manager.IndexToNode(index)) # Add final depot
         
-        logging.info(plan_output)
+        self._log_route(route_indices, index_to_location_name)
         return route_indices
 
+    def _log_route(self, route_indices, index_to_location_name):
+        """ Logs the route as 'A -> B -> ... -> A' using the stop names (only built at DEBUG level). """
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
+        names = " -> ".join(str(index_to_location_name[i]) for i in route_indices)
+        logging.debug(f"Optimized Route (by distance):\n {names}\n")
+
     def _get_route_cost_km(self, route_indices, distance_matrix_meters):
         """ Calculates the total distance (in km) for a given route. """
-        total_meters = 0
-        for i in range(len(route_indices) - 1):
-            start_idx = route_indices[i]
-            end_idx = route_indices[i+1]
-            total_meters += distance_matrix_meters[start_idx][end_idx]
+        route = np.asarray(route_indices, dtype=np.intp)
+        if len(route) < 2:
+            return 0.0
+        total_meters = distance_matrix_meters[route[:-1], route[1:]].sum()
         # Convert total meters to kilometers
-        return total_meters / METERS_PER_KM
+        return float(total_meters) / METERS_PER_KM
     
     def _get_original_route_indices(self, num_locations):
         """ Generates a simple sequential route (0, 1, ..., n-1, 0). """
@@ -189,11 +905,29 @@ class RouteOptimizer:
         og_route.append(0)  # Return to depot
         return og_route
 
+    def _calculate_and_print_energy(self, opt_route_indices, work_joules):
+        """
+        Logs the truck's work (kJ and diesel-equivalent liters) for the original
+        vs. optimized routes. Returns the optimized route's work in kJ.
+        """
+        original_joules = route_work(work_joules, self._get_original_route_indices(len(work_joules)))
+        optimized_joules = route_work(work_joules, opt_route_indices)
+
+        logging.debug("\n--- Energy Analysis (Work Model) ---")
+        logging.debug(f"Original Route Work: {original_joules / JOULES_PER_KJ:.0f} kJ ({joules_to_liters(original_joules):.3f} L diesel)")
+        logging.debug(f"Optimized Route Work: {optimized_joules / JOULES_PER_KJ:.0f} kJ ({joules_to_liters(optimized_joules):.3f} L diesel)")
+        if optimized_joules < original_joules:
+            savings = original_joules - optimized_joules
+            logging.debug(f"Optimization SAVED {savings / JOULES_PER_KJ:.0f} kJ ({savings / original_joules * 100:.2f}%)")
+        return optimized_joules / JOULES_PER_KJ
+
     def _calculate_and_print_costs(self, opt_route_indices, index_to_location_name, distance_matrix_meters, mpg):
         """
         Calculates and compares the distance (km) and fuel cost (gallons)
-        of the original vs. optimized routes.
+        of the original vs. optimized routes. Only logged, so skipped unless DEBUG is enabled.
         """
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
         num_locations = len(index_to_location_name)
         original_route_indices = self._get_original_route_indices(num_locations)
 
@@ -202,15 +936,15 @@ class RouteOptimizer:
         optimized_distance_km = self._get_route_cost_km(opt_route_indices, distance_matrix_meters)
 
         # --- Print Distance Analysis ---
-        logging.info(f"Original Route Distance (Sequential): {original_distance_km:.2f} km")
-        logging.info(f"Optimized Route Distance: {optimized_distance_km:.2f} km")
+        logging.debug(f"Original Route Distance (Sequential): {original_distance_km:.2f} km")
+        logging.debug(f"Optimized Route Distance: {optimized_distance_km:.2f} km")
         
         if optimized_distance_km < original_distance_km:
             savings_km = original_distance_km - optimized_distance_km
             percent_saved_km = (savings_km / original_distance_km) * 100
-            logging.info(f"Optimization SAVED {savings_km:.2f} km ({percent_saved_km:.2f}%)")
+            logging.debug(f"Optimization SAVED {savings_km:.2f} km ({percent_saved_km:.2f}%)")
 
-        logging.info("\n--- Fuel Cost Analysis (Distance / MPG) ---")
+        logging.debug("\n--- Fuel Cost Analysis (Distance / MPG) ---")
         if mpg <= 0:
             logging.warning("MPG value is zero or negative. Skipping fuel cost analysis.")
             return
@@ -219,17 +953,122 @@ class RouteOptimizer:
             # --- Original Route Fuel Cost ---
             original_distance_miles = original_distance_km * MILES_PER_KM
             original_gallons = original_distance_miles / mpg
-            logging.info(f"Original Route Fuel Cost: {original_gallons:.2f} gallons ({original_distance_miles:.2f} miles / {mpg} mpg)")
+            logging.debug(f"Original Route Fuel Cost: {original_gallons:.2f} gallons ({original_distance_miles:.2f} miles / {mpg} mpg)")
 
             # --- Optimized Route Fuel Cost ---
             optimized_distance_miles = optimized_distance_km * MILES_PER_KM
             optimized_gallons = optimized_distance_miles / mpg
-            logging.info(f"Optimized Route Fuel Cost: {optimized_gallons:.2f} gallons ({optimized_distance_miles:.2f} miles / {mpg} mpg)")
+            logging.debug(f"Optimized Route Fuel Cost: {optimized_gallons:.2f} gallons ({optimized_distance_miles:.2f} miles / {mpg} mpg)")
             
             if optimized_gallons < original_gallons:
                 savings_gal = original_gallons - optimized_gallons
                 percent_saved_gal = (savings_gal / original_gallons) * 100
-                logging.info(f"Optimization SAVED {savings_gal:.2f} gallons ({percent_saved_gal:.2f}%)")
+                logging.debug(f"Optimization SAVED {savings_gal:.2f} gallons ({percent_saved_gal:.2f}%)")
             
         except Exception as e:
-            logging.error(f"Error during fuel cost comparison: {e}")
\ No newline at end of file
+            logging.error(f"Error during fuel cost comparison: {e}")
+
+
+_worker_optimizer = None
+
+
+def _solve_portfolio_member(worker_config, data, time_budget_ms, strategy, metaheuristic, deadline=None):
+    """
+    Runs one portfolio configuration inside a worker process.
+    Returns (route_indices, solve_info); the optimizer is built once per worker.
+    A member picked up after the deadline (a time.time()) by which the portfolio
+    stops waiting returns no route at once, and one picked up late only searches
+    for the time left.
+    """
+    global _worker_optimizer
+    if deadline is not None:
+        remaining_ms = (deadline - time.time()) * 1000
+        if remaining_ms <= 0:
+            return [], {"strategy": strategy, "metaheuristic": metaheuristic}
+        if time_budget_ms:
+            time_budget_ms = max(1, min(time_budget_ms, int(remaining_ms)))
+    if _worker_optimizer is None:
+        _worker_optimizer = RouteOptimizer(worker_config)
+    solve_info = {}
+    names = list(range(len(data["cost_matrix"])))
+    route_indices = _worker_optimizer._solve_tsp(
+        data, names, time_budget_ms, solve_info,
+        first_solution_strategy=strategy, metaheuristic=metaheuristic,
+    )
+    return route_indices, solve_info
+
+
+_job_optimizer = None
+
+
+def optimize_route_worker(optimizer_config, api_response, mpg, kwargs, progress=None):
+    """
+    Runs RouteOptimizer.optimize_route inside a solver worker process (see jobs.py).
+    Returns (route_indices, solve_info); the optimizer is built once per process.
+    If a progress queue is given, each improving tour is put on it as
+    {"order": [...], "objective": ..., "elapsedMs": ...}.
+    """
+    global _job_optimizer
+    if _job_optimizer is None:
+        _job_optimizer = RouteOptimizer(optimizer_config)
+    if progress is not None:
+        kwargs = dict(kwargs, on_solution=lambda route, objective, elapsed_ms: progress.put(
+            {"order": route, "objective": objective, "elapsedMs": elapsed_ms}
+        ))
+    solve_info = {}
+    route_indices = _job_optimizer.optimize_route(api_response, mpg, solve_info=solve_info, **kwargs)
+    return route_indices, solve_info
+
+
+class _SolutionReporter:
+    """
+    OR-Tools solution callback that passes each improving single-vehicle tour
+    to on_solution(route_indices, objective, elapsed_ms).
+    """
+
+    def __init__(self, routing, manager, on_solution):
+        self.routing = routing
+        self.manager = manager
+        self.on_solution = on_solution
+        self.best = None
+        self.start = time.perf_counter()
+
+    def __call__(self):
+        objective = self.routing.CostVar().Max()
+        if self.best is not None and objective >= self.best:
+            return
+        self.best = objective
+
+        # Inside the callback the routing variables hold the solution just found
+        index = self.routing.Start(0)
+        route_indices = []
+        while not self.routing.IsEnd(index):
+            route_indices.append(self.manager.IndexToNode(index))
+            index = self.routing.NextVar(index).Value()
+        route_indices.append(self.manager.IndexToNode(index))
+        self.on_solution(route_indices, objective, round((time.perf_counter() - self.start) * 1000, 1))
+
+
+class _StallMonitor:
+    """
+    OR-Tools solution callback that ends the search once the best objective has
+    not improved for stall_seconds. Guided Local Search reports every accepted
+    solution, including worse ones, so this sees a steady stream of calls.
+    """
+
+    def __init__(self, routing, stall_seconds):
+        self.routing = routing
+        self.stall_seconds = stall_seconds
+        self.best = None
+        self.last_improvement = time.perf_counter()
+        self.stopped = False
+
+    def __call__(self):
+        now = time.perf_counter()
+        objective = self.routing.CostVar().Max()
+        if self.best is None or objective < self.best:
+            self.best = objective
+            self.last_improvement = now
+        elif now - self.last_improvement > self.stall_seconds:
+            self.stopped = True
+            self.routing.solver().FinishCurrentSearch()
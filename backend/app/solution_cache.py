@@ -0,0 +1,104 @@
+"""
+Cache of solved tours keyed by a canonical hash of the problem.
+
+The same stop set is often re-submitted in a different order (the morning bus
+runs, for instance). Stops other than the depot are put in a canonical order
+(by rounded coordinates, ties broken by their sorted cost rows), the cost
+matrix is permuted to match and hashed, and the tour is stored in canonical
+indices. A hit is mapped back to the caller's index order, so any input order
+of the same stops returns instantly.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def canonical_order(cost_matrix, locations=None, depot=0, precision=5):
+    """
+    Returns perm, a list where perm[k] is the caller's index of canonical stop k.
+    The depot always stays first.
+    """
+    n = len(cost_matrix)
+    others = [i for i in range(n) if i != depot]
+
+    def sort_key(i):
+        loc = ()
+        if locations is not None and locations[i] is not None:
+            loc = tuple(round(float(x), precision) for x in locations[i])
+        # Sorted rows are invariant to column order, so they break coordinate ties canonically
+        return loc, tuple(np.sort(cost_matrix[i])), tuple(np.sort(cost_matrix[:, i]))
+
+    return [depot] + sorted(others, key=sort_key)
+
+
+def matrix_key(cost_matrix, perm, extra=""):
+    """Hashes the cost matrix permuted into canonical order (plus any extra problem settings)."""
+    canonical = np.ascontiguousarray(np.asarray(cost_matrix)[np.ix_(perm, perm)], dtype=np.int64)
+    digest = hashlib.sha1(canonical.tobytes())
+    digest.update(str(canonical.shape).encode())
+    digest.update(extra.encode())
+    return digest.hexdigest()
+
+
+class SolutionCache:
+
+    def __init__(self, max_entries=256):
+        """Creates an LRU cache of at most max_entries solved tours."""
+        self.max_entries = max_entries
+        # key -> (canonical_route, objective, time_budget_ms, solve_info)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, perm, time_budget_ms):
+        """
+        Returns (route_indices, solve_info) in the caller's index order, or None.
+        A tour found with a smaller time budget than requested does not count as a hit.
+        """
+        with self._lock:
+            entry = self._entries.get(key) if self.max_entries > 0 else None
+            if entry is None or entry[2] < time_budget_ms:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        canonical_route, _, _, solve_info = entry
+        return [perm[k] for k in canonical_route], dict(solve_info)
+
+    def put(self, key, perm, route_indices, objective, time_budget_ms, solve_info):
+        """
+        Stores a tour given in the caller's index order, keeping the better one on a collision.
+        The kept tour is at least as good as either search found, so it counts as
+        found with the larger of the two time budgets.
+        """
+        if self.max_entries <= 0:
+            return
+        position = {orig: k for k, orig in enumerate(perm)}
+        canonical_route = [position[i] for i in route_indices]
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                time_budget_ms = max(time_budget_ms, existing[2])
+            if existing is not None and existing[1] <= objective:
+                canonical_route, objective, solve_info = existing[0], existing[1], existing[3]
+            self._entries[key] = (canonical_route, objective, time_budget_ms, dict(solve_info))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,417 @@
+"""
+Pairwise distance/duration cache in front of the OSRM Table API.
+
+Each (origin, destination) pair is cached under rounded coordinates, so a stop
+list that was partly seen before only needs its missing rows/columns fetched
+from OSRM (via the Table API's sources/destinations parameters). The full
+matrix is then assembled locally and returned in the same shape as an OSRM
+Table response, except that "distances"/"durations" are float NumPy arrays
+(NaN where OSRM reported null) rather than nested lists.
+
+Pairs are stored as one row of NumPy arrays per origin, sorted by destination
+id, so a request's matrix is gathered a row at a time with vectorized lookups
+(no per-pair Python work), and only outside the cache lock: a stored row is
+never modified, just replaced.
+
+Fetches are split into blocks of at most OSRM_TABLE_MAX_SIZE sources by as
+many destinations, each sent with only its own coordinates, and fetched a few
+at a time straight into the preallocated matrix. That keeps a route of any
+size within OSRM's --max-table-size and URL length limits.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config
+from metrics import TABLE_CACHE_PAIRS
+
+
+class PairwiseTableCache:
+
+    def __init__(self, max_entries=None, ttl_seconds=None, precision=None, path=None,
+                 max_table_size=None, concurrency=None):
+        """
+        Creates an LRU + TTL cache of OSRM pair costs.
+        Any argument left as None falls back to the matching TABLE_CACHE_* (or
+        OSRM_TABLE_*) setting in config.py.
+        If a path is given, the cache is loaded from it now and saved back to it at exit.
+        """
+        self.max_entries = max_entries if max_entries is not None else config.TABLE_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.TABLE_CACHE_TTL
+        self.precision = precision if precision is not None else config.TABLE_CACHE_PRECISION
+        self.path = path if path is not None else config.TABLE_CACHE_PATH
+        self.max_table_size = max_table_size if max_table_size is not None else config.OSRM_TABLE_MAX_SIZE
+        self.concurrency = concurrency if concurrency is not None else config.OSRM_TABLE_CONCURRENCY
+
+        # destination_key -> destination id, the column index used in rows
+        self._columns = {}
+        # origin_key -> (destination ids (sorted), distances, durations, expires_at), all arrays
+        self._rows = OrderedDict()
+        # Pairs across all rows
+        self._size = 0
+        # Bumped whenever destination ids are renumbered
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    def key(self, stop):
+        """Returns the (lat, lng) cache key for a stop, rounded to the configured precision."""
+        c = stop["coords"]
+        return (round(float(c["lat"]), self.precision), round(float(c["lng"]), self.precision))
+
+    def __len__(self):
+        return self._size
+
+    def _store_rows(self, updates, generation):
+        """
+        Replaces rows (origin_key -> row) and evicts the least recently used rows past
+        max_entries pairs. Rows built from destination ids of an older generation are dropped.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            for origin, row in updates:
+                old = self._rows.pop(origin, None)
+                self._size += len(row[0]) - (len(old[0]) if old is not None else 0)
+                if len(row[0]):
+                    self._rows[origin] = row
+            while self._size > self.max_entries and self._rows:
+                _, old = self._rows.popitem(last=False)
+                self._size -= len(old[0])
+            # Ids of destinations no longer in any row are dropped once they outnumber the pairs
+            if len(self._columns) > 2 * max(self._size, 1024):
+                self._compact_columns()
+
+    def _compact_columns(self):
+        """Renumbers destination ids to just those still in use (called with the lock held)."""
+        used = np.unique(np.concatenate([row[0] for row in self._rows.values()] or [np.zeros(0, dtype=int)]))
+        keys = list(self._columns)
+        ids = np.fromiter(self._columns.values(), dtype=int, count=len(keys))
+        positions = np.searchsorted(used, ids)
+        kept = positions < len(used)
+        kept[kept] = used[positions[kept]] == ids[kept]
+        self._columns = {keys[k]: int(positions[k]) for k in np.nonzero(kept)[0]}
+        for origin, (cols, distances, durations, expires_at) in self._rows.items():
+            self._rows[origin] = (np.searchsorted(used, cols), distances, durations, expires_at)
+        self._generation += 1
+
+    def table(self, client, stops):
+        """
+        Returns an OSRM-style Table response for the stops, fetching only the pairs
+        missing from the cache through the given OSRMClient (in blocks, up to
+        `concurrency` at a time, if they don't fit in one request).
+        """
+        if self.max_entries <= 0 and len(stops) <= self.max_table_size:
+            return self._as_arrays(client.table(stops))
+
+        lookup = self._lookup(stops)
+        tiles = self._tiles(lookup["plan"])
+
+        def fetch(tile):
+            tile_stops, params = self._tile_request(lookup, *tile)
+            return client.table(tile_stops, **params)
+
+        if len(tiles) > 1 and self.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tiles)),
+                                    thread_name_prefix="osrm-table") as pool:
+                # Blocks come back in order; each is copied in while the next ones are in flight
+                for (sources, destinations), block in zip(tiles, pool.map(fetch, tiles)):
+                    self._fill(lookup, sources, destinations, block)
+        else:
+            for sources, destinations in tiles:
+                self._fill(lookup, sources, destinations, fetch((sources, destinations)))
+        return self._finish(lookup)
+
+    async def table_async(self, client, stops):
+        """
+        Same as table(), for an AsyncOSRMClient: the blocks of missing pairs
+        are fetched concurrently, up to `concurrency` at a time. The cache lookup
+        and update run in a thread, off the event loop.
+        """
+        if self.max_entries <= 0 and len(stops) <= self.max_table_size:
+            return self._as_arrays(await client.table(stops))
+
+        lookup = await asyncio.to_thread(self._lookup, stops)
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def fetch(sources, destinations):
+            tile_stops, params = self._tile_request(lookup, sources, destinations)
+            async with semaphore:
+                block = await client.table(tile_stops, **params)
+            self._fill(lookup, sources, destinations, block)
+
+        await asyncio.gather(*(fetch(sources, destinations) for sources, destinations in self._tiles(lookup["plan"])))
+        return await asyncio.to_thread(self._finish, lookup)
+
+    def _as_arrays(self, table_data):
+        table_data["distances"] = np.array(table_data["distances"], dtype=float)
+        table_data["durations"] = np.array(table_data["durations"], dtype=float)
+        return table_data
+
+    def _lookup(self, stops):
+        """
+        Fills what the cache knows of the unique-stop matrix and plans the fetches
+        for the rest. Returns the working state shared by _fill and _finish.
+        """
+        # Duplicate coordinates share one row/column in the fetched matrix.
+        keys = [self.key(s) for s in stops]
+        unique_keys = list(dict.fromkeys(keys))
+        first_stop = {}
+        for s, k in zip(stops, keys):
+            first_stop.setdefault(k, s)
+        n = len(unique_keys)
+
+        distances = np.zeros((n, n))
+        durations = np.zeros((n, n))
+        missing = np.zeros((n, n), dtype=bool)
+
+        if self.max_entries <= 0:
+            # Cache disabled (here only to split a matrix too big for one request)
+            missing[:] = True
+            np.fill_diagonal(missing, False)
+            num_missing = n * (n - 1)
+        else:
+            # Only the row lookups happen under the lock; the gathers use the (immutable) rows after
+            with self._lock:
+                ids = np.array([self._columns.get(k, -1) for k in unique_keys], dtype=int)
+                rows = [self._rows.get(k) for k in unique_keys]
+                for k, row in zip(unique_keys, rows):
+                    if row is not None:
+                        self._rows.move_to_end(k)
+
+            now = time.time()
+            missing[:] = True
+            for i, row in enumerate(rows):
+                if row is None:
+                    continue
+                cols, row_distances, row_durations, expires_at = row
+                positions = np.minimum(np.searchsorted(cols, ids), len(cols) - 1)
+                found = (cols[positions] == ids) & (expires_at[positions] >= now)
+                distances[i, found] = row_distances[positions[found]]
+                durations[i, found] = row_durations[positions[found]]
+                missing[i] = ~found
+            np.fill_diagonal(missing, False)
+
+            num_missing = int(missing.sum())
+            with self._lock:
+                self.misses += num_missing
+                self.hits += n * (n - 1) - num_missing
+            TABLE_CACHE_PAIRS.inc(n * (n - 1) - num_missing, result="hit")
+            TABLE_CACHE_PAIRS.inc(num_missing, result="miss")
+
+        if num_missing:
+            logging.debug(f"Table cache: {num_missing}/{n * (n - 1)} pairs missing, fetching from OSRM")
+        return {
+            "keys": keys,
+            "unique_keys": unique_keys,
+            "unique_stops": [first_stop[k] for k in unique_keys],
+            "distances": distances,
+            "durations": durations,
+            "missing": missing,
+            "plan": self._plan_fetch(missing) if num_missing else [],
+        }
+
+    def _tiles(self, plan):
+        """Splits the planned fetches into blocks of at most max_table_size sources x max_table_size destinations."""
+        size = max(1, self.max_table_size)
+        return [
+            (sources[a:a + size], destinations[b:b + size])
+            for sources, destinations in plan
+            for a in range(0, len(sources), size)
+            for b in range(0, len(destinations), size)
+        ]
+
+    def _tile_request(self, lookup, sources, destinations):
+        """
+        The stops and sources/destinations arguments (None means every stop) for
+        fetching one block: only the block's own stops go into the request.
+        """
+        indices = list(dict.fromkeys(sources + destinations))
+        position = {i: k for k, i in enumerate(indices)}
+        every = list(range(len(indices)))
+        source_positions = [position[i] for i in sources]
+        destination_positions = [position[i] for i in destinations]
+        return [lookup["unique_stops"][i] for i in indices], {
+            "sources": None if source_positions == every else source_positions,
+            "destinations": None if destination_positions == every else destination_positions,
+        }
+
+    def _fill(self, lookup, sources, destinations, block):
+        """Copies one fetched OSRM block into the working matrices."""
+        rows = np.array(sources)[:, None]
+        cols = np.array(destinations)[None, :]
+        lookup["distances"][rows, cols] = np.array(block["distances"], dtype=float)
+        lookup["durations"][rows, cols] = np.array(block["durations"], dtype=float)
+
+    def _finish(self, lookup):
+        """
+        Caches the fetched pairs and expands the matrix back to the caller's stop order.
+        Unreachable (NaN) pairs aren't cached, since OSRM may only have been missing
+        them for the moment; they're fetched again next time.
+        """
+        unique_keys = lookup["unique_keys"]
+        distances, durations = lookup["distances"], lookup["durations"]
+        if lookup["plan"] and self.max_entries > 0:
+            reachable = lookup["missing"] & ~np.isnan(distances) & ~np.isnan(durations)
+            origins = np.nonzero(reachable.any(axis=1))[0]
+            with self._lock:
+                ids = np.array([self._columns.setdefault(k, len(self._columns)) for k in unique_keys], dtype=int)
+                current = [self._rows.get(unique_keys[i]) for i in origins]
+                generation = self._generation
+
+            # New rows are built outside the lock: each merges the fetched pairs into a copy of the cached row
+            now = time.time()
+            updates = []
+            for i, row in zip(origins, current):
+                fetched = reachable[i]
+                cols = ids[fetched]
+                row_distances = distances[i, fetched]
+                row_durations = durations[i, fetched]
+                expires_at = np.full(len(cols), now + self.ttl_seconds)
+                if row is not None:
+                    kept = ~np.isin(row[0], cols) & (row[3] >= now)
+                    cols = np.concatenate([row[0][kept], cols])
+                    row_distances = np.concatenate([row[1][kept], row_distances])
+                    row_durations = np.concatenate([row[2][kept], row_durations])
+                    expires_at = np.concatenate([row[3][kept], expires_at])
+                order = np.argsort(cols)
+                updates.append((unique_keys[i], (cols[order], row_distances[order], row_durations[order],
+                                                 expires_at[order])))
+            self._store_rows(updates, generation)
+
+        position = {k: i for i, k in enumerate(unique_keys)}
+        keys = lookup["keys"]
+        idx = np.array([position[k] for k in keys])
+        return {
+            "code": "Ok",
+            "sources": [{"location": [k[1], k[0]], "name": ""} for k in keys],
+            "destinations": [{"location": [k[1], k[0]], "name": ""} for k in keys],
+            "distances": distances[np.ix_(idx, idx)],
+            "durations": durations[np.ix_(idx, idx)],
+        }
+
+    def _plan_fetch(self, missing):
+        """
+        Chooses the cheapest set of (sources, destinations) blocks covering every missing pair.
+
+        Candidates are: all rows with a gap x every column, every row x all columns
+        with a gap, or a greedy cover of "new" stops fetched as one row block and
+        one column block (the usual shape when a stop is added to a known route).
+        """
+        n = missing.shape[0]
+        everything = list(range(n))
+        rows = [int(i) for i in np.nonzero(missing.any(axis=1))[0]]
+        cols = [int(j) for j in np.nonzero(missing.any(axis=0))[0]]
+
+        # Greedy vertex cover: repeatedly take the stop touching the most missing pairs,
+        # giving up once the cover alone costs more than fetching whole rows or columns.
+        # Degrees are updated as stops are taken, so a big matrix costs O(n^2), not O(n^3).
+        line_cost = min(len(rows), len(cols)) * n
+        remaining = missing.copy()
+        degree = remaining.sum(axis=0) + remaining.sum(axis=1)
+        cover = []
+        while degree.any() and len(cover) * n < line_cost:
+            i = int(np.argmax(degree))
+            cover.append(i)
+            degree -= remaining[i, :].astype(int) + remaining[:, i]
+            degree[i] = 0
+            remaining[i, :] = False
+            remaining[:, i] = False
+
+        plans = [
+            [(rows, everything)],
+            [(everything, cols)],
+        ]
+        if not degree.any():
+            covered = set(cover)
+            others = [i for i in everything if i not in covered]
+            plans.append([(cover, everything)] + ([(others, cover)] if others else []))
+        # Cost is matrix cells fetched, plus one row's worth per extra round trip.
+        return min(plans, key=lambda plan: sum(len(s) * len(d) for s, d in plan) + n * len(plan))
+
+    def load(self):
+        """Loads unexpired pairs from the cache file, if it exists."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load table cache from {self.path}: {e}")
+            return
+
+        now = time.time()
+        by_origin = {}
+        for a_lat, a_lng, b_lat, b_lng, distance, duration, expires_at in rows:
+            if expires_at >= now:
+                by_origin.setdefault((a_lat, a_lng), []).append(((b_lat, b_lng), distance, duration, expires_at))
+        with self._lock:
+            for pairs in by_origin.values():
+                for destination, *_ in pairs:
+                    self._columns.setdefault(destination, len(self._columns))
+            columns, generation = self._columns, self._generation
+
+        updates = []
+        for origin, pairs in by_origin.items():
+            cols = np.array([columns[destination] for destination, *_ in pairs], dtype=int)
+            order = np.argsort(cols)
+            values = np.array([pair[1:] for pair in pairs], dtype=float).reshape(-1, 3)[order]
+            updates.append((origin, (cols[order], values[:, 0], values[:, 1], values[:, 2])))
+        self._store_rows(updates, generation)
+        logging.info(f"Loaded {len(self)} cached OSRM pairs from {self.path}")
+
+    def save(self):
+        """Writes the cache to its file atomically (write to a temp file, then rename)."""
+        if not self.path:
+            return
+        with self._lock:
+            destinations = {i: k for k, i in self._columns.items()}
+            origins = list(self._rows.items())
+        rows = [
+            [a[0], a[1], b[0], b[1], d, t, e]
+            for a, row in origins
+            for b, d, t, e in zip(map(destinations.get, row[0].tolist()), *(column.tolist() for column in row[1:]))
+        ]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(rows, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save table cache to {self.path}: {e}")
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_table_cache():
+    """
+    Returns the PairwiseTableCache shared by every request in this worker process
+    (a new one after a fork, so a forked worker never inherits the parent's
+    state, or a lock some other thread was holding at the time).
+    """
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = PairwiseTableCache()
+                _cache_pid = pid
+    return _cache
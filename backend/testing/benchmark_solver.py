@@ -0,0 +1,80 @@
+"""
+Benchmark for the OR-Tools solve step.
+Times RoutingModel construction + solve versus stop count, comparing the old
+Python transit callback against the native matrix registration that
+RouteOptimizer now uses. No OSRM server is needed: matrices are built from
+random points around Ithaca, scaled to road-like meters.
+
+Usage:
+    python3 benchmark_solver.py [--sizes 10 25 50 100 200] [--repeats 3]
+"""
+import argparse
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+from ortools.constraint_solver import routing_enums_pb2, pywrapcp
+
+# Degrees -> meters near 42.4 N, and a detour factor so straight lines look like roads
+METERS_PER_DEG_LAT = 111_000
+METERS_PER_DEG_LNG = 82_000
+DETOUR_FACTOR = 1.3
+
+
+def random_cost_matrix(num_stops, seed):
+    """Returns an integer meter matrix for num_stops random points within ~15 km of Ithaca."""
+    rng = np.random.default_rng(seed)
+    lat = 42.44 + rng.uniform(-0.07, 0.07, num_stops)
+    lng = -76.50 + rng.uniform(-0.1, 0.1, num_stops)
+    dy = (lat[:, None] - lat[None, :]) * METERS_PER_DEG_LAT
+    dx = (lng[:, None] - lng[None, :]) * METERS_PER_DEG_LNG
+    return np.rint(np.hypot(dx, dy) * DETOUR_FACTOR).astype(int).tolist()
+
+
+def solve(cost_matrix, use_matrix):
+    """Builds and solves a single-vehicle TSP, returning (seconds, objective)."""
+    start = time.perf_counter()
+    manager = pywrapcp.RoutingIndexManager(len(cost_matrix), 1, 0)
+    routing = pywrapcp.RoutingModel(manager)
+
+    if use_matrix:
+        transit = routing.RegisterTransitMatrix(cost_matrix)
+    else:
+        def distance_callback(from_index, to_index):
+            return cost_matrix[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+        transit = routing.RegisterTransitCallback(distance_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit)
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    )
+    solution = routing.SolveWithParameters(search_parameters)
+    return time.perf_counter() - start, solution.ObjectiveValue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'stops':>6} {'callback (ms)':>14} {'matrix (ms)':>12} {'speedup':>8}")
+    for num_stops in args.sizes:
+        callback_times, matrix_times = [], []
+        for seed in range(args.repeats):
+            cost_matrix = random_cost_matrix(num_stops, seed)
+            t_cb, obj_cb = solve(cost_matrix, use_matrix=False)
+            t_mx, obj_mx = solve(cost_matrix, use_matrix=True)
+            assert obj_cb == obj_mx, "Both registrations must find the same tour"
+            callback_times.append(t_cb)
+            matrix_times.append(t_mx)
+        t_cb = np.median(callback_times) * 1000
+        t_mx = np.median(matrix_times) * 1000
+        print(f"{num_stops:>6} {t_cb:>14.1f} {t_mx:>12.1f} {t_cb / t_mx:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
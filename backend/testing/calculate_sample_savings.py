@@ -1,9 +1,11 @@
-import requests
+import argparse
 import logging
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
 
+from fake_osrm import FakeOSRM
+from osrm_client import OSRMClient
 from route_optimizer import RouteOptimizer
 import config
 
@@ -88,14 +90,9 @@ def get_osrm_matrix(stops, osrm_host):
     """
     Fetches the distance matrix from the OSRM server.
     """
-    coords_list = [f"{s['coords']['lng']},{s['coords']['lat']}" for s in stops]
-    osrm_url = f"{osrm_host}/table/v1/driving/{';'.join(coords_list)}?annotations=distance,duration"
-    
     print(f"Fetching distance matrix from: {osrm_host}...")
     try:
-        response = requests.get(osrm_url, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return OSRMClient(host=osrm_host).table(stops)
     except Exception as e:
         print(f"Error fetching from OSRM: {e}")
         return None
@@ -116,11 +113,18 @@ def print_original_route_breakdown(stops, table_data):
     print(f"Total Original Distance: {total_dist/1000.0:.2f} km\n")
 
 def main():
+    parser = argparse.ArgumentParser(description="Compares the sample route's original and optimized distance and fuel.")
+    parser.add_argument("--fake-osrm", action="store_true",
+                        help="use the in-process fake OSRM server (straight-line distances) instead of OSRM_HOST")
+    args = parser.parse_args()
     stops = get_sample_stops()
     
     # 1. Get Distance Matrix
-    osrm_host = config.OSRM_HOST
-    table_data = get_osrm_matrix(stops, osrm_host)
+    if args.fake_osrm:
+        with FakeOSRM() as osrm:
+            table_data = get_osrm_matrix(stops, osrm.url)
+    else:
+        table_data = get_osrm_matrix(stops, config.OSRM_HOST)
     
     if not table_data:
         return
@@ -0,0 +1,304 @@
+"""
+Lightweight stand-in for an OSRM server, for testing and benchmarking the
+backend without the EC2 box.
+
+Serves the Table and Route APIs the backend uses, with distances from
+straight-line (haversine) or Manhattan (along lng, then lat) geometry times a
+detour factor, and durations at a fixed speed. Route geometry follows the same
+path, in any of the "geojson", "polyline" and "polyline6" formats, with a
+snapped waypoint per stop (so route legs can be split and cached). Artificial
+latency and failures can be injected, and tables bigger than --max-table-size
+are refused with "TooBig", like osrm-routed.
+
+Run it in-process:
+
+    with FakeOSRM(latency_ms=20) as osrm:
+        client = OSRMClient(host=osrm.url)
+
+or as its own process (port 5000 matches the default OSRM_HOST):
+
+    python3 fake_osrm.py [--port 5000] [--metric manhattan] [--latency-ms 20] [--failure-rate 0.05]
+"""
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+
+from geometry import EARTH_RADIUS_M, POLYLINE_PRECISIONS, encode_polyline
+
+METRICS = ("haversine", "manhattan")
+# Road distance / straight-line distance, so distances look like roads
+DETOUR_FACTOR = 1.3
+# Meters per second (~40 km/h), for durations
+SPEED_MPS = 11.0
+# osrm-routed's default --max-table-size
+MAX_TABLE_SIZE = 100
+# Geometry vertices per route leg (including its start)
+POINTS_PER_LEG = 10
+
+
+def distance_matrix(a, b, metric="haversine"):
+    """Meters between every [lat, lng] in a and every [lat, lng] in b (before the detour factor)."""
+    a = np.radians(np.asarray(a, dtype=float).reshape(-1, 2))[:, None, :]
+    b = np.radians(np.asarray(b, dtype=float).reshape(-1, 2))[None, :, :]
+    dlat = b[..., 0] - a[..., 0]
+    dlng = b[..., 1] - a[..., 1]
+    if metric == "manhattan":
+        # Along the parallel at the origin's latitude, then along the meridian
+        return (np.abs(dlng) * np.cos(a[..., 0]) + np.abs(dlat)) * EARTH_RADIUS_M
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[..., 0]) * np.cos(b[..., 0]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class FakeOSRM:
+
+    def __init__(self, host="127.0.0.1", port=0, metric="haversine", detour_factor=DETOUR_FACTOR,
+                 speed_mps=SPEED_MPS, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, failure_status=503,
+                 max_table_size=MAX_TABLE_SIZE, seed=None):
+        """
+        Creates a fake OSRM server (not started yet) on host:port; port 0 picks a free one.
+        Each request waits latency_ms plus up to jitter_ms, then fails with HTTP
+        failure_status (503 by default, which clients retry) with probability failure_rate.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {list(METRICS)}")
+        self.host = host
+        self.port = port
+        self.metric = metric
+        self.detour_factor = detour_factor
+        self.speed_mps = speed_mps
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.max_table_size = max_table_size
+
+        self.request_count = 0
+        self.failure_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Base URL to use as OSRM_HOST."""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """Starts serving on a background thread and returns self."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, body = fake.respond(self.path)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-osrm", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path):
+        """Returns (HTTP status, JSON body) for a request path, after any injected latency or failure."""
+        with self._lock:
+            self.request_count += 1
+            delay_ms = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failure_count += 1
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if failed:
+            return self.failure_status, {"code": "InjectedFailure", "message": "Failure injected by fake OSRM"}
+
+        url = urlsplit(path)
+        parts = url.path.strip("/").split("/")
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if len(parts) != 4 or parts[0] not in ("table", "route"):
+            return 400, {"code": "InvalidUrl", "message": f"URL string malformed close to {url.path}"}
+        try:
+            latlngs = np.array([[float(v) for v in c.split(",")][::-1] for c in parts[3].split(";")])
+        except ValueError:
+            return 400, {"code": "InvalidQuery", "message": "Query string malformed close to the coordinates"}
+        if latlngs.shape[1:] != (2,):
+            return 400, {"code": "InvalidQuery", "message": "Query string malformed close to the coordinates"}
+
+        if parts[0] == "table":
+            return self.table(latlngs, query)
+        return self.route(latlngs, query)
+
+    def table(self, latlngs, query):
+        """Table API: distances/durations (as requested by annotations) from sources to destinations."""
+        try:
+            sources = self._indices(query.get("sources"), len(latlngs))
+            destinations = self._indices(query.get("destinations"), len(latlngs))
+        except (ValueError, IndexError):
+            return 400, {"code": "InvalidOptions", "message": "sources/destinations must be coordinate indices"}
+        if self.max_table_size and len(sources) * len(destinations) > self.max_table_size ** 2:
+            return 400, {"code": "TooBig", "message": "Too many table coordinates"}
+
+        distances = np.round(
+            distance_matrix(latlngs[sources], latlngs[destinations], self.metric) * self.detour_factor, 1
+        )
+        annotations = query.get("annotations", "duration").split(",")
+        body = {
+            "code": "Ok",
+            "sources": [self._waypoint(latlngs[i]) for i in sources],
+            "destinations": [self._waypoint(latlngs[j]) for j in destinations],
+        }
+        if "duration" in annotations:
+            body["durations"] = np.round(distances / self.speed_mps, 1).tolist()
+        if "distance" in annotations:
+            body["distances"] = distances.tolist()
+        return 200, body
+
+    def route(self, latlngs, query):
+        """Route API: one route through the coordinates in order, with per-leg totals and geometry."""
+        if len(latlngs) < 2:
+            return 400, {"code": "InvalidQuery", "message": "Route needs at least two coordinates"}
+        geometries = query.get("geometries", "polyline")
+        if geometries != "geojson" and geometries not in POLYLINE_PRECISIONS:
+            return 400, {"code": "InvalidOptions", "message": f"Unknown geometries: {geometries}"}
+
+        # Snap like OSRM: waypoints (and so the geometry) at 6 decimal places
+        latlngs = np.round(latlngs, 6)
+        leg_distances = np.diagonal(distance_matrix(latlngs[:-1], latlngs[1:], self.metric)) * self.detour_factor
+        legs = [
+            {"distance": round(d, 1), "duration": round(d / self.speed_mps, 1), "weight": round(d / self.speed_mps, 1),
+             "summary": "", "steps": []}
+            for d in leg_distances.tolist()
+        ]
+        distance = round(float(leg_distances.sum()), 1)
+        route = {
+            "distance": distance,
+            "duration": round(distance / self.speed_mps, 1),
+            "weight": round(distance / self.speed_mps, 1),
+            "weight_name": "routability",
+            "legs": legs,
+        }
+        if query.get("overview") != "false":
+            path = self._path(latlngs)
+            if geometries == "geojson":
+                route["geometry"] = {"type": "LineString", "coordinates": path[:, ::-1].tolist()}
+            else:
+                route["geometry"] = encode_polyline(path, POLYLINE_PRECISIONS[geometries])
+        return 200, {"code": "Ok", "routes": [route], "waypoints": [self._waypoint(p) for p in latlngs]}
+
+    def _path(self, latlngs):
+        """[lat, lng] vertices of the route: POINTS_PER_LEG per leg, then the last stop."""
+        starts, ends = latlngs[:-1], latlngs[1:]
+        t = np.arange(POINTS_PER_LEG) / POINTS_PER_LEG
+        if self.metric == "manhattan":
+            # Along lng to the corner, then along lat, matching the distance metric
+            corners = np.column_stack((starts[:, 0], ends[:, 1]))
+            half = POINTS_PER_LEG // 2
+            first = starts[:, None, :] + (corners - starts)[:, None, :] * (t[:half] * 2)[None, :, None]
+            second = corners[:, None, :] + (ends - corners)[:, None, :] * (t[half:] * 2 - 1)[None, :, None]
+            legs = np.concatenate((first, second), axis=1)
+        else:
+            legs = starts[:, None, :] + (ends - starts)[:, None, :] * t[None, :, None]
+        return np.vstack((legs.reshape(-1, 2), latlngs[-1:]))
+
+    def _indices(self, value, n):
+        if value is None or value == "all":
+            return list(range(n))
+        indices = [int(i) for i in value.split(";")]
+        if any(i < 0 or i >= n for i in indices):
+            raise IndexError(value)
+        return indices
+
+    def _waypoint(self, latlng):
+        return {"location": [round(float(latlng[1]), 6), round(float(latlng[0]), 6)], "name": "", "distance": 0.0}
+
+
+def free_port(host="127.0.0.1"):
+    """Returns a TCP port that is free on host right now."""
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_subprocess(port=None, host="127.0.0.1", timeout=10.0, **options):
+    """
+    Launches fake_osrm.py as its own process and waits until it accepts connections.
+    options are FakeOSRM arguments (e.g. latency_ms=20). Returns (Popen, base URL);
+    stop it with terminate().
+    """
+    port = port or free_port(host)
+    args = [sys.executable, os.path.abspath(__file__), "--host", host, "--port", str(port)]
+    for name, value in options.items():
+        args += ["--" + name.replace("_", "-"), str(value)]
+    process = subprocess.Popen(args)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return process, f"http://{host}:{port}"
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"Fake OSRM did not start on {host}:{port}")
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--metric", choices=METRICS, default="haversine")
+    parser.add_argument("--detour-factor", type=float, default=DETOUR_FACTOR)
+    parser.add_argument("--speed-mps", type=float, default=SPEED_MPS)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--max-table-size", type=int, default=MAX_TABLE_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    args = vars(parser.parse_args())
+
+    osrm = FakeOSRM(**args).start()
+    print(f"Fake OSRM listening on {osrm.url} (metric: {osrm.metric}, latency: {osrm.latency_ms} ms, "
+          f"failure rate: {osrm.failure_rate})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        osrm.stop()
+
+
+if __name__ == "__main__":
+    main()
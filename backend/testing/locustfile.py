@@ -1,3 +1,13 @@
+"""
+Locust load test for POST /optimize_route.
+
+To load-test the backend on its own, without a real OSRM server, start the fake
+one and point the backend at it:
+
+    python3 fake_osrm.py --port 5000 --latency-ms 15 --jitter-ms 10
+    cd ../app && OSRM_HOST=http://127.0.0.1:5000 gunicorn -w 4 -b 0.0.0.0:8000 app:app
+    locust -f locustfile.py --host http://127.0.0.1:8000
+"""
 from locust import HttpUser, task, between
 
 class RouteOptimizerUser(HttpUser):
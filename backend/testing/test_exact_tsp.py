@@ -0,0 +1,60 @@
+"""
+Checks the Held-Karp solver (exact_tsp.py) against brute force on small routes.
+
+Run with: python3 -m pytest backend/testing
+"""
+import itertools
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from exact_tsp import MAX_EXACT_STOPS, solve_held_karp
+
+
+def brute_force(cost, depot=0):
+    """Cheapest closed tour from the depot, trying every order of the other stops."""
+    others = [i for i in range(len(cost)) if i != depot]
+    best = np.inf
+    for order in itertools.permutations(others):
+        route = [depot, *order, depot]
+        best = min(best, cost[route[:-1], route[1:]].sum())
+    return best
+
+
+def tour_cost(cost, route):
+    return cost[route[:-1], route[1:]].sum()
+
+
+@pytest.mark.parametrize("n", range(1, 10))
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_matches_brute_force(n, symmetric):
+    rng = np.random.default_rng(n)
+    cost = rng.integers(1, 1000, size=(n, n)).astype(float)
+    if symmetric:
+        cost = np.triu(cost) + np.triu(cost, 1).T
+    np.fill_diagonal(cost, 0)
+
+    route, total = solve_held_karp(cost)
+    assert route[0] == route[-1] == 0
+    assert sorted(route[:-1]) == list(range(n))
+    assert total == pytest.approx(tour_cost(cost, route))
+    assert total == pytest.approx(brute_force(cost))
+
+
+def test_depot_other_than_zero():
+    rng = np.random.default_rng(7)
+    cost = rng.integers(1, 1000, size=(7, 7)).astype(float)
+    np.fill_diagonal(cost, 0)
+
+    route, total = solve_held_karp(cost, depot=3)
+    assert route[0] == route[-1] == 3
+    assert sorted(route[:-1]) == list(range(7))
+    assert total == pytest.approx(brute_force(cost, depot=3))
+
+
+def test_rejects_too_many_stops():
+    with pytest.raises(ValueError):
+        solve_held_karp(np.zeros((MAX_EXACT_STOPS + 1, MAX_EXACT_STOPS + 1)))
@@ -0,0 +1,107 @@
+"""
+Checks the polyline codec, leg split/join and Douglas-Peucker simplification (geometry.py).
+
+Run with: python3 -m pytest backend/testing
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from geometry import (EARTH_RADIUS_M, decode_polyline, encode_polyline, format_route_geometry, join_polylines,
+                      simplify, split_polyline)
+
+# The worked example from Google's encoded polyline algorithm format documentation
+REFERENCE_POINTS = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+REFERENCE_ENCODING = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def random_route(n, seed, precision):
+    """A random walk of n [lat, lng] points around Ithaca, rounded to the precision."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.002, size=(n, 2))
+    return np.round(np.array([42.44, -76.5]) + np.cumsum(steps, axis=0), precision)
+
+
+def test_matches_reference_encoding():
+    assert encode_polyline(REFERENCE_POINTS, 5) == REFERENCE_ENCODING
+    np.testing.assert_allclose(decode_polyline(REFERENCE_ENCODING, 5), REFERENCE_POINTS)
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+@pytest.mark.parametrize("n", [0, 1, 2, 500])
+def test_decode_inverts_encode(precision, n):
+    points = random_route(n, n, precision)
+    np.testing.assert_allclose(decode_polyline(encode_polyline(points, precision), precision), points.reshape(-1, 2),
+                               atol=0.1 / 10 ** precision)
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_extreme_coordinates_round_trip(precision):
+    # Deltas this big need every chunk a value can have
+    points = [[-90, -180], [90, 180], [-89.999999, 179.999999], [0, 0], [0.000001, -0.000001]]
+    points = np.round(points, precision)
+    np.testing.assert_allclose(decode_polyline(encode_polyline(points, precision), precision), points,
+                               atol=0.1 / 10 ** precision)
+
+
+def test_split_then_join_restores_the_route():
+    points = random_route(60, 1, 6)
+    encoded = encode_polyline(points, 6)
+    waypoints = points[[0, 12, 13, 40, 59]]
+
+    legs = split_polyline(encoded, waypoints, 6)
+    assert len(legs) == len(waypoints) - 1
+    for leg, (a, b) in zip(legs, zip(waypoints, waypoints[1:])):
+        leg_points = decode_polyline(leg, 6)
+        np.testing.assert_allclose(leg_points[[0, -1]], [a, b], atol=1e-7)
+    assert join_polylines(legs) == encoded
+
+
+def test_join_bridges_legs_that_do_not_meet():
+    first, second = random_route(5, 2, 6), random_route(5, 3, 6) + 0.01
+    joined = decode_polyline(join_polylines([encode_polyline(first, 6), "", encode_polyline(second, 6)]), 6)
+    np.testing.assert_allclose(joined, np.vstack([first, second]), atol=1e-7)
+
+
+def distances_to_polyline_m(points, line):
+    """Meters from each [lat, lng] point to the nearest segment of a [lat, lng] polyline."""
+    lat0 = np.radians(np.mean(points[:, 0]))
+
+    def project(p):
+        return np.column_stack((np.radians(p[:, 1]) * np.cos(lat0), np.radians(p[:, 0]))) * EARTH_RADIUS_M
+
+    xy, ends = project(points), project(line)
+    a, ab = ends[:-1], ends[1:] - ends[:-1]
+    ap = xy[:, None, :] - a[None]
+    length_sq = np.maximum((ab ** 2).sum(axis=1), 1e-12)
+    t = np.clip((ap * ab).sum(axis=2) / length_sq, 0, 1)
+    return np.hypot(*np.moveaxis(ap - t[..., None] * ab, 2, 0)).min(axis=1)
+
+
+@pytest.mark.parametrize("tolerance_m", [1, 10, 100])
+def test_simplify_stays_within_tolerance(tolerance_m):
+    points = random_route(400, 4, 6)
+    simplified = simplify(points, tolerance_m)
+    assert len(simplified) < len(points)
+    np.testing.assert_array_equal(simplified[[0, -1]], points[[0, -1]])
+    assert distances_to_polyline_m(points, simplified).max() <= tolerance_m + 1e-6
+
+
+def test_simplify_drops_collinear_points_only():
+    line = np.column_stack((np.linspace(42.0, 42.1, 11), np.full(11, -76.5)))
+    np.testing.assert_array_equal(simplify(line, 0.5), line[[0, -1]])
+    np.testing.assert_array_equal(simplify(line, 0), line)
+
+
+def test_format_route_geometry_conversions():
+    points = random_route(50, 5, 6)
+    encoded = encode_polyline(points, 6)
+    assert format_route_geometry(encoded, "polyline6") == encoded
+    np.testing.assert_allclose(format_route_geometry(encoded, "geojson"), points, atol=1e-7)
+    np.testing.assert_allclose(decode_polyline(format_route_geometry(encoded, "polyline"), 5), np.round(points, 5),
+                               atol=1e-6)
+    geojson = {"type": "LineString", "coordinates": points[:, ::-1].tolist()}
+    assert format_route_geometry(geojson, "polyline6") == encoded
@@ -0,0 +1,77 @@
+"""
+Checks the 2-opt/Or-opt local search (local_search.py): tours stay valid and never get worse.
+
+Run with: python3 -m pytest backend/testing
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from exact_tsp import solve_held_karp
+from local_search import cheapest_insertion, nearest_neighbor_tour, solve_local_search
+
+
+def random_cost(n, seed, symmetric=False):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 10_000, size=(n, 2))
+    cost = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    if not symmetric:
+        # Road-like asymmetry: each direction gets its own detour
+        cost *= rng.uniform(1.0, 1.4, size=(n, n))
+    np.fill_diagonal(cost, 0)
+    return cost
+
+
+def tour_cost(cost, route):
+    return cost[route[:-1], route[1:]].sum()
+
+
+def assert_valid_tour(route, n, depot=0):
+    assert route[0] == route[-1] == depot
+    assert sorted(route[:-1]) == list(range(n))
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4, 10, 60, 150])
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_tour_is_valid_and_costed(n, symmetric):
+    cost = random_cost(n, n, symmetric)
+    route, total = solve_local_search(cost)
+    assert_valid_tour(route, n)
+    assert total == pytest.approx(tour_cost(cost, route))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_improves_on_nearest_neighbor(seed):
+    cost = random_cost(80, seed)
+    start = nearest_neighbor_tour(cost) + [0]
+    _, total = solve_local_search(cost)
+    assert total <= tour_cost(cost, start) + 1e-6
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_close_to_optimal_on_small_routes(seed):
+    cost = random_cost(9, seed, symmetric=True)
+    _, optimal = solve_held_karp(cost)
+    _, total = solve_local_search(cost)
+    # 2-opt/Or-opt local optima are rarely more than a few percent off on routes this small
+    assert optimal <= total + 1e-6
+    assert total <= optimal * 1.2
+
+
+def test_depot_and_initial_tour():
+    cost = random_cost(40, 11)
+    partial = [5, 9, 9, 2, 99, -1, 30]
+    route, total = solve_local_search(cost, depot=7, initial_tour=partial)
+    assert_valid_tour(route, 40, depot=7)
+    assert total <= tour_cost(cost, cheapest_insertion(cost, partial, depot=7)) + 1e-6
+
+
+def test_cheapest_insertion_completes_partial_tour():
+    cost = random_cost(12, 3)
+    route = cheapest_insertion(cost, [4, 1, 4, 15])
+    assert_valid_tour(route, 12)
+    # The partial order is kept; missing stops are inserted around it
+    assert route.index(4) < route.index(1)
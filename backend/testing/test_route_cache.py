@@ -0,0 +1,90 @@
+"""
+Checks that routes stitched from cached legs (route_cache.py) match what the
+fake OSRM server returns for the same stops.
+
+Run with: python3 -m pytest backend/testing
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from fake_osrm import FakeOSRM
+from geometry import OSRM_GEOMETRY_FORMAT
+from osrm_client import OSRMClient
+from route_cache import RouteGeometryCache
+
+
+@pytest.fixture(scope="module", params=["haversine", "manhattan"])
+def osrm(request):
+    with FakeOSRM(metric=request.param) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def client(osrm):
+    client = OSRMClient(host=osrm.url)
+    yield client
+    client.close()
+
+
+def random_stops(n, seed):
+    rng = np.random.default_rng(seed)
+    latlngs = np.round(np.array([42.44, -76.5]) + rng.uniform(-0.05, 0.05, size=(n, 2)), 5)
+    return [{"coords": {"lat": lat, "lng": lng}} for lat, lng in latlngs.tolist()]
+
+
+def make_cache():
+    return RouteGeometryCache(max_legs=1000, max_routes=100, ttl_seconds=3600, precision=5)
+
+
+def assert_same_route(cached, direct):
+    cached, direct = cached["routes"][0], direct["routes"][0]
+    assert cached["geometry"] == direct["geometry"]
+    assert cached["distance"] == pytest.approx(direct["distance"], abs=0.1 * len(direct["legs"]))
+    assert cached["duration"] == pytest.approx(direct["duration"], abs=0.1 * len(direct["legs"]))
+    assert [leg["distance"] for leg in cached["legs"]] == [leg["distance"] for leg in direct["legs"]]
+
+
+def test_stitched_legs_equal_a_direct_fetch(osrm, client):
+    cache = make_cache()
+    stops = random_stops(8, 1)
+    cache.route(client, stops)
+
+    # Every leg of these was part of the route above
+    for sequence in (stops[2:6], stops[:2], stops[3:]):
+        before = osrm.request_count
+        stitched = cache.route(client, sequence)
+        assert osrm.request_count == before
+        assert_same_route(stitched, client.route(sequence, geometries=OSRM_GEOMETRY_FORMAT))
+
+
+def test_legs_from_different_routes_are_stitched(osrm, client):
+    cache = make_cache()
+    a, b = random_stops(4, 2), random_stops(4, 3)
+    cache.route(client, a)
+    cache.route(client, [a[-1]] + b)
+
+    sequence = a[1:] + b[:2]
+    before = osrm.request_count
+    stitched = cache.route(client, sequence)
+    assert osrm.request_count == before
+    assert_same_route(stitched, client.route(sequence, geometries=OSRM_GEOMETRY_FORMAT))
+
+
+def test_unknown_legs_are_fetched_and_cached(osrm, client):
+    cache = make_cache()
+    stops = random_stops(6, 4)
+    cache.route(client, stops)
+
+    reordered = [stops[0], stops[3], stops[1], stops[2]]
+    before = osrm.request_count
+    fetched = cache.route(client, reordered)
+    assert osrm.request_count == before + 1
+    assert_same_route(fetched, client.route(reordered, geometries=OSRM_GEOMETRY_FORMAT))
+
+    before = osrm.request_count
+    assert_same_route(cache.route(client, reordered), fetched)
+    assert osrm.request_count == before
@@ -0,0 +1,100 @@
+"""
+Checks solution canonicalisation and the solved-tour cache (solution_cache.py).
+
+Run with: python3 -m pytest backend/testing
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from solution_cache import SolutionCache, canonical_order, matrix_key
+
+
+def random_problem(n, seed):
+    """(integer cost matrix, [lat, lng] per stop) for n random stops."""
+    rng = np.random.default_rng(seed)
+    locations = np.round(np.array([42.44, -76.5]) + rng.uniform(-0.05, 0.05, size=(n, 2)), 5)
+    cost = np.rint(np.linalg.norm(locations[:, None] - locations[None, :], axis=2) * 1e5).astype(np.int64)
+    return cost, locations.tolist()
+
+
+def shuffled(cost, locations, seed, depot=0):
+    """The same problem with every stop but the depot in a random order; returns it and order[new] = old."""
+    rng = np.random.default_rng(seed)
+    others = [i for i in range(len(cost)) if i != depot]
+    order = np.array([depot] + list(rng.permutation(others)))
+    return cost[np.ix_(order, order)], [locations[i] for i in order], order
+
+
+@pytest.mark.parametrize("use_locations", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_permuted_stops_share_a_key(use_locations, seed):
+    cost, locations = random_problem(12, seed)
+    other_cost, other_locations, _ = shuffled(cost, locations, seed + 100)
+    if not use_locations:
+        locations = other_locations = None
+
+    key = matrix_key(cost, canonical_order(cost, locations))
+    assert matrix_key(other_cost, canonical_order(other_cost, other_locations)) == key
+
+
+def test_duplicate_coordinates_are_broken_by_cost_rows():
+    cost, locations = random_problem(8, 1)
+    locations = [[42.44, -76.5]] * len(locations)
+    other_cost, other_locations, _ = shuffled(cost, locations, 2)
+    assert (matrix_key(cost, canonical_order(cost, locations))
+            == matrix_key(other_cost, canonical_order(other_cost, other_locations)))
+
+
+def test_key_depends_on_costs_and_settings():
+    cost, locations = random_problem(10, 3)
+    perm = canonical_order(cost, locations)
+    changed = cost.copy()
+    changed[2, 5] += 1
+    assert matrix_key(changed, perm) != matrix_key(cost, perm)
+    assert matrix_key(cost, perm, "backend=ortools;") != matrix_key(cost, perm, "backend=local_search;")
+
+
+def test_hit_is_mapped_to_the_callers_order():
+    cost, locations = random_problem(10, 4)
+    perm = canonical_order(cost, locations)
+    route = [0, 3, 1, 7, 9, 2, 8, 4, 6, 5, 0]
+    cache = SolutionCache()
+    cache.put(matrix_key(cost, perm), perm, route, 1234, 0, {"backend": "ortools"})
+
+    other_cost, other_locations, order = shuffled(cost, locations, 5)
+    other_perm = canonical_order(other_cost, other_locations)
+    hit_route, solve_info = cache.get(matrix_key(other_cost, other_perm), other_perm, 0)
+    # Same stops in the same sequence, in the second request's indices
+    assert [int(order[i]) for i in hit_route] == route
+    assert solve_info == {"backend": "ortools"}
+
+
+def test_time_budget_and_better_tours():
+    cost, locations = random_problem(6, 6)
+    perm = canonical_order(cost, locations)
+    key = matrix_key(cost, perm)
+    cache = SolutionCache()
+    cache.put(key, perm, [0, 1, 2, 3, 4, 5, 0], 500, 100, {})
+
+    # Found with less search than now requested: not a hit
+    assert cache.get(key, perm, 1000) is None
+    assert cache.get(key, perm, 100)[0] == [0, 1, 2, 3, 4, 5, 0]
+
+    cache.put(key, perm, [0, 5, 4, 3, 2, 1, 0], 600, 1000, {})
+    assert cache.get(key, perm, 1000)[0] == [0, 1, 2, 3, 4, 5, 0]
+    cache.put(key, perm, [0, 2, 1, 3, 4, 5, 0], 400, 0, {})
+    assert cache.get(key, perm, 1000)[0] == [0, 2, 1, 3, 4, 5, 0]
+
+
+def test_lru_eviction():
+    cache = SolutionCache(max_entries=2)
+    perm = [0, 1, 2]
+    for key in ("a", "b", "c"):
+        cache.put(key, perm, [0, 1, 2, 0], 1, 0, {})
+    assert len(cache) == 2
+    assert cache.get("a", perm, 0) is None
+    assert cache.get("c", perm, 0) is not None
@@ -0,0 +1,144 @@
+"""
+Checks the OSRM table cache and its fetch planner (table_cache.py) against direct
+fetches from the fake OSRM server.
+
+Run with: python3 -m pytest backend/testing
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+import numpy as np
+import pytest
+
+from fake_osrm import FakeOSRM
+from osrm_client import OSRMClient
+from table_cache import PairwiseTableCache
+
+# Small enough that most tables in these tests need several blocks
+MAX_TABLE_SIZE = 8
+# Answers the same tables directly (not served, no size limit), to compare against
+REFERENCE = FakeOSRM(max_table_size=0)
+
+
+@pytest.fixture(scope="module")
+def osrm():
+    with FakeOSRM(max_table_size=MAX_TABLE_SIZE) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def client(osrm):
+    client = OSRMClient(host=osrm.url)
+    yield client
+    client.close()
+
+
+def random_stops(n, seed):
+    rng = np.random.default_rng(seed)
+    latlngs = np.round(np.array([42.44, -76.5]) + rng.uniform(-0.05, 0.05, size=(n, 2)), 5)
+    return [{"coords": {"lat": lat, "lng": lng}} for lat, lng in latlngs.tolist()]
+
+
+def direct_table(stops):
+    """The full matrices for the stops in one go, as the fake OSRM computes them."""
+    status, body = REFERENCE.table(
+        np.array([[s["coords"]["lat"], s["coords"]["lng"]] for s in stops]), {"annotations": "duration,distance"}
+    )
+    assert status == 200
+    return np.array(body["distances"]), np.array(body["durations"])
+
+
+def make_cache(**kwargs):
+    return PairwiseTableCache(**dict({"max_entries": 100000, "path": "", "max_table_size": MAX_TABLE_SIZE,
+                                      "concurrency": 2}, **kwargs))
+
+
+def assert_matches_direct(table, stops):
+    distances, durations = direct_table(stops)
+    off_diagonal = ~np.eye(len(stops), dtype=bool)
+    np.testing.assert_allclose(table["distances"][off_diagonal], distances[off_diagonal])
+    np.testing.assert_allclose(table["durations"][off_diagonal], durations[off_diagonal])
+
+
+@pytest.mark.parametrize("n", [2, 5, 8, 9, 30])
+def test_blocked_fetch_matches_direct_fetch(client, n):
+    stops = random_stops(n, n)
+    # Every block has to fit the fake server's --max-table-size, or it answers TooBig
+    assert_matches_direct(make_cache().table(client, stops), stops)
+    assert_matches_direct(make_cache(max_entries=0).table(client, stops), stops)
+
+
+def test_cached_pairs_are_not_fetched_again(osrm, client):
+    cache = make_cache()
+    stops = random_stops(20, 1)
+    cache.table(client, stops)
+
+    before = osrm.request_count
+    table = cache.table(client, list(reversed(stops)))
+    assert osrm.request_count == before
+    assert_matches_direct(table, list(reversed(stops)))
+
+
+def test_new_stops_fetch_only_missing_pairs(osrm, client):
+    cache = make_cache()
+    known, new = random_stops(20, 2), random_stops(3, 3)
+    cache.table(client, known)
+    hits = cache.hits
+
+    stops = known[:10] + new + known[10:]
+    assert_matches_direct(cache.table(client, stops), stops)
+    assert cache.hits - hits == 20 * 19
+
+
+def test_duplicate_stops_share_a_row(client):
+    stops = random_stops(6, 4)
+    stops = stops + stops[:2]
+    table = make_cache().table(client, stops)
+    np.testing.assert_array_equal(table["distances"][6], table["distances"][0])
+    np.testing.assert_array_equal(table["distances"][:, 7], table["distances"][:, 1])
+
+
+def test_eviction_keeps_results_correct(client):
+    cache = make_cache(max_entries=50)
+    for seed in range(5):
+        stops = random_stops(9, 10 + seed)
+        assert_matches_direct(cache.table(client, stops), stops)
+        assert len(cache) <= 50
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_fetch_plan_covers_every_missing_pair(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 40))
+    missing = rng.random((n, n)) < rng.uniform(0.01, 0.5)
+    if seed % 2:
+        # The usual shape: a few new stops in a known route
+        missing[:] = False
+        new = rng.choice(n, size=max(1, n // 10), replace=False)
+        missing[new, :] = True
+        missing[:, new] = True
+    np.fill_diagonal(missing, False)
+
+    plan = make_cache()._plan_fetch(missing)
+    covered = np.zeros_like(missing)
+    for sources, destinations in plan:
+        covered[np.ix_(sources, destinations)] = True
+    assert not (missing & ~covered).any()
+    # Never worse than fetching every row that has a gap
+    rows = missing.any(axis=1).sum()
+    assert sum(len(s) * len(d) for s, d in plan) <= rows * n
+
+
+def test_saved_cache_reloads(osrm, client, tmp_path):
+    path = str(tmp_path / "table_cache.json")
+    stops = random_stops(12, 5)
+    cache = make_cache(path=path)
+    cache.table(client, stops)
+    cache.save()
+
+    reloaded = make_cache(path=path)
+    assert len(reloaded) == len(cache)
+    before = osrm.request_count
+    assert_matches_direct(reloaded.table(client, stops), stops)
+    assert osrm.request_count == before
@@ -1,8 +1,17 @@
 """
 Test script to call the local optimizer service.
+
+Pass --offline to run app.py in-process against the fake OSRM server
+(fake_osrm.py) instead, so neither the Flask server nor OSRM needs to be running.
 """
+import argparse
 import requests
 import json
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../app'))
+
+from fake_osrm import FakeOSRM
 
 
 sample_stops = {"stops" : [
@@ -101,5 +110,27 @@ def test_optimizer():
         print(f"Error: Could not connect to the server at {url}.")
         print("Please make sure your 'app.py' server is running in another terminal.")
 
+def test_optimizer_offline():
+    """
+    Sends the fake data to an in-process app.py backed by the fake OSRM server.
+    """
+    with FakeOSRM() as osrm:
+        # config.py reads OSRM_HOST on import, so point it at the fake server first
+        os.environ["OSRM_HOST"] = osrm.url
+        from app import app
+
+        response = app.test_client().post("/optimize_route", json=sample_stops)
+        if response.status_code == 200:
+            print(f"Success! Server returned optimized route ({osrm.request_count} fake OSRM requests):")
+            print(json.dumps(response.get_json(), indent=2))
+        else:
+            print(f"Error: Server returned status code {response.status_code}")
+            print(f"Response: {response.get_data(as_text=True)}")
+
 if __name__ == "__main__":
-    test_optimizer()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offline", action="store_true", help="use an in-process app.py and fake OSRM")
+    if parser.parse_args().offline:
+        test_optimizer_offline()
+    else:
+        test_optimizer()
\ No newline at end of file